@@ -1,4 +1,4 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
@@ -8,10 +8,12 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
+from app.core.cache import detached_copy, principal_cache
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, engine
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login/access-token")
@@ -20,28 +22,80 @@ def get_db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # expire_on_commit=False: attribute access after commit must not trigger implicit IO
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def decode_token(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, uuid.UUID(token_data.sub))
+
+def ensure_active_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
+def get_token_payload(token: TokenDep) -> TokenPayload:
+    token_data = decode_token(token)
+    if token_data.type != "access" or not token_data.sub:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    return token_data
+
+TokenPayloadDep = Annotated[TokenPayload, Depends(get_token_payload)]
+
+def _cached_principal(token_data: TokenPayload) -> User | None:
+    # A token minted after the cached copy (higher `ver`) means the user changed
+    cached = principal_cache.get(uuid.UUID(token_data.sub))
+    return cached if cached and cached.version >= token_data.ver else None
+
+def get_current_user(session: SessionDep, token_data: TokenPayloadDep) -> User:
+    if cached := _cached_principal(token_data):
+        return ensure_active_user(session.merge(cached, load=False))
+    user = ensure_active_user(session.get(User, uuid.UUID(token_data.sub)))
+    principal_cache.set(user.id, detached_copy(user))
+    return user
+
+async def get_current_user_async(session: AsyncSessionDep, token_data: TokenPayloadDep) -> User:
+    if cached := _cached_principal(token_data):
+        return ensure_active_user(await session.merge(cached, load=False))
+    user = ensure_active_user(await session.get(User, uuid.UUID(token_data.sub)))
+    principal_cache.set(user.id, detached_copy(user))
+    return user
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+
+def require_superuser(token_data: TokenPayloadDep) -> TokenPayload:
+    """Authorize from the access token claims alone, without touching the DB.
+
+    Claims are refreshed with the token, so a revoked superuser keeps access
+    until the access token expires (ACCESS_TOKEN_EXPIRE_MINUTES).
+    """
+    if not token_data.is_superuser:
+        raise HTTPException(
+            status_code=403, detail="The user doesn't have enough privileges"
+        )
+    return token_data
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def get_current_active_superuser(
+    _: Annotated[TokenPayload, Depends(require_superuser)], current_user: CurrentUser
+) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
@@ -49,4 +103,4 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
     return current_user
 
 CurrentSuperUser = Annotated[User, Depends(get_current_active_superuser)]
-SuperuserRequired = Depends(get_current_active_superuser)
+SuperuserRequired = Depends(require_superuser)
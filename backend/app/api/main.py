@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import login, private, users, utils, courses, roles, quizzes, notifications
+from app.api.routes import login, metrics, private, users, utils, courses, roles, quizzes, notifications
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -12,5 +12,8 @@ api_router.include_router(roles.router)
 api_router.include_router(quizzes.router)
 api_router.include_router(notifications.router)
 
+if settings.METRICS_ENABLED:
+    api_router.include_router(metrics.router)
+
 if settings.ENVIRONMENT == "local":
     api_router.include_router(private.router)
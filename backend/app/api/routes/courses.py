@@ -1,18 +1,40 @@
-import shutil
+import csv
+import io
+import logging
+import os
+from contextlib import contextmanager
 from uuid import UUID
-from typing import Any, List
+from typing import Any, Iterator, List, Sequence, TextIO
 import uuid
 
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import func, null
 from sqlalchemy.exc import SQLAlchemyError
-from sqlmodel import Session, delete, or_, select
-from sqlalchemy.orm import Session
-
-from app.api.deps import SessionDep, CurrentUser, CurrentSuperUser, SuperuserRequired
+from sqlmodel import Session, and_, delete, or_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    CurrentSuperUser,
+    CurrentUser,
+    SessionDep,
+    SuperuserRequired,
+    get_db,
+)
+from app.core import delivery, previews, uploads
+from app.core.cache import course_detail_cache
+from app.core.etag import REVALIDATE, cache_headers, conditional_response, etag_matches, make_etag
+from app.core.previews import preview_queue
 from app.models import (
+    BulkEnrolment,
+    BulkEnrolmentReport,
     Course,
     CourseCreate,
+    CourseMaterial,
+    CourseMaterialInfo,
     CourseMaterialPublic,
     CourseMaterialUpdate,
     CoursePublic,
@@ -20,6 +42,14 @@ from app.models import (
     CourseUpdate,
     CourseDetailed,
     CoursesPublic,
+    CourseSearchHit,
+    CourseSummariesPublic,
+    CourseSummary,
+    CourseView,
+    EnrolmentImportReport,
+    MaterialBlob,
+    MaterialPreview,
+    MaterialView,
     Quiz,
     QuizUpdate,
     Role,
@@ -27,46 +57,179 @@ from app.models import (
     UserPublic,
     QuizPublic,
     Message,
+    PreviewStatus,
     CourseUserLink,
     User,
+    UserCourseEffective,
 )
 from app import crud
 from app.core.config import settings
 
 router = APIRouter(prefix="/courses", tags=["courses"])
+logger = logging.getLogger(__name__)
+
+# Everything CourseDetailed renders, in a fixed number of queries whatever the
+# number of courses: the quiz is joined onto the course rows, roles, users and
+# materials are one IN query each. Also required on an AsyncSession, which cannot lazy-load.
+COURSE_DETAIL_OPTIONS = (
+    joinedload(Course.quiz),  # type: ignore[arg-type]
+    selectinload(Course.roles),  # type: ignore[arg-type]
+    selectinload(Course.users),  # type: ignore[arg-type]
+    selectinload(Course.materials),  # type: ignore[arg-type]
+)
 
-#user stuff /me/courses
-@router.get("/me", response_model=List[CourseDetailed])
-def get_user_courses(session: SessionDep, current_user: CurrentUser) -> Any:
-    stmt = (
-        select(Course)
-        .join(CourseUserLink, Course.id == CourseUserLink.course_id, isouter=True)  # type: ignore
-        .join(CourseRoleLink, Course.id == CourseRoleLink.course_id, isouter=True)  # type: ignore
-        .where(
-            or_(
-                CourseUserLink.user_id == current_user.id,  # type: ignore
-                CourseRoleLink.role_id == current_user.role_id,  # type: ignore
-            )
+
+def course_summary_stmt(user_id: UUID | None = None) -> Any:
+    """One row per course with the CourseSummary columns, no relationship loading.
+
+    The quiz id and, for `user_id`, that user's own enrolment status come from
+    outer joins.
+    """
+    stmt = select(
+        Course.id,
+        Course.title,
+        Course.is_active,
+        Course.start_date,
+        Course.end_date,
+        Quiz.id.label("quiz_id"),  # type: ignore[attr-defined]
+        (CourseUserLink.status if user_id else null()).label("status"),  # type: ignore[attr-defined]
+        # not part of CourseSummary, only read for the ETag
+        Course.updated_at,
+        Quiz.version.label("quiz_version"),  # type: ignore[attr-defined]
+        (CourseUserLink.version if user_id else null()).label("enrolment_version"),  # type: ignore[attr-defined]
+    ).outerjoin(Quiz, Quiz.course_id == Course.id)  # type: ignore[arg-type]
+    if user_id:
+        stmt = stmt.outerjoin(
+            CourseUserLink,
+            and_(CourseUserLink.course_id == Course.id, CourseUserLink.user_id == user_id),  # type: ignore[arg-type]
         )
-        .distinct()
+    return stmt
+
+
+# ETags. A summary's comes from the version columns read along with it. The
+# detailed view's covers the course and quiz rows plus roster aggregates; it is
+# computed in SQL (two small queries, no relationship loading) when the client
+# sends If-None-Match, or else from the loaded objects. Both give the same tuple.
+
+def summary_etag(rows: Sequence[Any]) -> str:
+    return make_etag(
+        CourseView.SUMMARY.value,
+        [(r.id, r.updated_at, r.quiz_id, r.quiz_version, r.status, r.enrolment_version) for r in rows],
     )
-    courses = session.exec(stmt).all()
-    
-    return [
-        CourseDetailed(
-            id=course.id,
-            title=course.title,
-            description=course.description,
-            materials=course.materials,  # Ensure this is a list of strings
-            is_active=course.is_active,
-            start_date=course.start_date,
-            end_date=course.end_date,
-            roles=[RolePublic.model_validate(role) for role in course.roles],
-            users=[UserPublic.model_validate(user) for user in course.users],
-            quiz=QuizPublic.model_validate(course.quiz) if course.quiz else None,
+
+
+def detailed_etag(courses: Sequence[Any], rosters: Sequence[Any]) -> str:
+    return make_etag(CourseView.DETAILED.value, [tuple(course) for course in courses], tuple(rosters))
+
+
+def course_versions_stmt(course_ids: Any) -> Any:
+    return (
+        select(Course.id, Course.updated_at, Quiz.id, Quiz.version)
+        .outerjoin(Quiz, Quiz.course_id == Course.id)  # type: ignore[arg-type]
+        .where(Course.id.in_(course_ids))  # type: ignore[union-attr]
+        .order_by(Course.created_at, Course.id)
+    )
+
+
+def roster_versions_stmt(course_ids: Any) -> Any:
+    def users(column: Any) -> Any:
+        return (
+            select(column).select_from(CourseUserLink).join(User, User.id == CourseUserLink.user_id)  # type: ignore[arg-type]
+            .where(CourseUserLink.course_id.in_(course_ids)).scalar_subquery()  # type: ignore[attr-defined]
         )
-        for course in courses
-    ]
+
+    def roles(column: Any) -> Any:
+        return (
+            select(column).select_from(CourseRoleLink).join(Role, Role.id == CourseRoleLink.role_id)  # type: ignore[arg-type]
+            .where(CourseRoleLink.course_id.in_(course_ids)).scalar_subquery()  # type: ignore[attr-defined]
+        )
+
+    return select(
+        users(func.count()), users(func.max(User.updated_at)), roles(func.count()), roles(func.max(Role.version))
+    )
+
+
+def loaded_versions(courses: Sequence[Course]) -> tuple[list[tuple[Any, ...]], tuple[Any, ...]]:
+    """course_versions_stmt and roster_versions_stmt, from courses loaded with COURSE_DETAIL_OPTIONS."""
+    users = [user for course in courses for user in course.users]
+    roles = [role for course in courses for role in course.roles]
+    return (
+        [
+            (course.id, course.updated_at, course.quiz.id if course.quiz else None,
+             course.quiz.version if course.quiz else None)
+            for course in courses
+        ],
+        (
+            len(users), max((user.updated_at for user in users), default=None),
+            len(roles), max((role.version for role in roles), default=None),
+        ),
+    )
+
+
+def course_detailed(course: Course) -> CourseDetailed:
+    return CourseDetailed(
+        id=course.id,
+        title=course.title,
+        description=course.description,
+        materials=[material.stored_name for material in course.materials],
+        is_active=course.is_active,
+        start_date=course.start_date,
+        end_date=course.end_date,
+        roles=[RolePublic.model_validate(role) for role in course.roles],
+        users=[UserPublic.model_validate(user) for user in course.users],
+        quiz=QuizPublic.model_validate(course.quiz) if course.quiz else None,
+    )
+
+
+#user stuff /me/courses
+@router.get("/me", response_model=List[CourseDetailed] | List[CourseSummary])
+async def get_user_courses(
+    request: Request,
+    response: Response,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    view: CourseView = CourseView.DETAILED,
+) -> Any:
+    """Courses assigned to the caller, directly or through their role.
+
+    `view=summary` skips the users/roles rosters, which can be thousands of
+    rows for hospital-wide courses. Supports If-None-Match.
+    """
+    # primary key lookup on user_course_effective (user_id leads)
+    visible = select(UserCourseEffective.course_id).where(UserCourseEffective.user_id == current_user.id)
+    mine = Course.id.in_(visible)  # type: ignore[union-attr]
+    if view == CourseView.SUMMARY:
+        stmt = course_summary_stmt(current_user.id).where(mine).order_by(Course.created_at, Course.id)
+        rows = (await session.exec(stmt)).all()
+        if not_modified := conditional_response(request, response, summary_etag(rows), REVALIDATE):
+            return not_modified
+        return [CourseSummary.model_validate(row._mapping) for row in rows]
+
+    if request.headers.get("if-none-match"):
+        versions = (await session.exec(course_versions_stmt(visible))).all()
+        rosters = (await session.exec(roster_versions_stmt(visible))).one()
+        if not_modified := conditional_response(request, response, detailed_etag(versions, rosters), REVALIDATE):
+            return not_modified
+
+    stmt = select(Course).where(mine).options(*COURSE_DETAIL_OPTIONS).order_by(Course.created_at, Course.id)
+    courses = (await session.exec(stmt)).all()
+    response.headers.update(cache_headers(detailed_etag(*loaded_versions(courses)), REVALIDATE))
+    return [course_detailed(course) for course in courses]
+
+@router.get("/search", response_model=List[CourseSearchHit])
+def search_courses(
+    session: SessionDep,
+    current_user: CurrentUser,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+) -> Any:
+    """
+    Full-text search over course titles and descriptions. Every word must
+    match, as a prefix ("infe contr" finds "Infection control"); results are
+    ranked and highlighted. Learners only see active courses.
+    """
+    return crud.search_courses(session, q, limit=limit, active_only=not current_user.is_superuser)
+
 
 # Helper function to get course by ID
 def get_course_by_id(session: SessionDep, course_id: UUID) -> Course:
@@ -89,35 +252,74 @@ def create_course(
 
 
 # Read Course by ID
-@router.get("/{course_id}", response_model=CourseDetailed)
+@router.get("/{course_id}", response_model=CourseDetailed | CourseSummary)
 def read_course(
-    *, session: SessionDep, course_id: UUID, current_user: CurrentUser
+    *,
+    request: Request,
+    response: Response,
+    session: SessionDep,
+    course_id: UUID,
+    current_user: CurrentUser,
+    view: CourseView = CourseView.DETAILED,
 ) -> Any:
     """
     Retrieve a course by its ID. Accessible by any authenticated user.
+    Supports If-None-Match. The detailed view is served from course_detail_cache
+    when possible, without touching the database.
     """
-    course = get_course_by_id(session, course_id)
-    return CourseDetailed(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        materials=course.materials,  # Include materials
-        is_active=course.is_active,
-        start_date=course.start_date,
-        end_date=course.end_date,
-        roles=[RolePublic.model_validate(role) for role in course.roles],
-        users=[UserPublic.model_validate(user) for user in course.users],
-        quiz=QuizPublic.model_validate(course.quiz) if course.quiz else None,
-    )
+    if view == CourseView.SUMMARY:
+        row = session.exec(course_summary_stmt(current_user.id).where(Course.id == course_id)).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Course not found")
+        if not_modified := conditional_response(request, response, summary_etag([row]), REVALIDATE):
+            return not_modified
+        return CourseSummary.model_validate(row._mapping)
+
+    cached = course_detail_cache.get(course_id)
+    if cached is None:
+        if request.headers.get("if-none-match"):
+            versions = session.exec(course_versions_stmt([course_id])).all()
+            if versions:
+                rosters = session.exec(roster_versions_stmt([course_id])).one()
+                if not_modified := conditional_response(request, response, detailed_etag(versions, rosters), REVALIDATE):
+                    return not_modified
+
+        course = session.exec(
+            select(Course).where(Course.id == course_id).options(*COURSE_DETAIL_OPTIONS)
+        ).first()
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        cached = (detailed_etag(*loaded_versions([course])), course_detailed(course).model_dump_json().encode())
+        course_detail_cache.set(course_id, cached)
+
+    etag, body = cached
+    headers = cache_headers(etag, REVALIDATE)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 # Read All Courses
-@router.get("/", response_model=CoursesPublic, dependencies=[SuperuserRequired])
-def read_courses(session: SessionDep, skip: int = 0, limit: int = 100):
-    """Retrieve all courses with pagination."""
+@router.get("/", response_model=CoursesPublic | CourseSummariesPublic, dependencies=[SuperuserRequired])
+def read_courses(
+    session: SessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    view: CourseView = CourseView.DETAILED,
+):
+    """Retrieve all courses with pagination: skip/limit, or follow `next_cursor`."""
     total = crud.count_courses(session)
-    data = crud.get_courses(session, skip=skip, limit=limit)
-    return CoursesPublic(data=data, count=total)
+    if view == CourseView.SUMMARY:
+        stmt = course_summary_stmt().add_columns(Course.created_at)
+        rows = session.exec(crud.paginate(stmt, Course, skip, limit, cursor)).all()
+        return CourseSummariesPublic(
+            data=[CourseSummary.model_validate(row._mapping) for row in rows],
+            count=total,
+            next_cursor=crud.next_cursor(rows, limit),
+        )
+    data = crud.get_courses(session, skip=skip, limit=limit, cursor=cursor)
+    return CoursesPublic(data=data, count=total, next_cursor=crud.next_cursor(data, limit))
 
 
 # Update Course
@@ -138,30 +340,44 @@ def update_course(
 
 
 # Delete Course
+def delete_course_in_background(course_id: UUID) -> None:
+    # runs after the 202 response was sent, so on a session of its own
+    with contextmanager(get_db)() as session:
+        try:
+            crud.delete_course(session, course_id)
+        except SQLAlchemyError:
+            logger.exception("Background deletion of course %s failed", course_id)
+
+
 @router.delete("/{course_id}", response_model=Message, dependencies=[SuperuserRequired])
-async def delete_course(course_id: uuid.UUID, session: SessionDep):
-    """Delete a course and all its related data."""
-    # Get the course with its relationships loaded
-    db_course = session.get(Course, course_id)
-    if not db_course:
+def delete_course(
+    course_id: uuid.UUID,
+    session: SessionDep,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+) -> Any:
+    """Delete a course and all its related data: quiz, attempts, links and enrolments.
+
+    With `background=true` the deletion runs after a 202 response, for courses
+    with a long attempt history.
+    """
+    if not session.exec(select(Course.id).where(Course.id == course_id)).first():
         raise HTTPException(status_code=404, detail="Course not found")
-    
+    if background:
+        background_tasks.add_task(delete_course_in_background, course_id)
+        response.status_code = 202
+        return Message(message="Course deletion started")
+
     try:
-        # Explicitly delete related quiz if it exists
-        if db_course.quiz:
-            session.delete(db_course.quiz)
-        
-        # Delete the course (this should cascade to other relationships)
-        session.delete(db_course)
-        session.commit()
-        
-        return Message(message="Course deleted successfully")
+        crud.delete_course(session, course_id)
     except SQLAlchemyError as e:
         session.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Database error occurred while deleting course: {str(e)}"
         )
+    return Message(message="Course deleted successfully")
 
 
 # Attach Quiz to Course
@@ -194,6 +410,7 @@ def attach_quiz_to_course(session: Session, db_course: Course, quiz_id: UUID) ->
     session.add(quiz)
     session.commit()
     session.refresh(db_course)
+    course_detail_cache.invalidate(db_course.id)
     
     return db_course
 
@@ -233,7 +450,9 @@ def assign_role_to_course(
     # Create the link
     link = CourseRoleLink(course_id=course_id, role_id=role_id)
     session.add(link)
+    crud.add_role_enrolments(session, course_id, role_id)
     session.commit()
+    course_detail_cache.invalidate(course_id)
 
     return Message(message="Role assigned to course successfully")
 
@@ -251,7 +470,9 @@ def unassign_role_from_course(course_id: UUID, role_id: UUID, session: SessionDe
 
     db_course.roles.remove(db_role)
     session.add(db_course)
+    crud.remove_role_enrolments(session, course_id, role_id)
     session.commit()
+    course_detail_cache.invalidate(course_id)
     session.refresh(db_course)
     return Message(message="Role removed from course successfully")
 
@@ -290,7 +511,9 @@ def assign_user_to_course(
     # Create the link
     link = CourseUserLink(course_id=course_id, user_id=user_id)
     session.add(link)
+    crud.add_direct_enrolment(session, course_id, user_id)
     session.commit()
+    course_detail_cache.invalidate(course_id)
 
     return Message(message="User assigned to course successfully")
 
@@ -308,84 +531,279 @@ def unassign_user_from_course(course_id: UUID, user_id: UUID, session: SessionDe
 
     db_course.users.remove(db_user)
     session.add(db_course)
+    crud.remove_direct_enrolment(session, course_id, user_id)
     session.commit()
+    course_detail_cache.invalidate(course_id)
     session.refresh(db_course)
     return Message(message="User removed from course successfully")
 
+# Bulk enrolment
+@router.post(
+    "/{course_id}/enrolments:bulk", response_model=BulkEnrolmentReport, dependencies=[SuperuserRequired]
+)
+def bulk_enrol(course_id: UUID, enrolment: BulkEnrolment, session: SessionDep) -> Any:
+    """
+    Assign many users and roles to a course in one transaction. Ids that are
+    already assigned or don't exist are reported per id instead of failing the request.
+    """
+    get_course_by_id(session, course_id)
+    return crud.bulk_enrol(session, course_id, enrolment.user_ids, enrolment.role_ids)
+
+
+@router.delete(
+    "/{course_id}/enrolments:bulk", response_model=BulkEnrolmentReport, dependencies=[SuperuserRequired]
+)
+def bulk_unenrol(course_id: UUID, enrolment: BulkEnrolment, session: SessionDep) -> Any:
+    """Remove many users and roles from a course in one transaction."""
+    get_course_by_id(session, course_id)
+    return crud.bulk_unenrol(session, course_id, enrolment.user_ids, enrolment.role_ids)
+
+
+def read_enrolment_rows(text: TextIO) -> Iterator[tuple[int, str, str]]:
+    """(line, employee id, email) per non-blank CSV row, read one row at a time."""
+    reader = csv.reader(text)
+    header = [column.strip().lower() for column in next(reader, [])]
+    if "user_id" not in header and "email" not in header:
+        raise HTTPException(status_code=400, detail="The CSV needs a user_id or an email column")
+    user_id_at = header.index("user_id") if "user_id" in header else None
+    email_at = header.index("email") if "email" in header else None
+
+    def cell(row: list[str], at: int | None) -> str:
+        return row[at].strip() if at is not None and at < len(row) else ""
+
+    for row in reader:
+        if any(value.strip() for value in row):
+            yield reader.line_num, cell(row, user_id_at), cell(row, email_at)
+
+
+@router.post(
+    "/{course_id}/enrolments/import", response_model=EnrolmentImportReport, dependencies=[SuperuserRequired]
+)
+def import_enrolments(course_id: UUID, session: SessionDep, file: UploadFile = File(...)) -> Any:
+    """
+    Assign the users listed in a CSV with a `user_id` (employee id) and/or
+    `email` column. The upload is parsed as a stream; rows that match no user
+    are written to a rejects CSV, downloadable from `rejects_url`.
+    """
+    get_course_by_id(session, course_id)
+    import_id = uuid.uuid4()
+    rejects_path = settings.IMPORT_REJECTS_DIR / f"{course_id}_{import_id}.csv"
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    report = None
+    try:
+        with rejects_path.open("w", newline="") as rejects_file:
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(["line", "user_id", "email", "reason"])
+            report = crud.import_enrolments(
+                session, course_id, read_enrolment_rows(text), lambda *row: rejects.writerow(row)
+            )
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the CSV: {e}")
+    finally:
+        text.detach()  # the upload's file is closed by FastAPI, not by the wrapper
+        if report is None or not report.rejected:
+            rejects_path.unlink(missing_ok=True)
+    if report.rejected:
+        report.rejects_url = f"{settings.API_V1_STR}/courses/{course_id}/enrolments/import/{import_id}/rejects"
+    return report
+
+
+@router.get("/{course_id}/enrolments/import/{import_id}/rejects", dependencies=[SuperuserRequired])
+def download_import_rejects(course_id: UUID, import_id: UUID) -> FileResponse:
+    rejects_path = settings.IMPORT_REJECTS_DIR / f"{course_id}_{import_id}.csv"
+    if not rejects_path.exists():
+        raise HTTPException(status_code=404, detail="Import rejects not found")
+    return FileResponse(rejects_path, media_type="text/csv", filename=f"rejects-{import_id}.csv")
+
 # ================================
 # FILE UPLOADS & MATERIALS
 # ================================
 
 @router.post("/{course_id}/materials/", response_model=CoursePublic, dependencies=[SuperuserRequired])
-def upload_materials(course_id: uuid.UUID, session: SessionDep, files: List[UploadFile] = File(...)):
-    """Upload multiple files and attach them to a course."""
-    db_course = session.get(Course, course_id)
+async def upload_materials(course_id: uuid.UUID, session: AsyncSessionDep, files: List[UploadFile] = File(...)):
+    """Upload multiple files and attach them to a course.
+
+    Files are streamed into UPLOAD_DIR off the event loop, within
+    UPLOAD_MAX_FILE_BYTES per file and UPLOAD_MAX_COURSE_BYTES per course (413).
+    PDF previews are rendered afterwards, see read_material_preview.
+    """
+    stmt = select(Course).where(Course.id == course_id).options(selectinload(Course.quiz))  # type: ignore[arg-type]
+    db_course = (await session.exec(stmt)).first()
     if not db_course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    for file in files:
-        new_file_path = settings.UPLOAD_DIR / f"{uuid.uuid4().hex}_{file.filename}"
-        with new_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        db_course.materials.append(new_file_path.name)
-
-    session.commit()
-    session.refresh(db_course)
+    used = await session.run_sync(crud.course_material_bytes, course_id)
+    stored = await uploads.store_uploads(course_id, used, files)
+    try:
+        await session.run_sync(crud.add_course_materials, course_id, stored)
+        await session.commit()
+    except BaseException:
+        uploads.discard(stored)
+        raise
+    await run_in_threadpool(uploads.publish, stored)
+    preview_queue.schedule_uploads(stored)
+    course_detail_cache.invalidate(course_id)
     return db_course
 
 @router.put("/{course_id}/materials/", response_model=CourseMaterialPublic)
-def update_materials(course_id: uuid.UUID,
-    session: SessionDep,
-    materials_update: CourseMaterialUpdate,  
+async def update_materials(course_id: uuid.UUID,
+    session: AsyncSessionDep,
+    materials_update: CourseMaterialUpdate,
     files: List[UploadFile] = File([])
 ):
-    db_course = session.get(Course, course_id)
+    db_course = await session.get(Course, course_id)
     if not db_course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    # Remove
-    for filename in materials_update.remove_files:
-        if filename not in db_course.materials:
-            raise HTTPException(status_code=400, detail=f"Material '{filename}' not found")
-        file_path = settings.UPLOAD_DIR / filename
-        if file_path.exists():
-            file_path.unlink()
-        db_course.materials.remove(filename)
-
-    # Upload
-    for file in files:
-        new_file_path = settings.UPLOAD_DIR / f"{uuid.uuid4().hex}_{file.filename}"
-        with new_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        db_course.materials.append(new_file_path.name)
-
-    session.commit()
-    session.refresh(db_course)
-    
-    return CourseMaterialPublic(course_id=course_id, materials=db_course.materials)
+    remove = materials_update.remove_files
+    if remove:
+        attached = set((await session.exec(
+            select(CourseMaterial.stored_name).where(
+                CourseMaterial.course_id == course_id, CourseMaterial.stored_name.in_(remove)  # type: ignore[attr-defined]
+            )
+        )).all())
+        for filename in remove:
+            if filename not in attached:
+                raise HTTPException(status_code=400, detail=f"Material '{filename}' not found")
 
-@router.get("/{course_id}/materials/", response_model=List[str])
-def list_materials(course_id: uuid.UUID, session: SessionDep):
-    """List all materials for a course."""
-    db_course = session.get(Course, course_id)
-    if not db_course:
+    used = await session.run_sync(crud.course_material_bytes, course_id, remove)
+    stored = await uploads.store_uploads(course_id, used, files)
+    try:
+        removed = await session.run_sync(crud.remove_course_materials, course_id, remove)
+        await session.run_sync(crud.add_course_materials, course_id, stored)
+        await session.commit()
+    except BaseException:
+        uploads.discard(stored)
+        raise
+    await run_in_threadpool(uploads.publish, stored)
+    preview_queue.schedule_uploads(stored)
+    # only once the course no longer lists them
+    await session.run_sync(crud.collect_blobs, removed)
+    course_detail_cache.invalidate(course_id)
+
+    materials = await session.run_sync(crud.get_course_materials, course_id)
+    return CourseMaterialPublic(course_id=course_id, materials=[material.stored_name for material in materials])
+
+@router.get("/{course_id}/materials/", response_model=List[str] | List[CourseMaterialInfo])
+def list_materials(course_id: uuid.UUID, session: SessionDep, view: MaterialView = MaterialView.NAMES):
+    """List a course's materials in order: their names, or with `view=detailed`
+    their size, type, checksum and upload time. One query either way."""
+    stmt = (
+        select(Course.id, CourseMaterial)
+        .outerjoin(CourseMaterial, CourseMaterial.course_id == Course.id)  # type: ignore[arg-type]
+        .where(Course.id == course_id)
+        .order_by(CourseMaterial.position, CourseMaterial.created_at)  # type: ignore[arg-type]
+    )
+    rows = session.exec(stmt).all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Course not found")
-    return db_course.materials  # Ensure this is a list of strings
+    materials = [material for _, material in rows if material]
+    if view == MaterialView.DETAILED:
+        return [CourseMaterialInfo.model_validate(material) for material in materials]
+    return [material.stored_name for material in materials]
 
 
+@router.get("/materials/{filename}")
+def download_material(filename: str, request: Request, session: SessionDep) -> Any:
+    """Download or view a material, or byte ranges of it for seeking (Range, If-Range).
 
+    Blob names carry the content hash, which is also the ETag; either way the
+    name never changes content, so clients may cache it for good.
+    """
+    sha256 = uploads.blob_sha(filename)
+    if sha256 and etag_matches(request.headers.get("if-none-match"), f'"{sha256}"'):
+        return Response(status_code=304, headers={"ETag": f'"{sha256}"', "Cache-Control": delivery.IMMUTABLE})
+    try:
+        file = uploads.material_path(filename).open("rb")
+    except (FileNotFoundError, IsADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+    stat = os.fstat(file.fileno())
+    if sha256:
+        etag = f'"{sha256}"'
+        mime = session.exec(select(MaterialBlob.mime).where(MaterialBlob.sha256 == sha256)).first()
+    else:
+        etag = make_etag(filename, stat.st_size, stat.st_mtime_ns)
+        mime = None
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            file.close()
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": delivery.IMMUTABLE})
+    headers = {
+        "ETag": etag,
+        "Cache-Control": delivery.IMMUTABLE,
+        "Content-Disposition": delivery.content_disposition(uploads.display_name(filename)),
+        "X-Content-Type-Options": "nosniff",
+    }
+    try:
+        ranges = (
+            delivery.parse_range(request.headers.get("range"), stat.st_size)
+            if delivery.if_range_matches(request, etag) else None
+        )
+    except delivery.RangeNotSatisfiable:
+        file.close()
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{stat.st_size}"}
+        )
+    mime = mime or uploads.sniff_file(uploads.material_path(filename), filename)
+    return delivery.FileRangeResponse(file, stat.st_size, mime, ranges, headers)
 
-@router.get("/materials/{filename}")
-def download_material(filename: str) -> Any:
-    """Download or view a material."""
-    file_path = settings.UPLOAD_DIR / filename
-    if not file_path.exists():
+@router.get(
+    "/materials/{filename}/preview",
+    response_model=MaterialPreview,
+    responses={202: {"model": MaterialPreview, "description": "Still rendering, retry later"}},
+)
+def read_material_preview(filename: str, request: Request, session: SessionDep) -> Any:
+    """First-page thumbnail, page count and text length of a PDF material.
+
+    Rendered in the background after upload: 202 with Retry-After until ready.
+    A finished preview never changes, so it is cached like the material.
+    """
+    sha256 = uploads.blob_sha(filename)
+    if not sha256 or not uploads.blob_path(sha256).is_file():
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type="application/pdf", filename=filename)
+    etag = f'"{sha256}-preview"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": delivery.IMMUTABLE})
+    info = previews.read(sha256)
+    if info is None:
+        mime = session.exec(select(MaterialBlob.mime).where(MaterialBlob.sha256 == sha256)).first()
+        if mime != previews.PREVIEW_MIME:
+            raise HTTPException(status_code=404, detail="No preview for this type of material")
+        # uploaded before previews, or the job was dropped
+        preview_queue.schedule(sha256)
+        return JSONResponse(
+            MaterialPreview(status=PreviewStatus.PENDING).model_dump(mode="json"),
+            status_code=202,
+            headers={"Retry-After": "2", "Cache-Control": "no-store"},
+        )
+    if "error" in info:
+        preview = MaterialPreview(status=PreviewStatus.FAILED)
+    else:
+        preview = MaterialPreview(
+            status=PreviewStatus.READY,
+            pages=info["pages"],
+            text_length=info["text_length"],
+            thumbnail_url=str(request.url_for("read_material_thumbnail", filename=filename)),
+            thumbnail_width=info["width"],
+            thumbnail_height=info["height"],
+        )
+    return JSONResponse(
+        preview.model_dump(mode="json"), headers={"ETag": etag, "Cache-Control": delivery.IMMUTABLE}
+    )
+
+@router.get("/materials/{filename}/preview/thumbnail", response_class=FileResponse)
+def read_material_thumbnail(filename: str) -> Any:
+    sha256 = uploads.blob_sha(filename)
+    path = previews.thumbnail_path(sha256) if sha256 else None
+    if not path or not path.is_file():
+        raise HTTPException(status_code=404, detail="No thumbnail for this material")
+    return FileResponse(
+        path, media_type="image/jpeg", headers={"ETag": f'"{sha256}-thumbnail"', "Cache-Control": delivery.IMMUTABLE}
+    )
+
 @router.get("/materials/url/{filename}")
 def get_material_url(filename: str, request: Request):
     """Return the URL of the PDF file."""
-    file_path = settings.UPLOAD_DIR / filename
+    file_path = uploads.material_path(filename)
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
@@ -400,15 +818,9 @@ def delete_material(session: SessionDep, course_id: uuid.UUID, filename: str) ->
     db_course = session.get(Course, course_id)
     if not db_course:
         raise HTTPException(status_code=404, detail="Course not found")
-    if filename not in db_course.materials:
+    if not crud.remove_course_materials(session, course_id, [filename]):
         raise HTTPException(status_code=404, detail="Material not found in this course")
-    
-    db_course.materials.remove(filename)
-    session.add(db_course)
     session.commit()
-    session.refresh(db_course)
-
-    file_path = settings.UPLOAD_DIR / filename
-    if file_path.exists():
-        file_path.unlink()
+    course_detail_cache.invalidate(course_id)
+    crud.collect_blobs(session, [filename])
     return Message(message="Course material deleted sucessfuly.")
\ No newline at end of file
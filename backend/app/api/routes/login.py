@@ -1,3 +1,4 @@
+import uuid
 from datetime import timedelta
 from typing import Annotated, Any
 
@@ -6,11 +7,19 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    SessionDep,
+    SuperuserRequired,
+    decode_token,
+)
 from app.core import security
+from app.core.cache import principal_cache
 from app.core.config import settings
+from app.core.metrics import logins_failed, logins_succeeded
 from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.models import Message, NewPassword, Token, TokenRefresh, User, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -21,26 +30,65 @@ from app.utils import (
 router = APIRouter(tags=["login"])
 
 
+def issue_tokens(user: User) -> Token:
+    """Short-lived access token with the authorization claims, plus a refresh token.
+    Both carry the user's version: once a password, role or superuser change bumps
+    it, the refresh token no longer mints new pairs."""
+    claims = {
+        "is_superuser": user.is_superuser,
+        "role_id": str(user.role_id) if user.role_id else None,
+        "ver": user.version,
+    }
+    return Token(
+        access_token=security.create_access_token(
+            user.id,
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+            claims=claims,
+        ),
+        refresh_token=security.create_refresh_token(
+            user.id,
+            expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+            claims={"ver": user.version},
+        ),
+    )
+
+
 @router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+async def login_access_token(
+    session: AsyncSessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate_user(
+    user = await crud.authenticate_user_async(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
+        logins_failed.inc()
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
+        logins_failed.inc()
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
-    )
+    logins_succeeded.inc()
+    return issue_tokens(user)
+
+
+@router.post("/login/refresh-token")
+async def refresh_access_token(session: AsyncSessionDep, body: TokenRefresh) -> Token:
+    """
+    Exchange a refresh token for a new token pair carrying the current claims
+    """
+    token_data = decode_token(body.refresh_token)
+    if token_data.type != "refresh" or not token_data.sub:
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    user = await session.get(User, uuid.UUID(token_data.sub))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    elif not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    elif token_data.ver != user.version:
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    return issue_tokens(user)
 
 
 @router.post("/login/test-token", response_model=UserPublic)
@@ -93,14 +141,16 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         raise HTTPException(status_code=400, detail="Inactive user")
     hashed_password = get_password_hash(password=body.new_password)
     user.hashed_password = hashed_password
+    user.version = User.version + 1
     session.add(user)
     session.commit()
+    principal_cache.invalidate(user.id)
     return Message(message="Password updated successfully")
 
 
 @router.post(
     "/password-recovery-html-content/{email}",
-    dependencies=[Depends(get_current_active_superuser)],
+    dependencies=[SuperuserRequired],
     response_class=HTMLResponse,
 )
 def recover_password_html_content(email: str, session: SessionDep) -> Any:
@@ -5,7 +5,7 @@ from typing import List
 from sqlmodel import Session
 from app import crud
 from app.models import Notification, NotificationCreate, NotificationPublic
-from app.api.deps import SessionDep, CurrentUser, SuperuserRequired
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep, SessionDep, CurrentUser, SuperuserRequired
 
 router = APIRouter(prefix="", tags=["notifications"])
 
@@ -18,11 +18,11 @@ def create_notification_endpoint(
     return crud.create_notification(db, notification)
     
 @router.get("/", response_model=List[NotificationPublic])
-def get_notifications_endpoint(
-    db: SessionDep,
-    current_user: CurrentUser,
+async def get_notifications_endpoint(
+    db: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
 ):
-    return crud.get_notifications(db, current_user.id)
+    return await crud.get_notifications_async(db, current_user.id)
 
 @router.put("/{notification_id}/read", response_model=NotificationPublic)
 def mark_notification_as_read_endpoint(
@@ -1,8 +1,9 @@
 from statistics import mean
 from typing import Dict, List, Any
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import and_, distinct, func, select
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import distinct, select
+from sqlalchemy.orm import aliased
 import logging
 
 from sqlmodel import Session
@@ -10,7 +11,10 @@ from sqlmodel import Session
 from app import crud
 from app.models import NotificationCreate
 
-from app.api.deps import SessionDep, CurrentUser, CurrentSuperUser
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep, SessionDep, CurrentUser, CurrentSuperUser
+from app.core.cache import course_detail_cache
+from app.core.etag import REVALIDATE, conditional_response, make_etag
+from app.core.metrics import quiz_attempts_failed, quiz_attempts_passed
 from app.models import (
     Course, Quiz, QuizCreate, QuizPublic, QuizUpdate,
     QuizAttempt, QuizAttemptCreate, QuizAttemptPublic, QuizzesPublic,
@@ -21,6 +25,11 @@ from app import crud
 router = APIRouter(prefix="/quizzes", tags=["quizzes"])
 logger = logging.getLogger(__name__)
 
+def set_next_cursor(response: Response, cursor: str | None) -> None:
+    # For the endpoints returning bare lists, where there is no envelope to carry it
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
 @router.post("/", response_model=QuizPublic)
 def create_quiz(
     *,
@@ -44,24 +53,29 @@ def read_quizzes(
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> Any:
     """Get all quizzes with pagination."""
-    data = crud.get_quizzes(session=session, skip=skip, limit=limit)
+    data = crud.get_quizzes(session=session, skip=skip, limit=limit, cursor=cursor)
     count = crud.count_quizzes(session=session)
-    return QuizzesPublic(data=data, count=count)
+    return QuizzesPublic(data=data, count=count, next_cursor=crud.next_cursor(data, limit))
 
 @router.get("/{quiz_id}", response_model=QuizPublic)
 def read_quiz(
     *,
+    request: Request,
+    response: Response,
     session: SessionDep,
     quiz_id: UUID,
     current_user: CurrentUser,
 ) -> Any:
-    """Get quiz details."""
-    quiz = crud.get_quiz_by_id(session=session, quiz_id=quiz_id)
-    if not quiz:
+    """Get quiz details. Supports If-None-Match, checked before loading the questions."""
+    version = session.exec(select(Quiz.version).where(Quiz.id == quiz_id)).first()
+    if version is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    return quiz
+    if not_modified := conditional_response(request, response, make_etag(quiz_id, version[0]), REVALIDATE):
+        return not_modified
+    return crud.get_quiz_by_id(session=session, quiz_id=quiz_id)
 
 @router.patch("/{quiz_id}", response_model=QuizPublic)
 def update_quiz(
@@ -75,8 +89,10 @@ def update_quiz(
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
+    course_ids = {quiz.course_id}
     if quiz_update.course_id is not None:
         quiz.course_id = quiz_update.course_id
+        course_ids.add(quiz.course_id)
     
     if quiz_update.questions is not None:
         # Convert QuizQuestion objects to dictionaries
@@ -95,7 +111,10 @@ def update_quiz(
     if quiz_update.passing_threshold is not None:
         quiz.passing_threshold = quiz_update.passing_threshold
     
+    quiz.version += 1
     session.commit()
+    for course_id in course_ids:
+        course_detail_cache.invalidate(course_id)
     session.refresh(quiz)
     return quiz
 
@@ -115,61 +134,62 @@ def delete_quiz(
     return Message(message="Quiz deleted successfully")
 
 @router.post("/{quiz_id}/attempt", response_model=QuizAttemptPublic)
-def submit_quiz_attempt(
+async def submit_quiz_attempt(
     *,
-    session: SessionDep,
+    session: AsyncSessionDep,
     quiz_id: UUID,
     answers: List[int],
-    current_user: CurrentUser,
+    current_user: AsyncCurrentUser,
 ) -> Any:
     """Submit a quiz attempt."""
     logger.info(f"Received quiz attempt for quiz_id: {quiz_id}, answers: {answers}")
 
     # Fetch the quiz from the database
-    quiz = crud.get_quiz_by_id(session=session, quiz_id=quiz_id)
+    quiz = await session.get(Quiz, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Calculate the quiz result
-    quiz_attempt = crud.create_quiz_attempt(
+    quiz_attempt = await crud.create_quiz_attempt_async(
         session=session,
         quiz=quiz,
         user=current_user,
         answers=answers
     )
 
+    (quiz_attempts_passed if quiz_attempt.passed else quiz_attempts_failed).inc()
     logger.info(f"Quiz attempt result: {quiz_attempt}")
 
-    # Fetch additional data required for the response
-    user = session.get(User, current_user.id)
-    course = session.get(Course, quiz.course_id)
+    # current_user already lives in this session, only the course is missing
+    course = await session.get(Course, quiz.course_id)
 
-    if not user or not course:
+    if not course:
         raise HTTPException(status_code=404, detail="User or course not found")
 
     # Enrich the response with required fields
     enriched_attempt = {
-        **quiz_attempt.__dict__,  # Include all fields from the QuizAttempt object
-        "user_name": user.name,
-        "user_email": user.email,
+        **quiz_attempt.model_dump(),
+        "user_name": current_user.name,
+        "user_email": current_user.email,
         "course_name": course.title,
     }
 
     # Check if the user failed the quiz and if it's their max attempts
     if not quiz_attempt.passed:
-        # Fetch all failed attempts for this user and quiz
-        user_attempts = session.query(QuizAttempt).filter(
-            QuizAttempt.user_id == current_user.id,
-            QuizAttempt.quiz_id == quiz_id,
-            QuizAttempt.passed == False,  # Only count failed attempts
-        ).all()
+        # Count failed attempts for this user and quiz
+        failed_attempts = await crud.count_quiz_attempts_async(
+            session=session,
+            quiz_id=quiz_id,
+            user_id=current_user.id,
+            passed=False,
+        )
 
         # Use the max_attempts value from the quiz
         max_attempts = quiz.max_attempts
 
         # If the user has reached the max number of failed attempts, notify superusers
-        if len(user_attempts) >= max_attempts:
-            crud.create_notifications_for_superusers(
+        if failed_attempts >= max_attempts:
+            await crud.create_notifications_for_superusers_async(
                 session,
                 message=f"Employee {current_user.name} failed the quiz {max_attempts} times."
             )
@@ -182,21 +202,29 @@ def get_quiz_attempts(
     session: SessionDep,
     quiz_id: UUID,
     current_user: CurrentUser,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> Any:
-    """Get all attempts for a quiz by the current user."""
+    """Get all attempts for a quiz by the current user.
+
+    The response stays a plain list; the next page's cursor is in X-Next-Cursor.
+    """
     quiz = crud.get_quiz_by_id(session=session, quiz_id=quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    return crud.get_quiz_attempts(
+    attempts = crud.get_quiz_attempts(
         session=session,
         quiz_id=quiz_id,
         user_id=current_user.id,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
     )
+    set_next_cursor(response, crud.next_cursor(attempts, limit))
+    return attempts
 
 @router.get("/{quiz_id}/stats", response_model=dict)
 def get_quiz_stats(
@@ -268,22 +296,21 @@ def get_all_quiz_attempts(
     *,
     session: SessionDep,
     admin_user: CurrentSuperUser,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> Any:
-    """Get all quiz attempts across all quizzes (admin only)"""
-    # First, get all attempts but order by score desc to get successful attempts first
-    subquery = (
-        select(
-            QuizAttempt.quiz_id,
-            QuizAttempt.user_id,
-            func.max(QuizAttempt.score).label('max_score'),
-            func.max(QuizAttempt.created_at).label('latest_attempt')
-        )
-        .group_by(QuizAttempt.quiz_id, QuizAttempt.user_id)
-        .subquery()
-    )
-
+    """Get all quiz attempts across all quizzes (admin only), newest first.
+    The next page's cursor is in X-Next-Cursor."""
+    # Each user's best attempt per quiz, listed only when it is also their latest:
+    # no attempt of theirs at that quiz scored higher or came later. Correlated
+    # NOT EXISTS, one index seek each, so the (created_at, id) cursor walks the
+    # table's index page by page instead of grouping the whole table.
+    other = aliased(QuizAttempt)
+    same_user_and_quiz = (other.quiz_id == QuizAttempt.quiz_id, other.user_id == QuizAttempt.user_id)
+    better = select(other.id).where(*same_user_and_quiz, other.score > QuizAttempt.score)
+    later = select(other.id).where(*same_user_and_quiz, other.created_at > QuizAttempt.created_at)
     stmt = (
         select(
             QuizAttempt.id,
@@ -298,21 +325,15 @@ def get_all_quiz_attempts(
             Course.title.label("course_name"),
             Course.is_active.label("course_is_active")
         )
-        .join(subquery, and_(
-            QuizAttempt.quiz_id == subquery.c.quiz_id,
-            QuizAttempt.user_id == subquery.c.user_id,
-            QuizAttempt.score == subquery.c.max_score,
-            QuizAttempt.created_at == subquery.c.latest_attempt
-        ))
+        .where(~better.exists(), ~later.exists())
         .join(User, QuizAttempt.user_id == User.id)
         .join(Quiz, QuizAttempt.quiz_id == Quiz.id)
         .join(Course, Quiz.course_id == Course.id)
-        .order_by(QuizAttempt.created_at.desc())
-        .offset(skip)
-        .limit(limit)
     )
+    stmt = crud.paginate(stmt, QuizAttempt, skip, limit, cursor, descending=True)
     
     results = session.exec(stmt).all()
+    set_next_cursor(response, crud.next_cursor(results, limit))
     
     return [{
         "id": attempt.id,
@@ -1,15 +1,18 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy import func
 from sqlmodel import select
 from typing import Annotated, Any
-from app.api.deps import SessionDep, get_current_active_superuser
+from app import crud
+from app.api.deps import SessionDep, SuperuserRequired
+from app.core.cache import course_detail_cache
+from app.core.etag import SHORT_LIVED, conditional_response, make_etag
 from app.models import (
     Course, CoursesPublic, Message, Role, RoleCreate, RolePublic, RoleUpdate, 
     RolesPublic, User, UsersPublic, CourseRoleLink
 )
 
-router = APIRouter(prefix="/roles", tags=["roles"], dependencies=[Depends(get_current_active_superuser)])
+router = APIRouter(prefix="/roles", tags=["roles"], dependencies=[SuperuserRequired])
 
 def get_role_or_404(role_id: uuid.UUID, session: SessionDep) -> Role:
     if not (role := session.get(Role, role_id)):
@@ -19,11 +22,13 @@ def get_role_or_404(role_id: uuid.UUID, session: SessionDep) -> Role:
 RoleDep = Annotated[Role, Depends(get_role_or_404)]
 
 @router.get("/", response_model=RolesPublic)
-def get_roles(session: SessionDep) -> RolesPublic:
-    return RolesPublic(
-        data=session.exec(select(Role)).all(),
-        count=session.exec(select(func.count()).select_from(Role)).one()
-    )
+def get_roles(request: Request, response: Response, session: SessionDep) -> Any:
+    """All roles, by name. Supports If-None-Match; clients may reuse the list for a minute."""
+    versions = session.exec(select(Role.id, Role.version).order_by(Role.name)).all()
+    if not_modified := conditional_response(request, response, make_etag(versions), SHORT_LIVED):
+        return not_modified
+    data = session.exec(select(Role).order_by(Role.name)).all()
+    return RolesPublic(data=data, count=len(data))
 
 @router.get("/{role_id}", response_model=RolePublic)
 def get_role(role: RoleDep) -> Any:
@@ -42,21 +47,30 @@ def create_role(role_in: RoleCreate, session: SessionDep) -> Any:
 @router.patch("/{role_id}", response_model=RolePublic)
 def update_role(role: RoleDep, role_in: RoleUpdate, session: SessionDep) -> Any:
     role.sqlmodel_update(role_in.model_dump(exclude_unset=True))
+    role.version += 1
     session.commit()
+    course_detail_cache.clear()  # roles are listed in the details of every course they're linked to
     session.refresh(role)
     return role
 
 @router.delete("/{role_id}")
 def delete_role(role: RoleDep, session: SessionDep) -> Message:
+    crud.remove_role_holder_enrolments(session, role.id)
     session.delete(role)
     session.commit()
+    course_detail_cache.clear()
     return Message(message="Role deleted successfully")
 
 @router.get("/{role_id}/users", response_model=UsersPublic)
-def get_users_by_role(role: RoleDep, session: SessionDep, skip: int = 0, limit: int = 100) -> UsersPublic:
+def get_users_by_role(
+    role: RoleDep, session: SessionDep, skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> UsersPublic:
+    stmt = crud.paginate(select(User).where(User.role_id == role.id), User, skip, limit, cursor)
+    data = session.exec(stmt).all()
     return UsersPublic(
-        data=session.exec(select(User).where(User.role_id == role.id).offset(skip).limit(limit)).all(),
-        count=session.exec(select(func.count()).where(User.role_id == role.id)).one()
+        data=data,
+        count=session.exec(select(func.count()).where(User.role_id == role.id)).one(),
+        next_cursor=crud.next_cursor(data, limit),
     )
 
 @router.get("/{role_id}/courses", response_model=CoursesPublic)
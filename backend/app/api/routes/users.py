@@ -31,6 +31,7 @@ def update_user_me(*, session: SessionDep, current_user: CurrentUser, user_in: U
 
 @router.patch("/me/password", response_model=Message)
 def update_password_me(*, session: SessionDep, body: UpdatePassword, current_user: CurrentUser) -> Any:
+    session.refresh(current_user)  # check the stored hash, not the cached principal's
     if not verify_password(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     crud.update_user_me(session=session, db_user=current_user, user_in=body)
@@ -43,16 +44,15 @@ def read_user_me(current_user: CurrentUser) -> Any: return current_user
 def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
     if current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Super users are not allowed to delete themselves")
-    session.delete(current_user)
-    session.commit()
+    crud.delete_user(session, current_user.id)
     return Message(message="User deleted successfully")
 
 
 @router.get("/", response_model=UsersPublic, dependencies=[SuperuserRequired])
-def get_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def get_users(session: SessionDep, skip: int = 0, limit: int = 100, cursor: str | None = None) -> Any:
     count = crud.count_users(session)
-    data = crud.get_users(session, skip=skip, limit=limit)
-    return UsersPublic(data=data, count=count)
+    data = crud.get_users(session, skip=skip, limit=limit, cursor=cursor)
+    return UsersPublic(data=data, count=count, next_cursor=crud.next_cursor(data, limit))
 
 @router.get("/{user_id}", response_model=UserPublic, dependencies=[SuperuserRequired])
 def read_user_by_id(user_id: uuid.UUID, session: SessionDep) -> Any:
@@ -89,6 +89,5 @@ def delete_user(session: SessionDep, current_user: CurrentSuperUser, user_id: uu
         raise HTTPException(status_code=404, detail="User not found")
     if user == current_user:
         raise HTTPException(status_code=403, detail="Superusers cannot delete themselves")
-    session.delete(user)
-    session.commit()
+    crud.delete_user(session, user_id)
     return Message(message="User deleted successfully")
@@ -1,18 +1,19 @@
-import json
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any
 
 import emails  # type: ignore
-from fastapi import Request
 import jwt
 from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
 
+from app.api.deps import SuperuserRequired
 from app.core import security
+from app.core.cache import course_detail_cache, principal_cache
 from app.core.config import settings
+from app.core.metrics import password_hash_seconds
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -126,25 +127,21 @@ def verify_password_reset_token(token: str) -> str | None:
     except InvalidTokenError:
         return None
 
-async def log_request(request: Request, call_next: Callable) -> None:
-    """Logs details of an incoming FastAPI request (headers, body, method, URL)."""
-    try:
-        body = await request.json()
-    except Exception:
-        body = await request.body()
-        try:
-            body = body.decode("utf-8")
-        except UnicodeDecodeError:
-            body = "<Binary Data>"
-
-    log_data = {
-        "method": request.method,
-        "url": str(request.url),
-        "headers": dict(request.headers),
-        "body": body,
-    }
+@router.get("/utils/cache-stats/", tags=["utils"], dependencies=[SuperuserRequired])
+def cache_stats() -> dict[str, dict[str, Any]]:
+    """Hit/miss counters of the in-process caches."""
+    return {"principal": principal_cache.stats(), "course_detail": course_detail_cache.stats()}
+
 
-    print("Incoming Request:\n" + json.dumps(log_data, indent=4))
-    response = await call_next(request)
-    print(json.dumps({"response_status": response.status_code}, indent=4))
-    return response
\ No newline at end of file
+
+@router.get("/utils/password-hash-stats/", tags=["utils"], dependencies=[SuperuserRequired])
+def password_hash_stats() -> dict[str, Any]:
+    """Per-hash latency histogram and hasher pool state, for tuning the hashing cost."""
+    return {
+        "schemes": settings.PASSWORD_HASH_SCHEMES,
+        "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+        "workers": security.password_hasher.workers,
+        "pending": security.password_hasher.pending,
+        "rejected": security.password_hasher.rejected,
+        "latency_seconds": password_hash_seconds.snapshot(),
+    }
@@ -0,0 +1,95 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, TypeVar
+
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import SQLModel
+
+from app.core.config import settings
+from app.models import User
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+M = TypeVar("M", bound=SQLModel)
+
+
+class TTLCache(Generic[K, V]):
+    """Thread-safe LRU mapping whose entries also expire `ttl` seconds after being set.
+
+    The cache is per process: invalidation only reaches the current worker, other
+    workers converge once their copy expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+def detached_copy(obj: M) -> M:
+    """Copy a loaded table model into a detached instance that can be cached.
+
+    The copy can be attached to any session with `session.merge(copy, load=False)`,
+    which does not emit a SELECT.
+    """
+    copy = type(obj).model_validate(obj.model_dump())
+    make_transient_to_detached(copy)
+    return copy
+
+
+# Authenticated users keyed by id, so get_current_user can skip its DB lookup.
+# Invalidated by the crud/route paths that modify or delete users.
+principal_cache: TTLCache[uuid.UUID, User] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+# GET /courses/{id} bodies keyed by course id, as (ETag, JSON bytes).
+# Invalidated by the paths that modify a course, its links, materials or quiz,
+# and by those that change or delete a user on its roster.
+course_detail_cache: TTLCache[uuid.UUID, tuple[str, bytes]] = TTLCache(
+    maxsize=settings.COURSE_CACHE_SIZE, ttl=settings.COURSE_CACHE_TTL_SECONDS
+)
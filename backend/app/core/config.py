@@ -1,3 +1,4 @@
+import os
 import secrets
 from typing import Annotated, Any, Literal
 from pathlib import Path
@@ -33,8 +34,27 @@ class Settings(BaseSettings):
 
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Access tokens carry the authorization claims, keep them short-lived
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     # 60 minutes * 24 hours * 8 days = 8 days
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Per-process cache of authenticated users, 0 disables it
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60
+    # Per-process cache of serialized course detail responses, 0 disables it
+    COURSE_CACHE_SIZE: int = 512
+    COURSE_CACHE_TTL_SECONDS: float = 60
+    # Password hashing runs in its own process pool (0 = inline); logins beyond
+    # PASSWORD_HASH_MAX_PENDING queued/running hashes get a 503
+    PASSWORD_HASH_WORKERS: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # First scheme hashes new passwords; hashes in the others, or at another
+    # cost, are upgraded on the next successful login
+    PASSWORD_HASH_SCHEMES: Annotated[list[str] | str, BeforeValidator(parse_cors)] = ["bcrypt"]
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_TIME_COST: int = 3
+    ARGON2_PARALLELISM: int = 4
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -49,8 +69,22 @@ class Settings(BaseSettings):
     
     # Paths
     UPLOAD_DIR: Path = Field(default="data/course/materials")
+    # Rejected rows of enrolment CSV imports, kept for download
+    IMPORT_REJECTS_DIR: Path = Field(default="data/imports", validate_default=True)
+    # Course material uploads: 413 beyond these sizes; files copied into
+    # UPLOAD_DIR at once per process, and the chunk size of that copy
+    UPLOAD_MAX_FILE_BYTES: int = 2 * 1024**3
+    UPLOAD_MAX_COURSE_BYTES: int = 10 * 1024**3
+    UPLOAD_MAX_CONCURRENT: int = 4
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # PDF previews (first-page thumbnail, page count, text length) are rendered
+    # after upload in their own process pool (0 = one background thread); jobs
+    # beyond PREVIEW_MAX_PENDING are dropped and retried when first requested
+    PREVIEW_WORKERS: int = 1
+    PREVIEW_MAX_PENDING: int = 256
+    PREVIEW_WIDTH: int = 320  # px
     SQLALCHEMY_DATABASE_URI: str = Field(default="sqlite:///data/app.db")
-    @field_validator("UPLOAD_DIR", mode="before")
+    @field_validator("UPLOAD_DIR", "IMPORT_REJECTS_DIR", mode="before")
     @classmethod
     def resolve_upload_dir(cls, v: str | Path) -> Path:
         path = (BASE_DIR / Path(v)).resolve()
@@ -67,6 +101,49 @@ class Settings(BaseSettings):
             return f"sqlite:///{db_path}"
         return v 
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URI(self) -> str:
+        """SQLALCHEMY_DATABASE_URI rewritten to use an async driver (aiosqlite / psycopg async)."""
+        uri = self.SQLALCHEMY_DATABASE_URI
+        if uri.startswith("sqlite:///"):
+            return uri.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+        if uri.startswith(("postgresql://", "postgres://", "postgresql+psycopg2://")):
+            return "postgresql+psycopg://" + uri.split("://", 1)[1]
+        return uri
+
+    # Access log: fraction of non-5xx requests logged, and the bound of the
+    # queue between request handling and the writer thread
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_QUEUE_SIZE: int = 10_000
+    # Per-request DB time, query count and serialization time, reported in the
+    # access log and a Server-Timing header; switch off to drop the overhead
+    # and keep the breakdown out of responses
+    REQUEST_TIMING: bool = True
+    # Prometheus text endpoint at {API_V1_STR}/metrics, unauthenticated: keep it
+    # off the public ingress or disable it
+    METRICS_ENABLED: bool = True
+    # zstd/br/gzip response compression, negotiated from Accept-Encoding, for
+    # JSON and text bodies of at least COMPRESSION_MIN_BYTES
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024
+
+    # Engine profile
+    SQLALCHEMY_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+    # SQLite only, applied on every new connection. WAL lets readers proceed
+    # while a quiz submission writes; NORMAL is durable in WAL mode except on
+    # power loss, where the last transactions may roll back.
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64 * 1024  # negative = KiB, i.e. 64 MiB per connection
+    SQLITE_TEMP_STORE: str = "MEMORY"
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -1,20 +1,213 @@
+import sys
+import time
+from typing import Any
+
+from sqlalchemy import AsyncAdaptedQueuePool, Engine, QueuePool, event, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, create_engine, SQLModel, select
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.core.metrics import Counter, Gauge, Histogram, register
+from app.core.timing import current_timing
+from app.models import User, UserCourseEffective, UserCreate
 from app import crud
 
+IS_SQLITE = settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite")
+
+
+def sqlite_pragmas() -> dict[str, Any]:
+    """Per-connection SQLite settings of the configured engine profile."""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+        # off by default in SQLite; the ON DELETE CASCADE clauses rely on it
+        "foreign_keys": "ON",
+    }
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: dict[str, Any]) -> None:
+    """Run the PRAGMAs on every new DBAPI connection of `engine`."""
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection: Any, _: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def track_query_time(engine: Engine) -> None:
+    """Add each statement's execution time to the current request's RequestTiming."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if context is not None and current_timing.get() is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        timing = current_timing.get()
+        started = getattr(context, "_query_started", None)
+        if timing is not None and started is not None:
+            timing.db_seconds += time.perf_counter() - started
+            timing.db_queries += 1
+
+
+def instrumented_pool(base: type[QueuePool], label: str) -> type[QueuePool]:
+    """`base` with the time spent obtaining a connection (waiting for a free slot
+    or opening a new connection) recorded in db_pool_checkout_seconds."""
+    checkout_seconds = register(Histogram(
+        "db_pool_checkout_seconds",
+        "Time to obtain a pooled connection, including waiting for a free one.",
+        labels={"engine": label},
+    ))
+
+    class InstrumentedPool(base):  # type: ignore[valid-type,misc]
+        def _do_get(self) -> Any:
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                checkout_seconds.observe(time.perf_counter() - started)
+
+    return InstrumentedPool
+
+
+def register_pool_metrics(engine: Engine, label: str) -> None:
+    """Checkout counter and occupancy gauges of `engine`'s pool."""
+    labels = {"engine": label}
+    checkouts = register(Counter("db_pool_checkouts_total", "Connections checked out of the pool.", labels))
+    event.listen(engine, "checkout", lambda *_: checkouts.inc())
+    # read engine.pool at scrape time, dispose() replaces the pool object
+    register(Gauge("db_pool_size", "Configured pool size.", lambda: engine.pool.size(), labels))
+    register(Gauge("db_pool_checked_out", "Connections currently in use.", lambda: engine.pool.checkedout(), labels))
+    register(Gauge(
+        "db_pool_overflow", "Connections open beyond pool_size (negative: unused slots).",
+        lambda: engine.pool.overflow(), labels,
+    ))
+
+
+def engine_options() -> dict[str, Any]:
+    return {
+        "echo": settings.SQLALCHEMY_ECHO,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
 engine = create_engine(
     str(settings.SQLALCHEMY_DATABASE_URI),
-    connect_args={"check_same_thread": False}, 
-    echo=True
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    poolclass=instrumented_pool(QueuePool, "sync"),
+    **engine_options(),
+)
+
+# Same database through an async driver, used by the AsyncSessionDep routes so
+# they run on the event loop instead of holding a threadpool slot.
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI,
+    # aiosqlite defaults to NullPool on SQLAlchemy 2.0, pool it like the sync engine
+    poolclass=instrumented_pool(AsyncAdaptedQueuePool, "async"),
+    **engine_options(),
 )
 
+register_pool_metrics(engine, "sync")
+register_pool_metrics(async_engine.sync_engine, "async")
+
+if IS_SQLITE:
+    apply_sqlite_pragmas(engine, sqlite_pragmas())
+    apply_sqlite_pragmas(async_engine.sync_engine, sqlite_pragmas())
+
+if settings.REQUEST_TIMING:
+    track_query_time(engine)
+    track_query_time(async_engine.sync_engine)
+
+# Course search. SQLite: an FTS5 table holding its own copy of title and
+# description, kept in sync by triggers so every write path (ORM, bulk inserts,
+# raw SQL) is covered. It is keyed by course_id rather than the course rowid,
+# which VACUUM may renumber. Postgres: a GIN expression index, always in sync.
+COURSE_FTS_SQLITE = [
+    """CREATE VIRTUAL TABLE course_fts USING fts5(
+        course_id UNINDEXED, title, description, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    # ORDER BY rank is bm25 with title hits weighing ten times description hits
+    "INSERT INTO course_fts (course_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')",
+    """CREATE TRIGGER course_fts_insert AFTER INSERT ON course BEGIN
+        INSERT INTO course_fts (course_id, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER course_fts_update AFTER UPDATE OF id, title, description ON course BEGIN
+        UPDATE course_fts SET course_id = new.id, title = new.title, description = new.description
+        WHERE course_id = old.id;
+    END""",
+    """CREATE TRIGGER course_fts_delete AFTER DELETE ON course BEGIN
+        DELETE FROM course_fts WHERE course_id = old.id;
+    END""",
+    "INSERT INTO course_fts (course_id, title, description) SELECT id, title, description FROM course",
+]
+COURSE_SEARCH_POSTGRES = [
+    f"CREATE INDEX IF NOT EXISTS ix_course_search ON course USING GIN ({crud.COURSE_TSVECTOR})",
+]
+
+
+def setup_course_search(engine: Engine) -> None:
+    """Create the course search index if missing, filling it from existing courses."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'course_fts'"
+            ).first()
+            statements = [] if exists else COURSE_FTS_SQLITE
+        else:
+            statements = COURSE_SEARCH_POSTGRES
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+# Columns added to existing tables since the first release, with the value
+# existing rows get and an optional backfill. create_all only creates missing
+# tables, so databases from before a change are brought up to date here.
+UPGRADE_COLUMNS: list[tuple[str, str, str, str | None]] = [
+    ("user", "version", "0", None),
+    ("role", "version", "0", None),
+    ("courseuserlink", "version", "0", None),
+    ("quiz", "version", "0", None),
+    (
+        "quiz", "created_at", "'1970-01-01 00:00:00'",
+        "UPDATE quiz SET created_at = (SELECT course.created_at FROM course WHERE course.id = quiz.course_id)",
+    ),
+]
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Add the UPGRADE_COLUMNS and indexes an existing database lacks. Idempotent."""
+    with engine.begin() as conn:
+        quote = conn.dialect.identifier_preparer.quote
+        for table_name, column_name, default, backfill in UPGRADE_COLUMNS:
+            if column_name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+                continue
+            column = SQLModel.metadata.tables[table_name].c[column_name]
+            conn.exec_driver_sql(
+                f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column_name)} "
+                f"{column.type.compile(conn.dialect)} NOT NULL DEFAULT {default}"
+            )
+            if backfill:
+                conn.exec_driver_sql(backfill)
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 def init_db(session: Session| None = None) -> None:
     """Initialize the database."""
     if session is None:  
         session = Session(engine)  
 
     SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+    setup_course_search(engine)
 
     admin = session.exec(select(User).where(User.email == settings.FIRST_SUPERUSER)).first()
     if not admin:
@@ -29,10 +222,27 @@ def init_db(session: Session| None = None) -> None:
         )
         admin = crud.create_user(session=session, user_in=admin_in)
 
+    # Databases created before user_course_effective existed get it filled once
+    if session.exec(select(UserCourseEffective).limit(1)).first() is None:
+        crud.rebuild_effective_enrolments(session)
+    # ... and course_material the materials of their course.materials column
+    crud.import_json_materials(session)
+
     session.commit()  
     print("✅ Database initialized successfully!")
 
 
 if __name__ == "__main__":
+    # python -m app.core.db [rebuild-enrolments|migrate-materials|dedup-materials]
     with Session(engine) as session:
-        init_db(session)
+        if sys.argv[1:] == ["rebuild-enrolments"]:
+            rows = crud.rebuild_effective_enrolments(session)
+            print(f"✅ Rebuilt user_course_effective: {rows} rows")
+        elif sys.argv[1:] == ["migrate-materials"]:
+            rows = crud.import_json_materials(session)
+            print(f"✅ Copied course.materials into course_material: {rows} rows")
+        elif sys.argv[1:] == ["dedup-materials"]:
+            report = crud.dedup_materials(session)
+            print("✅ Deduplicated materials: " + ", ".join(f"{key}={value}" for key, value in report.items()))
+        else:
+            init_db(session)
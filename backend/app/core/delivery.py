@@ -0,0 +1,159 @@
+import os
+import re
+import secrets
+from typing import BinaryIO
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
+
+# Material names never change meaning (the blob ones name their content), so
+# a copy is good for a year without revalidation. Downloads are not per user.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# More ranges than this, after merging, and the whole file is sent instead
+MAX_RANGES = 16
+CHUNK_BYTES = 256 * 1024
+RANGE_SPEC = re.compile(r"^(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> list[tuple[int, int]] | None:
+    """The byte ranges a Range header asks for, as sorted, merged inclusive
+    (first, last) pairs within `size`.
+
+    None means "send the whole file": no header, a unit other than bytes,
+    malformed syntax or too many ranges, all of which RFC 9110 lets a server
+    ignore, and an empty file. Raises RangeNotSatisfiable when no range
+    overlaps the file.
+    """
+    if not header or not size:
+        return None
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC.match(spec.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if not first:  # suffix range, the last N bytes
+            if int(last) == 0:
+                continue
+            ranges.append((max(size - int(last), 0), size - 1))
+        elif int(first) < size:
+            end = min(int(last), size - 1) if last else size - 1
+            if end < int(first):
+                return None
+            ranges.append((int(first), end))
+    if not ranges:
+        raise RangeNotSatisfiable
+    merged: list[tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged if len(merged) <= MAX_RANGES else None
+
+
+class FileRangeResponse(Response):
+    """The whole of an open file, or byte ranges of it (206, multipart/byteranges
+    for several).
+
+    The file is handed to the server with the ASGI zero-copy send extension,
+    i.e. os.sendfile, when the server offers it; otherwise it's read with
+    os.pread in CHUNK_BYTES pieces off the event loop. Closes the file when done.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        size: int,
+        media_type: str,
+        ranges: list[tuple[int, int]] | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.file = file
+        self.background = None
+        self.trailer = b""
+        headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+        if ranges is None:
+            self.status_code = 200
+            self.parts = [(b"", 0, size)]
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            self.status_code = 206
+            self.parts = [(b"", first, last - first + 1)]
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        else:
+            boundary = secrets.token_hex(16)
+            self.status_code = 206
+            self.parts = [
+                (
+                    (b"\r\n" if i else b"")
+                    + f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n".encode(),
+                    first,
+                    last - first + 1,
+                )
+                for i, (first, last) in enumerate(ranges)
+            ]
+            self.trailer = f"\r\n--{boundary}--\r\n".encode()
+            media_type = f"multipart/byteranges; boundary={boundary}"
+        self.media_type = media_type
+        self.init_headers(headers)
+        self.headers["content-length"] = str(sum(len(prefix) + count for prefix, _, count in self.parts) + len(self.trailer))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"].upper() != "HEAD":
+                zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+                for prefix, offset, count in self.parts:
+                    if prefix:
+                        await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                    if zerocopy:
+                        await send({
+                            "type": "http.response.zerocopysend",
+                            "file": self.file,
+                            "offset": offset,
+                            "count": count,
+                            "more_body": True,
+                        })
+                    else:
+                        await self.send_chunks(send, offset, count)
+                await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
+            else:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.file.close()
+
+    async def send_chunks(self, send: Send, offset: int, count: int) -> None:
+        fd = self.file.fileno()
+        end = offset + count
+        while offset < end:
+            chunk = await run_in_threadpool(os.pread, fd, min(CHUNK_BYTES, end - offset), offset)
+            if not chunk:  # the file shrank; the client sees a short body
+                return
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+def if_range_matches(request: Request, etag: str) -> bool:
+    """Whether a Range header applies: no If-Range, or one naming the current
+    representation (strong comparison, so dates and weak tags never match)."""
+    if_range = request.headers.get("if-range")
+    return if_range is None or if_range.strip() == etag
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
@@ -0,0 +1,38 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+# Cache-Control policies. Everything here is per user, so never `public`.
+# no-cache: keep a copy but revalidate every time, cheap thanks to the ETag.
+REVALIDATE = "private, no-cache"
+# Reference data changing rarely: reuse for a minute, then revalidate.
+SHORT_LIVED = "private, max-age=60, must-revalidate"
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag over the version columns a representation is derived from."""
+    return f'"{hashlib.sha256(repr(parts).encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match is compared weakly (RFC 9110 13.1.2): a W/ prefix still matches
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cache_headers(etag: str, cache_control: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+
+
+def conditional_response(request: Request, response: Response, etag: str, cache_control: str) -> Response | None:
+    """A 304 when the client's copy is current; otherwise None, with the caching
+    headers set on `response` for the route to fill in the body."""
+    headers = cache_headers(etag, cache_control)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
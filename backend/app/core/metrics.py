@@ -0,0 +1,208 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Sequence
+from typing import Any, TypeVar
+
+import anyio.to_thread
+
+# Seconds; wide enough for password hashing (tens of ms up to ~1s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Updates below are plain attribute/list-item increments without a lock. Request
+# metrics are only touched from the event loop thread; for the few updated from
+# the threadpool a rare lost increment is an acceptable price for a hot path
+# that never contends.
+
+
+def format_labels(labels: dict[str, str] | None) -> str:
+    if not labels:
+        return ""
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _sample(name: str, labels: str, value: float) -> str:
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+class Counter:
+    """Monotonic counter. Name it with the `_total` suffix."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: dict[str, str] | None = None) -> None:
+        self.name = name
+        self.description = description
+        self.labels = format_labels(labels)
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> Iterator[str]:
+        yield _sample(self.name, self.labels, self.value)
+
+
+class Gauge:
+    """Value read from `read` at scrape time, nothing to update on the hot path."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, description: str, read: Callable[[], float], labels: dict[str, str] | None = None
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = format_labels(labels)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield _sample(self.name, self.labels, self.read())
+
+
+class Histogram:
+    """Fixed-bucket histogram with cumulative bucket counts, Prometheus style."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        labels: dict[str, str] | None = None,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.labels = format_labels(labels)
+        # one slot per bucket plus the +Inf overflow
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    def snapshot(self) -> dict[str, Any]:
+        counts = list(self._counts)
+        cumulative, running = {}, 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], counts, strict=True):
+            running += count
+            cumulative[bound] = running
+        return {"buckets": cumulative, "count": running, "sum": self._sum}
+
+    def samples(self) -> Iterator[str]:
+        snapshot = self.snapshot()
+        prefix = f"{self.labels}," if self.labels else ""
+        for bound, count in snapshot["buckets"].items():
+            yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}'
+        yield _sample(f"{self.name}_sum", self.labels, snapshot["sum"])
+        yield _sample(f"{self.name}_count", self.labels, snapshot["count"])
+
+
+class RouteMetrics:
+    """Response counts per status class and latency of one route and method."""
+
+    __slots__ = ("labels", "responses", "latency")
+
+    def __init__(self, method: str, route: str) -> None:
+        self.labels = format_labels({"method": method, "route": route})
+        # indexed by status // 100
+        self.responses = [0] * 6
+        self.latency = Histogram("http_request_duration_seconds", "", labels={"method": method, "route": route})
+
+
+class HttpMetrics:
+    """Per-route request metrics keyed by route template, plus in-flight requests."""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        # route template -> method -> metrics; entries are created on a route's
+        # first request, after that recording a request allocates nothing
+        self._routes: dict[str, dict[str, RouteMetrics]] = {}
+
+    def route(self, template: str, method: str) -> RouteMetrics:
+        by_method = self._routes.get(template)
+        if by_method is None:
+            by_method = self._routes[template] = {}
+        metrics = by_method.get(method)
+        if metrics is None:
+            metrics = by_method[method] = RouteMetrics(method, template)
+        return metrics
+
+    def observe(self, template: str | None, method: str, status: int, seconds: float) -> None:
+        metrics = self.route(template or "unmatched", method)
+        metrics.responses[min(status // 100, 5)] += 1
+        metrics.latency.observe(seconds)
+
+    def render(self) -> Iterator[str]:
+        routes = [metrics for by_method in list(self._routes.values()) for metrics in list(by_method.values())]
+        yield "# HELP http_requests_total Requests handled, by route template and status class."
+        yield "# TYPE http_requests_total counter"
+        for metrics in routes:
+            for status_class, count in enumerate(metrics.responses):
+                if count:
+                    yield f'http_requests_total{{{metrics.labels},status="{status_class}xx"}} {count}'
+        yield "# HELP http_request_duration_seconds Request latency, by route template."
+        yield "# TYPE http_request_duration_seconds histogram"
+        for metrics in routes:
+            yield from metrics.latency.samples()
+        yield "# HELP http_requests_in_flight Requests currently being handled."
+        yield "# TYPE http_requests_in_flight gauge"
+        yield f"http_requests_in_flight {self.in_flight}"
+
+
+Metric = Counter | Gauge | Histogram
+M = TypeVar("M", Counter, Gauge, Histogram)
+
+registry: list[Metric] = []
+
+
+def register(metric: M) -> M:
+    registry.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    families: dict[str, list[Metric]] = {}
+    for metric in registry:
+        families.setdefault(metric.name, []).append(metric)
+    lines = list(http_metrics.render())
+    for name, metrics in families.items():
+        lines.append(f"# HELP {name} {metrics[0].description}")
+        lines.append(f"# TYPE {name} {metrics[0].kind}")
+        for metric in metrics:
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def _threadpool_limiter() -> Any:
+    # anyio's default limiter is per event loop, read it from the scraping request
+    return anyio.to_thread.current_default_thread_limiter()
+
+
+http_metrics = HttpMetrics()
+
+password_hash_seconds = register(Histogram(
+    "password_hash_seconds",
+    "Time spent computing one password hash or verification, excluding queueing.",
+))
+threadpool_threads = register(Gauge(
+    "threadpool_threads_max", "Size of the threadpool running sync routes and dependencies.",
+    lambda: _threadpool_limiter().total_tokens,
+))
+threadpool_busy = register(Gauge(
+    "threadpool_threads_busy", "Threadpool threads currently in use.",
+    lambda: _threadpool_limiter().borrowed_tokens,
+))
+threadpool_waiting = register(Gauge(
+    "threadpool_tasks_waiting", "Calls queued for a free threadpool thread.",
+    lambda: _threadpool_limiter().statistics().tasks_waiting,
+))
+logins_succeeded = register(Counter("logins_total", "Password logins.", {"result": "success"}))
+logins_failed = register(Counter("logins_total", "Password logins.", {"result": "failure"}))
+quiz_attempts_passed = register(Counter("quiz_attempts_total", "Quiz attempts submitted.", {"passed": "true"}))
+quiz_attempts_failed = register(Counter("quiz_attempts_total", "Quiz attempts submitted.", {"passed": "false"}))
+uploaded_bytes = register(Counter("uploaded_bytes_total", "Bytes of course material uploaded."))
+previews_rendered = register(Counter("material_previews_total", "PDF previews generated.", {"result": "success"}))
+previews_failed = register(Counter("material_previews_total", "PDF previews generated.", {"result": "failure"}))
@@ -0,0 +1,162 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections.abc import Iterable
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from app.core import uploads
+from app.core.config import settings
+from app.core.metrics import Gauge, previews_failed, previews_rendered, register
+
+logger = logging.getLogger(__name__)
+
+# A PDF blob's preview lives next to it: <sha256>.jpg, the first page scaled to
+# PREVIEW_WIDTH, and <sha256>.json, written last, with the page count and text
+# length, or the error that stopped the render. Once the .json exists the
+# preview is final; it goes away with the blob (crud.collect_blobs).
+PREVIEW_MIME = "application/pdf"
+
+
+def thumbnail_path(sha256: str) -> Path:
+    return uploads.blob_path(sha256).with_suffix(".jpg")
+
+
+def info_path(sha256: str) -> Path:
+    return uploads.blob_path(sha256).with_suffix(".json")
+
+
+def read(sha256: str) -> dict[str, Any] | None:
+    """The finished preview of a blob, None while there is none."""
+    try:
+        return json.loads(info_path(sha256).read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    part = path.with_name(f".{path.name}.part")
+    part.write_bytes(data)
+    os.replace(part, path)
+
+
+# Executed inside the preview processes, must stay an importable module-level function.
+def _render(source: str, thumbnail: str, width: int) -> dict[str, Any]:
+    import pypdfium2  # only the workers load pdfium
+
+    pdf = pypdfium2.PdfDocument(source)
+    try:
+        text_length = 0
+        for index in range(len(pdf)):
+            page = pdf[index]
+            text = page.get_textpage()
+            text_length += text.count_chars()
+            text.close()
+            page.close()
+        page = pdf[0]
+        image = page.render(scale=width / page.get_width()).to_pil().convert("RGB")
+        page.close()
+        part = Path(thumbnail).with_name(f".{Path(thumbnail).name}.part")
+        image.save(part, "JPEG", quality=80, optimize=True)
+        os.replace(part, thumbnail)
+        return {"pages": len(pdf), "text_length": text_length, "width": image.width, "height": image.height}
+    finally:
+        pdf.close()
+
+
+class PreviewQueue:
+    """Renders PDF previews in a dedicated process pool, off the request path.
+
+    One job per content hash: a blob with a finished preview or a job already
+    queued is skipped. At most `max_pending` jobs are queued; past that they
+    are dropped, to be scheduled again when the preview is first requested.
+    With `workers=0` one background thread renders instead.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._jobs: dict[str, Future[dict[str, Any]]] = {}
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def schedule(self, sha256: str) -> bool:
+        """Queue a preview of the blob; False when there's nothing to do or no room.
+        Never raises: a preview is not worth failing the caller over."""
+        if info_path(sha256).exists():
+            return False
+        with self._lock:
+            if sha256 in self._jobs:
+                return False
+            if len(self._jobs) >= self.max_pending:
+                logger.warning("Preview queue full, dropping %s", sha256)
+                return False
+            try:
+                if self._executor is None:
+                    self._executor = (
+                        # spawn: forking a threaded server process can copy held locks
+                        ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                        if self.workers > 0 else ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+                    )
+                future = self._executor.submit(
+                    _render, str(uploads.blob_path(sha256)), str(thumbnail_path(sha256)), settings.PREVIEW_WIDTH
+                )
+            except Exception as exc:
+                logger.exception("Could not queue the preview of %s", sha256)
+                if isinstance(exc, BrokenExecutor):  # a worker died: start afresh next time
+                    self._executor = None
+                return False
+            self._jobs[sha256] = future
+        future.add_done_callback(lambda done: self._finish(sha256, done))
+        return True
+
+    def schedule_uploads(self, stored: Iterable[uploads.StoredUpload]) -> None:
+        for upload in stored:
+            if upload.mime == PREVIEW_MIME:
+                self.schedule(upload.sha256)
+
+    def _finish(self, sha256: str, future: "Future[dict[str, Any]]") -> None:
+        try:
+            info = future.result()
+            previews_rendered.inc()
+        except Exception as exc:
+            previews_failed.inc()
+            if future.cancelled() or isinstance(exc, BrokenExecutor):
+                # not the PDF's fault: leave it to be scheduled again
+                logger.warning("Preview of %s was not rendered: %r", sha256, exc)
+                with self._lock:
+                    self._jobs.pop(sha256, None)
+                    if isinstance(exc, BrokenExecutor):
+                        self._executor = None
+                return
+            logger.warning("Preview of %s failed: %r", sha256, exc)
+            info = {"error": type(exc).__name__}
+        try:
+            # not for a blob removed meanwhile, its files would be left behind
+            with uploads.blob_lock:
+                if uploads.blob_path(sha256).exists():
+                    _write_atomic(info_path(sha256), json.dumps(info).encode())
+                else:
+                    thumbnail_path(sha256).unlink(missing_ok=True)
+        except OSError:
+            logger.exception("Could not store the preview of %s", sha256)
+        finally:
+            with self._lock:
+                self._jobs.pop(sha256, None)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+preview_queue = PreviewQueue(workers=settings.PREVIEW_WORKERS, max_pending=settings.PREVIEW_MAX_PENDING)
+register(Gauge("material_previews_pending", "PDF previews queued or rendering.", lambda: preview_queue.pending))
@@ -1,18 +1,151 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Any, TypeVar
+
 import jwt
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.metrics import password_hash_seconds
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 
-def create_access_token(subject: str, expires_delta: timedelta) -> str:
+def build_crypt_context() -> CryptContext:
+    """Hashing policy from settings: new hashes use the first scheme and the
+    configured cost, older schemes/costs still verify and are flagged for rehash."""
+    options: dict[str, Any] = {}
+    if "bcrypt" in settings.PASSWORD_HASH_SCHEMES:
+        options["bcrypt__rounds"] = settings.BCRYPT_ROUNDS
+    if "argon2" in settings.PASSWORD_HASH_SCHEMES:
+        options["argon2__memory_cost"] = settings.ARGON2_MEMORY_COST
+        options["argon2__time_cost"] = settings.ARGON2_TIME_COST
+        options["argon2__parallelism"] = settings.ARGON2_PARALLELISM
+    return CryptContext(schemes=settings.PASSWORD_HASH_SCHEMES, deprecated="auto", **options)
+
+pwd_context = build_crypt_context()
+
+T = TypeVar("T")
+
+def create_access_token(
+    subject: str, expires_delta: timedelta, claims: dict[str, Any] | None = None
+) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {**(claims or {}), "exp": expire, "sub": str(subject), "type": "access"}
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def create_refresh_token(
+    subject: str, expires_delta: timedelta, claims: dict[str, Any] | None = None
+) -> str:
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode = {**(claims or {}), "exp": expire, "sub": str(subject), "type": "refresh"}
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+
+# Executed inside the hasher processes, must stay importable module-level functions.
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
+
+def _timed(fn: Callable[..., T], *args: Any) -> tuple[T, float]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class PasswordHasher:
+    """Runs the CPU-bound hashing work in a dedicated process pool.
+
+    At most `max_pending` jobs (queued or running) are accepted; past that callers
+    get an immediate 503 instead of piling up behind the pool. With `workers=0`
+    the work runs inline on the calling thread.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn: Callable[..., T], *args: Any) -> "Future[tuple[T, float]]":
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Authentication is busy, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            if self._executor is None:
+                # spawn: forking a threaded server process can copy held locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            self.pending += 1
+        future = self._executor.submit(_timed, fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _: Future[Any]) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.workers <= 0:
+            result, elapsed = _timed(fn, *args)
+        else:
+            result, elapsed = self._submit(fn, *args).result()
+        password_hash_seconds.observe(elapsed)
+        return result
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.workers <= 0:
+            result, elapsed = await run_in_threadpool(_timed, fn, *args)
+        else:
+            result, elapsed = await asyncio.wrap_future(self._submit(fn, *args))
+        password_hash_seconds.observe(elapsed)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hasher.run(_verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify, and return a new hash if the stored one no longer matches the policy."""
+    return password_hasher.run(_verify_and_update, plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return password_hasher.run(_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run_async(_verify, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await password_hasher.run_async(_verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run_async(_hash, password)
@@ -0,0 +1,61 @@
+import time
+from collections.abc import Callable, Coroutine
+from contextvars import ContextVar
+from typing import Any
+
+import fastapi.routing
+
+
+class RequestTiming:
+    """Where one request spent its time: SQL and response_model serialization."""
+
+    __slots__ = ("db_seconds", "db_queries", "serialize_seconds")
+
+    def __init__(self) -> None:
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.serialize_seconds = 0.0
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        return (
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.db_queries} queries", '
+            f"serialize;dur={self.serialize_seconds * 1000:.2f}, "
+            f"total;dur={total_seconds * 1000:.2f}"
+        )
+
+    def as_log_fields(self) -> dict[str, Any]:
+        return {
+            "db_ms": round(self.db_seconds * 1000, 2),
+            "db_queries": self.db_queries,
+            "serialize_ms": round(self.serialize_seconds * 1000, 2),
+        }
+
+
+# Set by the middleware for the duration of a request. Threadpool calls and the
+# async driver's greenlets copy the context, so they all update the same object.
+current_timing: ContextVar[RequestTiming | None] = ContextVar("current_timing", default=None)
+
+
+def instrument_serialization() -> None:
+    """Time FastAPI's response_model validation/serialization step.
+
+    FastAPI has no hook around it, so the module-level serialize_response that
+    the route handlers look up at call time is wrapped once.
+    """
+    serialize: Callable[..., Coroutine[Any, Any, Any]] = fastapi.routing.serialize_response
+    if getattr(serialize, "__timed__", False):
+        return
+
+    async def timed_serialize_response(*args: Any, **kwargs: Any) -> Any:
+        timing = current_timing.get()
+        if timing is None:
+            return await serialize(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await serialize(*args, **kwargs)
+        finally:
+            timing.serialize_seconds += time.perf_counter() - started
+
+    timed_serialize_response.__timed__ = True  # type: ignore[attr-defined]
+    fastapi.routing.serialize_response = timed_serialize_response  # type: ignore[assignment]
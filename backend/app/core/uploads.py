@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections.abc import AsyncIterator, Iterable, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import Gauge, register, uploaded_bytes
+
+
+# Materials are stored once per content, as UPLOAD_DIR/blobs/<2 hex>/<sha256>,
+# and named "<sha256>_<original name>" in course_material. The material_blob
+# table counts those rows; a blob's file is removed when its count drops to
+# zero. Names without the hash prefix predate this and point at a file
+# directly under UPLOAD_DIR (python -m app.core.db dedup-materials converts them).
+BLOB_NAME = re.compile(r"([0-9a-f]{64})_")
+
+# Held while a blob file is published or removed, so that a blob going away
+# and an upload of the same content in this process can't interleave
+blob_lock = threading.Lock()
+
+
+@dataclass
+class StoredUpload:
+    name: str  # material name, "<sha256>_<original name>"
+    size: int
+    sha256: str
+    mime: str
+    part: Path  # the data, until publish() moves it to its blob
+
+
+def blob_path(sha256: str) -> Path:
+    return settings.UPLOAD_DIR / "blobs" / sha256[:2] / sha256
+
+
+def blob_sha(name: str) -> str | None:
+    """The blob a material name points at; None for names predating the blob store."""
+    match = BLOB_NAME.match(name)
+    return match.group(1) if match else None
+
+
+def material_path(name: str) -> Path:
+    sha256 = blob_sha(name)
+    return blob_path(sha256) if sha256 else settings.UPLOAD_DIR / name
+
+
+# Files being copied into UPLOAD_DIR, process-wide. Uploads beyond the limit
+# wait for a slot; their bodies are already spooled by Starlette meanwhile.
+upload_slots = asyncio.Semaphore(settings.UPLOAD_MAX_CONCURRENT)
+uploads_in_progress = 0
+register(Gauge("uploads_in_progress", "Material files currently being written.", lambda: uploads_in_progress))
+
+# Bytes of uploads still being written, per course, so concurrent requests
+# count against the course quota before their files land
+_reserved: dict[uuid.UUID, int] = {}
+
+
+def original_name(filename: str | None) -> str:
+    # Only the last path component of the client's name, so names can't point outside UPLOAD_DIR
+    return Path(filename or "upload").name
+
+
+def display_name(name: str) -> str:
+    """The name a material was uploaded as, without the hash prefix."""
+    return name[65:] if blob_sha(name) else name
+
+
+# (offset, signature, type) of the formats courses use. Containers that
+# several formats share (zip, OLE) take the name's type when it is one of them.
+SIGNATURES = [
+    (0, b"%PDF-", "application/pdf"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftypM4A", "audio/mp4"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\xff\xfb", "audio/mpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF8", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"WAVE", "audio/wav"),
+    (8, b"AVI ", "video/x-msvideo"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+]
+CONTAINERS = {
+    "application/zip": ("application/vnd.openxmlformats-officedocument.", "application/vnd.oasis.opendocument.", "application/epub+zip"),
+    "application/x-ole-storage": ("application/msword", "application/vnd.ms-"),
+}
+
+
+def sniff_mime(head: bytes, filename: str) -> str:
+    """Content type from the first bytes of a file, so a mislabelled or
+    extensionless upload is still served as what it is. Text is never
+    given an active type like text/html."""
+    guessed = mimetypes.guess_type(filename)[0] or ""
+    for offset, signature, mime in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return guessed if guessed.startswith(CONTAINERS.get(mime, ())) else mime
+    if head and b"\x00" not in head:
+        try:
+            head.decode()
+        except UnicodeDecodeError as exc:
+            if exc.start < len(head) - 3:  # not just a character cut off at the end
+                return "application/octet-stream"
+        return "text/csv" if guessed == "text/csv" else "text/plain"
+    return "application/octet-stream"
+
+
+def sniff_file(path: Path, filename: str) -> str:
+    with path.open("rb") as f:
+        return sniff_mime(f.read(512), filename)
+
+
+@asynccontextmanager
+async def course_quota(course_id: uuid.UUID, used: int, files: Sequence[UploadFile]) -> AsyncIterator[int]:
+    """Reserve room for `files` in the course quota, given the bytes of the
+    materials it keeps.
+
+    Yields the bytes the course may still take, for store_upload to enforce
+    while streaming; rejects with 413 up front when the sizes Starlette
+    recorded while spooling already exceed it.
+    """
+    available = settings.UPLOAD_MAX_COURSE_BYTES - used - _reserved.get(course_id, 0)
+    incoming = sum(file.size or 0 for file in files)
+    too_large = [file.filename for file in files if (file.size or 0) > settings.UPLOAD_MAX_FILE_BYTES]
+    if too_large:
+        raise HTTPException(
+            status_code=413, detail=f"Files over {settings.UPLOAD_MAX_FILE_BYTES} bytes: {', '.join(map(str, too_large))}"
+        )
+    if incoming > available:
+        raise HTTPException(status_code=413, detail=f"Course material quota exceeded, {max(available, 0)} bytes left")
+    _reserved[course_id] = _reserved.get(course_id, 0) + incoming
+    try:
+        yield available
+    finally:
+        _reserved[course_id] -= incoming
+        if not _reserved[course_id]:
+            del _reserved[course_id]
+
+
+async def store_upload(file: UploadFile, limit: int) -> StoredUpload:
+    """Copy `file` into UPLOAD_DIR in UPLOAD_CHUNK_BYTES chunks, hashing as it
+    goes and sniffing the type from the first bytes.
+
+    The data stays in a hidden .part file until publish() renames it to its
+    blob, once the database references it, so a blob file is always whole.
+    Raises 413, leaving nothing behind, once more than `limit` or
+    UPLOAD_MAX_FILE_BYTES bytes have arrived.
+    """
+    global uploads_in_progress
+    limit = min(limit, settings.UPLOAD_MAX_FILE_BYTES)
+    part = settings.UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    def write(out: BinaryIO, chunk: bytes) -> None:
+        # hashlib releases the GIL on large buffers, both run off the event loop
+        digest.update(chunk)
+        out.write(chunk)
+
+    async with upload_slots:
+        uploads_in_progress += 1
+        try:
+            out = await run_in_threadpool(part.open, "wb")
+            try:
+                while chunk := await file.read(settings.UPLOAD_CHUNK_BYTES):
+                    if len(head) < 512:
+                        head += chunk[:512 - len(head)]
+                    size += len(chunk)
+                    if size > limit:
+                        raise HTTPException(status_code=413, detail=f"'{file.filename}' exceeds the upload limit")
+                    await run_in_threadpool(write, out, chunk)
+            finally:
+                out.close()
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        finally:
+            uploads_in_progress -= 1
+    uploaded_bytes.inc(size)
+    sha256 = digest.hexdigest()
+    name = original_name(file.filename)
+    return StoredUpload(
+        name=f"{sha256}_{name}", size=size, sha256=sha256, mime=sniff_mime(head, name), part=part
+    )
+
+
+async def store_uploads(course_id: uuid.UUID, used: int, files: Sequence[UploadFile]) -> list[StoredUpload]:
+    """store_upload each of `files` within the course quota. All or nothing: on
+    failure the files already stored are discarded again."""
+    stored: list[StoredUpload] = []
+    try:
+        async with course_quota(course_id, used, files) as available:
+            for file in files:
+                stored.append(await store_upload(file, available))
+                available -= stored[-1].size
+    except BaseException:
+        discard(stored)
+        raise
+    return stored
+
+
+def publish(stored: Iterable[StoredUpload]) -> None:
+    """Move committed uploads to their blobs; content already stored is dropped."""
+    with blob_lock:
+        for upload in stored:
+            target = blob_path(upload.sha256)
+            if target.exists():
+                upload.part.unlink(missing_ok=True)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(upload.part, target)
+
+
+def discard(stored: Iterable[StoredUpload]) -> None:
+    for upload in stored:
+        upload.part.unlink(missing_ok=True)
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Make `target` a copy of `source`, as a hard link when the filesystem allows."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,11 +1,30 @@
-from typing import List, Optional, Sequence
-from uuid import UUID
-from sqlmodel import Session, select
+import base64
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, List, Optional, Sequence, TypeVar
+from uuid import UUID, uuid4
+from sqlmodel import Session, delete, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException
-from sqlalchemy import Connection, func
+from sqlalchemy import (
+    JSON, Connection, Select, and_, bindparam, column, func, insert, inspect, literal, literal_column, or_, table,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.models import (
+    BulkEnrolmentReport,
+    CourseMaterial,
+    CourseRoleLink,
+    CourseSearchHit,
+    CourseStatusEnum,
     CourseUserLink,
+    EnrolmentImportReport,
+    EnrolmentOutcome,
+    EnrolmentResult,
+    EnrolmentSource,
+    MaterialBlob,
     Notification,
     NotificationCreate,
     Quiz,
@@ -22,9 +41,59 @@ from app.models import (
     RoleUpdate,
     Course,
     CourseCreate,
-    CourseUpdate
+    CourseUpdate,
+    UserCourseEffective,
+)
+from app.core import previews, uploads
+from app.core.cache import course_detail_cache, principal_cache
+from app.core.config import settings
+from app.core.security import (
+    get_password_hash,
+    verify_and_update_password,
+    verify_and_update_password_async,
 )
-from app.core.security import verify_password, get_password_hash 
+
+
+# ===========================
+#  PAGINATION
+# ===========================
+# Lists are ordered on (created_at, id). Besides skip/limit they accept the
+# opaque cursor of the previous page's last row: the next page is then a range
+# seek on the (created_at, id) indexes, as cheap at page 1000 as at page 1.
+
+S = TypeVar("S", bound=Select[Any])
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except ValueError:  # also covers bad base64 and utf-8
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate(
+    stmt: S, model: Any, skip: int, limit: int, cursor: str | None, descending: bool = False
+) -> S:
+    """Order `stmt` on model's (created_at, id) and apply the cursor, or skip without one."""
+    key = tuple_(model.created_at, model.id)
+    if cursor:
+        position = decode_cursor(cursor)
+        stmt = stmt.where(key < position if descending else key > position)
+    else:
+        stmt = stmt.offset(skip)
+    if descending:
+        return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+    return stmt.order_by(model.created_at, model.id).limit(limit)
+
+def next_cursor(rows: Sequence[Any], limit: int) -> str | None:
+    """Cursor of the page after `rows`; None once a page comes back short."""
+    if limit <= 0 or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].created_at, rows[-1].id)
 
 
 # ===========================
@@ -38,8 +107,10 @@ def get_user_by_email(session: Session, email: str) -> Optional[User]:
     stmt = select(User).where(User.email == email)
     return session.exec(stmt).first()
 
-def get_users(session: Session, skip: int = 0, limit: int = 100) -> Sequence[User]:
-    stmt = select(User).offset(skip).limit(limit)
+def get_users(
+    session: Session, skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> Sequence[User]:
+    stmt = paginate(select(User), User, skip, limit, cursor)
     return session.exec(stmt).all()
 
 def count_users(session: Session) -> int:
@@ -49,8 +120,40 @@ def count_users(session: Session) -> int:
 def authenticate_user(session: Session, email: str, password: str) -> Optional[User]:
     """Check if a user with the given email/password exists."""
     db_user = get_user_by_email(session=session, email=email)
-    if not db_user or not verify_password(password, db_user.hashed_password):
+    if not db_user:
+        return None
+    verified, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not verified:
+        return None
+    if new_hash:
+        # Stored hash predates the current hashing policy, upgrade it transparently
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        session.commit()
+        principal_cache.invalidate(db_user.id)
+        session.refresh(db_user)
+    return db_user
+
+async def get_user_by_email_async(session: AsyncSession, email: str) -> Optional[User]:
+    stmt = select(User).where(User.email == email)
+    return (await session.exec(stmt)).first()
+
+async def authenticate_user_async(session: AsyncSession, email: str, password: str) -> Optional[User]:
+    """Async variant of authenticate_user; the bcrypt check runs in the hasher pool."""
+    db_user = await get_user_by_email_async(session=session, email=email)
+    # End the read transaction so the pooled connection is not held during the hash
+    # (expire_on_commit is off for async sessions, db_user stays loaded)
+    await session.commit()
+    if not db_user:
+        return None
+    verified, new_hash = await verify_and_update_password_async(password, db_user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
+        principal_cache.invalidate(db_user.id)
     return db_user
 
 def create_user(session: Session, user_in: UserCreate) -> User:
@@ -59,16 +162,35 @@ def create_user(session: Session, user_in: UserCreate) -> User:
         user_in, update={"hashed_password": get_password_hash(user_in.password)}
     )
     session.add(db_obj)
+    if db_obj.role_id is not None:
+        set_user_role_enrolments(session, db_obj.id, db_obj.role_id)
     session.commit()
     session.refresh(db_obj)
     return db_obj
 
+def roster_course_ids(session: Session, user_id: UUID) -> Sequence[UUID]:
+    """The courses whose details list the user, i.e. whose course_detail_cache
+    entries go stale when the user changes."""
+    return session.exec(select(CourseUserLink.course_id).where(CourseUserLink.user_id == user_id)).all()
+
+def invalidate_rosters(course_ids: Sequence[UUID]) -> None:
+    for course_id in course_ids:
+        course_detail_cache.invalidate(course_id)
+
 def update_user(session: Session, db_user: User, user_in: UserUpdate) -> User:
     """Partially update an existing User with the fields in UserUpdate."""
     user_data = user_in.model_dump(exclude_unset=True)
+    role_changed = "role_id" in user_data and user_data["role_id"] != db_user.role_id
     db_user.sqlmodel_update(user_data)
+    if user_data.keys() & {"role_id", "is_superuser", "is_active"}:
+        # in SQL: db_user may be a cached principal with an old version
+        db_user.version = User.version + 1
     session.add(db_user)
+    if role_changed:
+        set_user_role_enrolments(session, db_user.id, db_user.role_id)
     session.commit()
+    principal_cache.invalidate(db_user.id)
+    invalidate_rosters(roster_course_ids(session, db_user.id))
     session.refresh(db_user)
     return db_user
 
@@ -77,10 +199,13 @@ def update_user_me(session: Session, db_user: User, user_in: UserUpdateMe | Upda
     user_data = user_in.model_dump(exclude_unset=True)
     if isinstance(user_in, UpdatePassword):
         user_data["hashed_password"] = get_password_hash(user_data.pop("new_password"))
-    
     db_user.sqlmodel_update(user_data)
+    if isinstance(user_in, UpdatePassword):
+        db_user.version = User.version + 1
     session.add(db_user)
     session.commit()
+    principal_cache.invalidate(db_user.id)
+    invalidate_rosters(roster_course_ids(session, db_user.id))
     session.refresh(db_user)
     return db_user
 
@@ -89,8 +214,12 @@ def delete_user(session: Session, user_id: UUID) -> User:
     db_user = get_user_by_id(session, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
+    courses = roster_course_ids(session, user_id)
+    remove_user_enrolments(session, user_id)
     session.delete(db_user)
     session.commit()
+    principal_cache.invalidate(user_id)
+    invalidate_rosters(courses)
     return db_user
 
 
@@ -129,6 +258,7 @@ def update_role(session: Session, db_role: Role, role_in: RoleUpdate) -> Role:
     update_data = role_in.model_dump(exclude_unset=True)
     for field_name, value in update_data.items():
         setattr(db_role, field_name, value)
+    db_role.version += 1
     session.add(db_role)
     session.commit()
     session.refresh(db_role)
@@ -138,6 +268,7 @@ def delete_role(session: Session, role_id: UUID) -> Role:
     db_role = get_role_by_id(session, role_id)
     if not db_role:
         raise HTTPException(status_code=404, detail="Role not found")
+    remove_role_holder_enrolments(session, db_role.id)
     session.delete(db_role)
     session.commit()
     return db_role
@@ -150,8 +281,10 @@ def delete_role(session: Session, role_id: UUID) -> Role:
 def get_course_by_id(session: Session, course_id: UUID) -> Optional[Course]:
     return session.get(Course, course_id)
 
-def get_courses(session: Session, skip: int = 0, limit: int = 100) -> Sequence[Course]:
-    stmt = select(Course).offset(skip).limit(limit)
+def get_courses(
+    session: Session, skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> Sequence[Course]:
+    stmt = paginate(select(Course), Course, skip, limit, cursor)
     return session.exec(stmt).all()
 
 def count_courses(session: Session) -> int:
@@ -172,8 +305,612 @@ def update_course(session: Session, db_course: Course, course_in: CourseUpdate)
     session.add(db_course)
     session.commit()
     session.refresh(db_course)
+    course_detail_cache.invalidate(db_course.id)
     return db_course
-    
+
+def delete_course(session: Session, course_id: UUID) -> bool:
+    """Delete a course with its quiz, attempts, links and enrolments; False if it didn't exist.
+
+    One DELETE per table, bottom-up, so nothing is loaded into the session. The
+    ON DELETE CASCADE foreign keys would remove the children too, the explicit
+    statements also cover databases created before them.
+    """
+    materials = session.exec(
+        delete(CourseMaterial).where(CourseMaterial.course_id == course_id).returning(CourseMaterial.stored_name)
+    ).scalars().all()  # type: ignore[call-overload]
+    release_blob_refs(session, materials)
+    quiz_ids = select(Quiz.id).where(Quiz.course_id == course_id)
+    session.exec(delete(QuizAttempt).where(QuizAttempt.quiz_id.in_(quiz_ids)))  # type: ignore[call-overload,attr-defined]
+    session.exec(delete(Quiz).where(Quiz.course_id == course_id))  # type: ignore[call-overload]
+    for link in (CourseUserLink, CourseRoleLink):
+        session.exec(delete(link).where(link.course_id == course_id))  # type: ignore[call-overload,attr-defined]
+    remove_course_enrolments(session, course_id)
+    deleted = session.exec(delete(Course).where(Course.id == course_id)).rowcount  # type: ignore[call-overload]
+    session.commit()
+    course_detail_cache.invalidate(course_id)
+    collect_blobs(session, materials)
+    return bool(deleted)
+
+
+# ===========================
+#  COURSE SEARCH
+# ===========================
+# Backed by the course_fts FTS5 table on SQLite and by a GIN index on this
+# expression on Postgres, see core.db.setup_course_search.
+
+COURSE_TSVECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))"
+SEARCH_MARK = ("<mark>", "</mark>")
+
+def search_terms(q: str) -> list[str]:
+    """Words of `q`; quotes and operators are dropped so input can't change the query syntax."""
+    return re.findall(r"\w+", q.lower())
+
+def search_courses(
+    session: Session, q: str, limit: int = 20, active_only: bool = False
+) -> list[CourseSearchHit]:
+    """Courses whose title or description contain every word of `q`, as a
+    prefix, best match first (title matches weigh more)."""
+    terms = search_terms(q)
+    if not terms:
+        return []
+    columns = (Course.id, Course.title, Course.is_active, Course.start_date, Course.end_date)
+    if session.get_bind().dialect.name == "sqlite":
+        fts = literal_column("course_fts")
+        course_fts = table("course_fts", column("course_id"), column("rank"))
+        # Rank, cut and highlight inside FTS5 and join the few survivors to course:
+        # ORDER BY rank (bm25 with the weights set at creation) lets FTS5 build
+        # highlights for the top `limit` rows only, not for every match.
+        matches = select(
+            course_fts.c.course_id,
+            course_fts.c.rank,
+            func.highlight(fts, 1, *SEARCH_MARK).label("title_highlight"),
+            func.snippet(fts, 2, *SEARCH_MARK, "…", 16).label("description_snippet"),
+        ).where(fts.match(" ".join(f'"{term}"*' for term in terms)))
+        if active_only:
+            matches = matches.where(course_fts.c.course_id.in_(select(Course.id).where(Course.is_active)))
+        top = matches.order_by(course_fts.c.rank).limit(limit).subquery()
+        stmt = (
+            select(*columns, top.c.title_highlight, top.c.description_snippet)
+            .select_from(top)
+            .join(Course, Course.id == top.c.course_id)  # type: ignore[arg-type]
+            .order_by(top.c.rank)
+        )
+    else:
+        config = literal_column("'simple'")
+        query = func.to_tsquery(config, " & ".join(f"{term}:*" for term in terms))
+        weighted = func.setweight(func.to_tsvector(config, func.coalesce(Course.title, "")), "A").op("||")(
+            func.setweight(func.to_tsvector(config, func.coalesce(Course.description, "")), "B")
+        )
+        marks = f"StartSel={SEARCH_MARK[0]}, StopSel={SEARCH_MARK[1]}"
+        stmt = (
+            select(
+                *columns,
+                func.ts_headline(config, Course.title, query, f"{marks}, HighlightAll=true").label("title_highlight"),
+                func.ts_headline(config, Course.description, query, f"{marks}, MaxWords=20, MinWords=8")
+                .label("description_snippet"),
+            )
+            # Same text as the indexed expression, so the GIN index is used
+            .where(literal_column(COURSE_TSVECTOR).op("@@")(query))
+            .order_by(func.ts_rank(weighted, query).desc())
+            .limit(limit)
+        )
+        if active_only:
+            stmt = stmt.where(Course.is_active)
+    rows = session.exec(stmt).all()  # type: ignore[call-overload]
+    return [CourseSearchHit.model_validate(row._mapping) for row in rows]
+
+
+# ===========================
+#  EFFECTIVE ENROLMENTS
+# ===========================
+# user_course_effective mirrors CourseUserLink (direct) and CourseRoleLink joined
+# to User.role_id (role). The helpers below only stage the change in `session`,
+# callers commit it together with the link change that caused it.
+
+def _source(value: EnrolmentSource) -> Any:
+    return literal(value, UserCourseEffective.__table__.c.source.type)  # type: ignore[attr-defined]
+
+def touch_course(session: Session, course_id: UUID) -> None:
+    """Bump updated_at when the course's links change, so its ETags change too."""
+    session.exec(update(Course).where(Course.id == course_id).values(updated_at=datetime.now(timezone.utc)))  # type: ignore[call-overload,arg-type]
+
+def add_direct_enrolment(session: Session, course_id: UUID, user_id: UUID) -> None:
+    session.add(UserCourseEffective(user_id=user_id, course_id=course_id, source=EnrolmentSource.DIRECT))
+    touch_course(session, course_id)
+
+def remove_direct_enrolment(session: Session, course_id: UUID, user_id: UUID) -> None:
+    session.exec(delete(UserCourseEffective).where(
+        UserCourseEffective.user_id == user_id,
+        UserCourseEffective.course_id == course_id,
+        UserCourseEffective.source == EnrolmentSource.DIRECT,
+    ))  # type: ignore[call-overload]
+    touch_course(session, course_id)
+
+def add_role_enrolments(session: Session, course_id: UUID, role_id: UUID) -> None:
+    """Enrol every current holder of `role_id` in `course_id`."""
+    holders = select(User.id, literal(course_id), _source(EnrolmentSource.ROLE)).where(User.role_id == role_id)
+    session.exec(insert(UserCourseEffective).from_select(["user_id", "course_id", "source"], holders))  # type: ignore[call-overload]
+    touch_course(session, course_id)
+
+def remove_role_enrolments(session: Session, course_id: UUID, role_id: UUID) -> None:
+    session.exec(delete(UserCourseEffective).where(
+        UserCourseEffective.course_id == course_id,
+        UserCourseEffective.source == EnrolmentSource.ROLE,
+        UserCourseEffective.user_id.in_(select(User.id).where(User.role_id == role_id)),  # type: ignore[attr-defined]
+    ))  # type: ignore[call-overload]
+    touch_course(session, course_id)
+
+def remove_role_holder_enrolments(session: Session, role_id: UUID) -> None:
+    """Drop what the holders of `role_id` got through it, before the role is
+    deleted (which clears their role_id and its course links)."""
+    session.exec(delete(UserCourseEffective).where(
+        UserCourseEffective.source == EnrolmentSource.ROLE,
+        UserCourseEffective.user_id.in_(select(User.id).where(User.role_id == role_id)),  # type: ignore[attr-defined]
+    ))  # type: ignore[call-overload]
+    courses = select(CourseRoleLink.course_id).where(CourseRoleLink.role_id == role_id)
+    session.exec(update(Course).where(Course.id.in_(courses)).values(updated_at=datetime.now(timezone.utc)))  # type: ignore[call-overload,attr-defined,arg-type]
+
+def set_user_role_enrolments(session: Session, user_id: UUID, role_id: UUID | None) -> None:
+    """Replace the user's role-derived enrolments with those of `role_id`."""
+    session.exec(delete(UserCourseEffective).where(
+        UserCourseEffective.user_id == user_id,
+        UserCourseEffective.source == EnrolmentSource.ROLE,
+    ))  # type: ignore[call-overload]
+    if role_id is not None:
+        courses = select(literal(user_id), CourseRoleLink.course_id, _source(EnrolmentSource.ROLE)).where(
+            CourseRoleLink.role_id == role_id
+        )
+        session.exec(insert(UserCourseEffective).from_select(["user_id", "course_id", "source"], courses))  # type: ignore[call-overload]
+
+def remove_user_enrolments(session: Session, user_id: UUID) -> None:
+    session.exec(delete(UserCourseEffective).where(UserCourseEffective.user_id == user_id))  # type: ignore[call-overload]
+
+def remove_course_enrolments(session: Session, course_id: UUID) -> None:
+    session.exec(delete(UserCourseEffective).where(UserCourseEffective.course_id == course_id))  # type: ignore[call-overload]
+
+def rebuild_effective_enrolments(session: Session) -> int:
+    """Recompute user_course_effective from the link tables; returns the row count."""
+    columns = ["user_id", "course_id", "source"]
+    session.exec(delete(UserCourseEffective))  # type: ignore[call-overload]
+    session.exec(insert(UserCourseEffective).from_select(columns, select(
+        CourseUserLink.user_id, CourseUserLink.course_id, _source(EnrolmentSource.DIRECT)
+    )))  # type: ignore[call-overload]
+    session.exec(insert(UserCourseEffective).from_select(columns, select(
+        User.id, CourseRoleLink.course_id, _source(EnrolmentSource.ROLE)
+    ).join(CourseRoleLink, CourseRoleLink.role_id == User.role_id)))  # type: ignore[call-overload,arg-type]
+    session.commit()
+    return session.exec(select(func.count()).select_from(UserCourseEffective)).one()
+
+
+# ===========================
+#  BULK ENROLMENT
+# ===========================
+# Each list is checked with one IN query that also tells which ids are already
+# linked to the course; the new links go in as one executemany INSERT per table
+# and everything is committed once.
+
+def _insert_rows(session: Session, model: Any, rows: list[dict[str, Any]]) -> None:
+    # One cached statement for any number of rows; a multi-row .values() would
+    # be compiled from scratch every time, which costs more than the INSERT itself
+    if rows:
+        session.execute(insert(model), rows)
+
+def _link_states(
+    session: Session, target: Any, link_model: Any, link_key: Any, course_id: UUID, ids: list[UUID]
+) -> dict[UUID, bool]:
+    """Whether each existing id in `ids` is linked to the course; unknown ids are left out."""
+    if not ids:
+        return {}
+    stmt = (
+        select(target.id, link_key.is_not(None))
+        .outerjoin(link_model, and_(link_key == target.id, link_model.course_id == course_id))
+        .where(target.id.in_(ids))
+    )
+    return dict(session.exec(stmt).all())  # type: ignore[arg-type]
+
+def _report(
+    ids: list[UUID], linked: dict[UUID, bool], when_linked: EnrolmentOutcome, when_unlinked: EnrolmentOutcome
+) -> list[EnrolmentResult]:
+    return [
+        EnrolmentResult(
+            id=id_,
+            outcome=EnrolmentOutcome.NOT_FOUND if id_ not in linked
+            else when_linked if linked[id_] else when_unlinked,
+        )
+        for id_ in ids
+    ]
+
+def _assign_users(session: Session, course_id: UUID, user_ids: list[UUID]) -> None:
+    _insert_rows(session, CourseUserLink, [
+        {"course_id": course_id, "user_id": id_, "status": CourseStatusEnum.ASSIGNED, "attempt_count": 0}
+        for id_ in user_ids
+    ])
+    _insert_rows(session, UserCourseEffective, [
+        {"user_id": id_, "course_id": course_id, "source": EnrolmentSource.DIRECT} for id_ in user_ids
+    ])
+
+def bulk_enrol(
+    session: Session, course_id: UUID, user_ids: list[UUID], role_ids: list[UUID]
+) -> BulkEnrolmentReport:
+    """Link the given users and roles to the course, skipping existing links."""
+    user_ids, role_ids = list(dict.fromkeys(user_ids)), list(dict.fromkeys(role_ids))
+    users = _link_states(session, User, CourseUserLink, CourseUserLink.user_id, course_id, user_ids)
+    roles = _link_states(session, Role, CourseRoleLink, CourseRoleLink.role_id, course_id, role_ids)
+    new_users = [id_ for id_, linked in users.items() if not linked]
+    new_roles = [id_ for id_, linked in roles.items() if not linked]
+
+    _assign_users(session, course_id, new_users)
+    _insert_rows(session, CourseRoleLink, [{"course_id": course_id, "role_id": id_} for id_ in new_roles])
+    if new_roles:
+        holders = select(User.id, literal(course_id), _source(EnrolmentSource.ROLE)).where(
+            User.role_id.in_(new_roles)  # type: ignore[union-attr]
+        )
+        session.exec(insert(UserCourseEffective).from_select(["user_id", "course_id", "source"], holders))  # type: ignore[call-overload]
+    if new_users or new_roles:
+        touch_course(session, course_id)
+    session.commit()
+    course_detail_cache.invalidate(course_id)
+    return BulkEnrolmentReport(
+        course_id=course_id,
+        users=_report(user_ids, users, EnrolmentOutcome.ALREADY_ASSIGNED, EnrolmentOutcome.ASSIGNED),
+        roles=_report(role_ids, roles, EnrolmentOutcome.ALREADY_ASSIGNED, EnrolmentOutcome.ASSIGNED),
+    )
+
+def bulk_unenrol(
+    session: Session, course_id: UUID, user_ids: list[UUID], role_ids: list[UUID]
+) -> BulkEnrolmentReport:
+    """Remove the given users' and roles' links to the course."""
+    user_ids, role_ids = list(dict.fromkeys(user_ids)), list(dict.fromkeys(role_ids))
+    users = _link_states(session, User, CourseUserLink, CourseUserLink.user_id, course_id, user_ids)
+    roles = _link_states(session, Role, CourseRoleLink, CourseRoleLink.role_id, course_id, role_ids)
+    linked_users = [id_ for id_, linked in users.items() if linked]
+    linked_roles = [id_ for id_, linked in roles.items() if linked]
+
+    if linked_users:
+        session.exec(delete(CourseUserLink).where(
+            CourseUserLink.course_id == course_id, CourseUserLink.user_id.in_(linked_users)  # type: ignore[attr-defined]
+        ))  # type: ignore[call-overload]
+        session.exec(delete(UserCourseEffective).where(
+            UserCourseEffective.course_id == course_id,
+            UserCourseEffective.source == EnrolmentSource.DIRECT,
+            UserCourseEffective.user_id.in_(linked_users),  # type: ignore[attr-defined]
+        ))  # type: ignore[call-overload]
+    if linked_roles:
+        session.exec(delete(CourseRoleLink).where(
+            CourseRoleLink.course_id == course_id, CourseRoleLink.role_id.in_(linked_roles)  # type: ignore[attr-defined]
+        ))  # type: ignore[call-overload]
+        session.exec(delete(UserCourseEffective).where(
+            UserCourseEffective.course_id == course_id,
+            UserCourseEffective.source == EnrolmentSource.ROLE,
+            UserCourseEffective.user_id.in_(select(User.id).where(User.role_id.in_(linked_roles))),  # type: ignore[attr-defined,union-attr]
+        ))  # type: ignore[call-overload]
+    if linked_users or linked_roles:
+        touch_course(session, course_id)
+    session.commit()
+    course_detail_cache.invalidate(course_id)
+    return BulkEnrolmentReport(
+        course_id=course_id,
+        users=_report(user_ids, users, EnrolmentOutcome.REMOVED, EnrolmentOutcome.NOT_ASSIGNED),
+        roles=_report(role_ids, roles, EnrolmentOutcome.REMOVED, EnrolmentOutcome.NOT_ASSIGNED),
+    )
+
+
+IMPORT_BATCH = 1000
+
+def import_enrolments(
+    session: Session,
+    course_id: UUID,
+    rows: Iterable[tuple[int, str, str]],
+    reject: Callable[[int, str, str, str], Any],
+) -> EnrolmentImportReport:
+    """Assign the users named by `rows` of (line, employee id, email) to the course.
+
+    A row is matched on its employee id (User.user_id) when it has one, else on
+    its email. Rows are consumed IMPORT_BATCH at a time, so memory stays flat
+    however long the input; unmatched rows go to `reject(line, user_id, email, reason)`.
+    """
+    report = EnrolmentImportReport(course_id=course_id)
+    batch: list[tuple[int, str, str]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == IMPORT_BATCH:
+            _import_batch(session, course_id, batch, report, reject)
+            batch.clear()
+    if batch:
+        _import_batch(session, course_id, batch, report, reject)
+    if report.assigned:
+        touch_course(session, course_id)
+    session.commit()
+    course_detail_cache.invalidate(course_id)
+    return report
+
+def _import_batch(
+    session: Session,
+    course_id: UUID,
+    batch: list[tuple[int, str, str]],
+    report: EnrolmentImportReport,
+    reject: Callable[[int, str, str, str], Any],
+) -> None:
+    employee_ids = {user_id for _, user_id, _ in batch if user_id}
+    emails = {email for _, user_id, email in batch if email and not user_id}
+    # One query resolves the whole batch and tells who is already on the course
+    stmt = (
+        select(User.id, User.user_id, User.email, CourseUserLink.user_id.is_not(None))  # type: ignore[union-attr]
+        .outerjoin(CourseUserLink, and_(CourseUserLink.user_id == User.id, CourseUserLink.course_id == course_id))
+        .where(or_(User.user_id.in_(employee_ids), User.email.in_(emails)))  # type: ignore[union-attr,attr-defined]
+    )
+    by_employee_id: dict[str, list[tuple[UUID, bool]]] = {}
+    by_email: dict[str, tuple[UUID, bool]] = {}
+    for id_, employee_id, email, linked in session.exec(stmt):
+        by_employee_id.setdefault(employee_id, []).append((id_, linked))
+        by_email[email] = (id_, linked)
+
+    new: dict[UUID, None] = {}
+    already = rejected = 0
+    for line, user_id, email in batch:
+        if user_id:
+            matches = by_employee_id.get(user_id, [])
+            reason = "no user with this employee id" if not matches else "employee id shared by several users"
+        elif email:
+            matches = [by_email[email]] if email in by_email else []
+            reason = "no user with this email"
+        else:
+            matches, reason = [], "no employee id or email"
+        if len(matches) != 1:
+            rejected += 1
+            reject(line, user_id, email, reason)
+            continue
+        id_, linked = matches[0]
+        if linked or id_ in new:
+            already += 1
+        else:
+            new[id_] = None
+    # Tallied in locals: attribute writes on the model are validated, per row that adds up
+    report.rows += len(batch)
+    report.assigned += len(new)
+    report.already_assigned += already
+    report.rejected += rejected
+    _assign_users(session, course_id, list(new))
+
+
+# ===========================
+#  COURSE MATERIALS
+# ===========================
+# Row-level: attaching or detaching a file touches its course_material row, its
+# material_blob row and the course's updated_at (which the detailed ETag covers).
+
+def get_course_materials(session: Session, course_id: UUID) -> Sequence[CourseMaterial]:
+    stmt = (
+        select(CourseMaterial)
+        .where(CourseMaterial.course_id == course_id)
+        .order_by(CourseMaterial.position, CourseMaterial.created_at)  # type: ignore[arg-type]
+    )
+    return session.exec(stmt).all()
+
+def course_material_bytes(session: Session, course_id: UUID, excluding: Sequence[str] = ()) -> int:
+    """Recorded size of a course's materials, leaving out the names in `excluding`."""
+    stmt = select(func.coalesce(func.sum(CourseMaterial.size), 0)).where(CourseMaterial.course_id == course_id)
+    if excluding:
+        stmt = stmt.where(CourseMaterial.stored_name.not_in(excluding))  # type: ignore[attr-defined]
+    return session.exec(stmt).one()
+
+def add_course_materials(session: Session, course_id: UUID, stored: Sequence[uploads.StoredUpload]) -> list[str]:
+    """Attach uploads after the course's other materials and reference their
+    blobs. Names the course already has are skipped; returns the added ones."""
+    new = {upload.name: upload for upload in stored}
+    if new:
+        existing = session.exec(
+            select(CourseMaterial.stored_name).where(
+                CourseMaterial.course_id == course_id, CourseMaterial.stored_name.in_(new)  # type: ignore[attr-defined]
+            )
+        ).all()
+        for name in existing:
+            del new[name]
+    if not new:
+        return []
+    last = session.exec(select(func.max(CourseMaterial.position)).where(CourseMaterial.course_id == course_id)).one()
+    now = datetime.now(timezone.utc)
+    _insert_rows(session, CourseMaterial, [
+        {
+            "id": uuid4(),
+            "course_id": course_id,
+            "stored_name": upload.name,
+            "original_name": uploads.display_name(upload.name),
+            "size": upload.size,
+            "mime": upload.mime,
+            "sha256": upload.sha256,
+            "position": (-1 if last is None else last) + 1 + i,
+            "created_at": now,
+        }
+        for i, upload in enumerate(new.values())
+    ])
+    add_blob_refs(session, list(new.values()))
+    touch_course(session, course_id)
+    return list(new)
+
+def remove_course_materials(session: Session, course_id: UUID, names: Sequence[str]) -> list[str]:
+    """Detach materials by name and release their blobs; returns the names the
+    course had. Pass them to collect_blobs once committed."""
+    if not names:
+        return []
+    removed = session.exec(
+        delete(CourseMaterial)
+        .where(CourseMaterial.course_id == course_id, CourseMaterial.stored_name.in_(names))  # type: ignore[attr-defined]
+        .returning(CourseMaterial.stored_name)
+    ).scalars().all()  # type: ignore[call-overload]
+    if removed:
+        release_blob_refs(session, removed)
+        touch_course(session, course_id)
+    return list(removed)
+
+def import_json_materials(session: Session) -> int:
+    """Copy the course.materials JSON lists of databases created before
+    course_material into rows; courses that have rows already are skipped.
+    Returns the number of rows added. The old column is left in place."""
+    if "materials" not in {c["name"] for c in inspect(session.get_bind()).get_columns("course")}:
+        return 0
+    legacy = table("course", column("id", Course.__table__.c.id.type), column("materials", JSON()))  # type: ignore[attr-defined]
+    migrated = select(CourseMaterial.course_id).distinct()
+    courses = session.execute(
+        select(legacy.c.id, legacy.c.materials).where(legacy.c.id.not_in(migrated), legacy.c.materials.is_not(None))
+    ).all()
+    shas = {sha for _, names in courses for sha in map(uploads.blob_sha, names or []) if sha}
+    blobs = {
+        blob.sha256: blob for blob in session.exec(select(MaterialBlob).where(MaterialBlob.sha256.in_(shas)))  # type: ignore[attr-defined]
+    } if shas else {}
+    now = datetime.now(timezone.utc)
+    rows = []
+    for course_id, names in courses:
+        for position, name in enumerate(dict.fromkeys(names or [])):
+            sha = uploads.blob_sha(name)
+            path = uploads.material_path(name)
+            if sha in blobs:
+                size, mime = blobs[sha].size, blobs[sha].mime
+            elif path.is_file():
+                size, mime = path.stat().st_size, uploads.sniff_file(path, name)
+            else:
+                size, mime = 0, "application/octet-stream"
+            rows.append({
+                "id": uuid4(),
+                "course_id": course_id,
+                "stored_name": name,
+                "original_name": LEGACY_MATERIAL_PREFIX.sub("", uploads.display_name(name), count=1),
+                "size": size,
+                "mime": mime,
+                "sha256": sha,
+                "position": position,
+                "created_at": now,
+            })
+    _insert_rows(session, CourseMaterial, rows)
+    session.commit()
+    return len(rows)
+
+
+# ===========================
+#  MATERIAL BLOBS
+# ===========================
+# material_blob counts the course_material rows naming each blob, see
+# app.core.uploads. References change inside the caller's transaction; files
+# are moved into place (uploads.publish) or removed (collect_blobs) after it
+# commits.
+
+LEGACY_MATERIAL_PREFIX = re.compile(r"[0-9a-f]{32}_")
+
+def add_blob_refs(session: Session, stored: Sequence[uploads.StoredUpload]) -> None:
+    """One more reference to each upload's blob, adding the rows of new content."""
+    if not stored:
+        return
+    blobs = MaterialBlob.__table__
+    dialect_insert = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(blobs).on_conflict_do_update(
+        index_elements=[blobs.c.sha256], set_={"refcount": blobs.c.refcount + 1}
+    )
+    session.execute(stmt, [
+        {"sha256": upload.sha256, "size": upload.size, "mime": upload.mime, "refcount": 1} for upload in stored
+    ])
+
+def release_blob_refs(session: Session, names: Iterable[str]) -> None:
+    """One reference less to the blob of each material name leaving a course."""
+    counts = Counter(sha for sha in map(uploads.blob_sha, names) if sha)
+    if not counts:
+        return
+    blobs = MaterialBlob.__table__
+    session.execute(
+        update(blobs)
+        .where(blobs.c.sha256 == bindparam("b_sha256"))
+        .values(refcount=blobs.c.refcount - bindparam("b_count")),
+        [{"b_sha256": sha, "b_count": count} for sha, count in counts.items()],
+    )
+
+def collect_blobs(session: Session, names: Iterable[str]) -> None:
+    """Delete the files of released materials that nothing references anymore.
+    Call once the release is committed."""
+    names = list(names)
+    shas = {sha for sha in map(uploads.blob_sha, names) if sha}
+    # names from before the blob store own their file
+    files = [settings.UPLOAD_DIR / name for name in names if not uploads.blob_sha(name)]
+    with uploads.blob_lock:
+        if shas:
+            # RETURNING: only the rows still unreferenced when the delete runs
+            unreferenced = session.exec(
+                delete(MaterialBlob)
+                .where(MaterialBlob.sha256.in_(shas), MaterialBlob.refcount <= 0)  # type: ignore[attr-defined]
+                .returning(MaterialBlob.sha256)
+            ).scalars().all()  # type: ignore[call-overload]
+            session.commit()
+            files += [
+                path for sha in unreferenced
+                for path in (uploads.blob_path(sha), previews.thumbnail_path(sha), previews.info_path(sha))
+            ]
+        for path in files:
+            path.unlink(missing_ok=True)
+
+def dedup_materials(session: Session) -> dict[str, int]:
+    """Move materials stored before the blob store into blobs and rebuild
+    material_blob from the course_material rows.
+
+    Safe to rerun. Old files are linked (or copied) to their blob before the
+    rows are renamed and only removed after the commit, so an interruption
+    leaves every listed material readable. Run it with the app stopped: blob
+    files no row names, such as an upload's before its commit, are removed.
+    """
+    renamed: dict[str, tuple[str, str, int, str]] = {}  # old name: (new name, sha256, size, mime)
+    created_bytes = missing = 0
+    taken = set(session.exec(
+        select(CourseMaterial.course_id, CourseMaterial.stored_name).where(CourseMaterial.sha256.is_not(None))  # type: ignore[union-attr]
+    ).all())
+    for row in session.exec(select(CourseMaterial).where(CourseMaterial.sha256.is_(None))).all():  # type: ignore[union-attr]
+        if row.stored_name not in renamed:
+            path = settings.UPLOAD_DIR / row.stored_name
+            if not path.is_file():
+                missing += 1
+                continue
+            sha = uploads.file_sha256(path)
+            size = path.stat().st_size
+            if not uploads.blob_path(sha).exists():
+                uploads.link_or_copy(path, uploads.blob_path(sha))
+                created_bytes += size
+            name = f"{sha}_{LEGACY_MATERIAL_PREFIX.sub('', row.stored_name, count=1)}"
+            renamed[row.stored_name] = (name, sha, size, uploads.sniff_file(path, name))
+        name, row.sha256, row.size, row.mime = renamed[row.stored_name]
+        if (row.course_id, name) in taken:  # the course lists the same file twice
+            session.delete(row)
+        else:
+            row.stored_name = name
+            taken.add((row.course_id, name))
+    session.flush()
+
+    stmt = (
+        select(CourseMaterial.sha256, func.count(), func.max(CourseMaterial.mime))
+        .where(CourseMaterial.sha256.is_not(None))  # type: ignore[union-attr]
+        .group_by(CourseMaterial.sha256)
+    )
+    counts = {sha: (count, mime) for sha, count, mime in session.exec(stmt).all()}
+    stored = {sha: uploads.blob_path(sha) for sha in counts if uploads.blob_path(sha).is_file()}
+    session.exec(delete(MaterialBlob))  # type: ignore[call-overload]
+    _insert_rows(session, MaterialBlob, [
+        {"sha256": sha, "size": path.stat().st_size, "mime": counts[sha][1], "refcount": counts[sha][0]}
+        for sha, path in stored.items()
+    ])
+    session.commit()
+
+    for name in renamed:
+        (settings.UPLOAD_DIR / name).unlink(missing_ok=True)
+    # blobs and their previews, "<sha256>" and "<sha256>.<ext>"
+    orphans = [
+        path for path in (settings.UPLOAD_DIR / "blobs").glob("*/*") if path.name.partition(".")[0] not in stored
+    ]
+    for path in orphans:
+        path.unlink()
+    return {
+        "files_moved": len(renamed),
+        "blobs": len(stored),
+        "bytes_saved": sum(size for _, _, size, _ in renamed.values()) - created_bytes,
+        "missing_files": missing,
+        "orphan_blobs_removed": len(orphans),
+    }
+
+
 # ===========================
 #  QUIZ CRUD
 # ===========================
@@ -185,8 +922,10 @@ def get_quiz_by_course_id(session: Session, course_id: UUID) -> Optional[Quiz]:
     stmt = select(Quiz).where(Quiz.course_id == course_id)
     return session.exec(stmt).first()
 
-def get_quizzes(session: Session, skip: int = 0, limit: int = 100) -> Sequence[Quiz]:
-    stmt = select(Quiz).offset(skip).limit(limit)
+def get_quizzes(
+    session: Session, skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> Sequence[Quiz]:
+    stmt = paginate(select(Quiz), Quiz, skip, limit, cursor)
     return session.exec(stmt).all()
 
 def count_quizzes(session: Session) -> int:
@@ -210,6 +949,7 @@ def create_quiz(session: Session, quiz_create: QuizCreate) -> Quiz:
     db_quiz = Quiz.model_validate(quiz_create)
     session.add(db_quiz)
     session.commit()
+    course_detail_cache.invalidate(quiz_create.course_id)
     session.refresh(db_quiz)
     return db_quiz
 
@@ -219,9 +959,13 @@ def update_quiz(session: Session, db_quiz: Quiz, quiz_in: QuizUpdate) -> Quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
     quiz_data = quiz_in.model_dump(exclude_unset=True)
+    course_ids = {db_quiz.course_id, quiz_data.get("course_id", db_quiz.course_id)}
     db_quiz.sqlmodel_update(quiz_data)
+    db_quiz.version += 1
     session.add(db_quiz)
     session.commit()
+    for course_id in course_ids:
+        course_detail_cache.invalidate(course_id)
     session.refresh(db_quiz)
     return db_quiz
 
@@ -231,8 +975,10 @@ def delete_quiz(session: Session, db_quiz: Quiz) -> Quiz:
     if not db_quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
+    course_id = db_quiz.course_id
     session.delete(db_quiz)
     session.commit()
+    course_detail_cache.invalidate(course_id)
     return db_quiz
 
 
@@ -248,7 +994,8 @@ def get_quiz_attempts(
     quiz_id: Optional[UUID] = None,
     user_id: Optional[UUID] = None,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> Sequence[QuizAttempt]:
     """Get quiz attempts with optional filtering by quiz_id and/or user_id."""
     stmt = select(QuizAttempt)
@@ -258,7 +1005,7 @@ def get_quiz_attempts(
     if user_id:
         stmt = stmt.where(QuizAttempt.user_id == user_id)
     
-    stmt = stmt.offset(skip).limit(limit)
+    stmt = paginate(stmt, QuizAttempt, skip, limit, cursor)
     return session.exec(stmt).all()
 
 def count_quiz_attempts(
@@ -303,7 +1050,23 @@ def create_quiz_attempt(
         quiz_id=quiz.id,
         user_id=user.id
     )
+    score = _score_attempt(quiz, attempt_count, answers)
     
+    # Create attempt
+    attempt = QuizAttempt(
+        quiz_id=quiz.id,
+        user_id=user.id,
+        score=score,
+        passed=score >= quiz.passing_threshold,
+        attempt_number=attempt_count + 1
+    )
+    session.add(attempt)
+    session.commit()
+    session.refresh(attempt)
+    return attempt
+
+def _score_attempt(quiz: Quiz, attempt_count: int, answers: List[int]) -> int:
+    """Validate an attempt against the quiz rules and return its score."""
     if attempt_count >= quiz.max_attempts:
         raise HTTPException(
             status_code=400,
@@ -316,15 +1079,45 @@ def create_quiz_attempt(
             status_code=400,
             detail="Number of answers doesn't match number of questions"
         )
-    print(quiz.questions[0]) 
     # Calculate score
     correct_answers = sum(
         1 for i, answer in enumerate(answers)
         if answer == quiz.questions[i].get('correct_index')
     )
-    score = int((correct_answers / len(quiz.questions)) * 100)
+    return int((correct_answers / len(quiz.questions)) * 100)
+
+async def count_quiz_attempts_async(
+    session: AsyncSession,
+    quiz_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    passed: Optional[bool] = None,
+) -> int:
+    """Async variant of count_quiz_attempts, optionally filtered on the passed flag."""
+    stmt = select(func.count()).select_from(QuizAttempt)
     
-    # Create attempt
+    if quiz_id:
+        stmt = stmt.where(QuizAttempt.quiz_id == quiz_id)
+    if user_id:
+        stmt = stmt.where(QuizAttempt.user_id == user_id)
+    if passed is not None:
+        stmt = stmt.where(QuizAttempt.passed == passed)
+    
+    return (await session.exec(stmt)).one()
+
+async def create_quiz_attempt_async(
+    session: AsyncSession,
+    quiz: Quiz,
+    user: User,
+    answers: List[int]
+) -> QuizAttempt:
+    """Async variant of create_quiz_attempt."""
+    attempt_count = await count_quiz_attempts_async(
+        session=session,
+        quiz_id=quiz.id,
+        user_id=user.id
+    )
+    score = _score_attempt(quiz, attempt_count, answers)
+
     attempt = QuizAttempt(
         quiz_id=quiz.id,
         user_id=user.id,
@@ -333,8 +1126,8 @@ def create_quiz_attempt(
         attempt_number=attempt_count + 1
     )
     session.add(attempt)
-    session.commit()
-    session.refresh(attempt)
+    await session.commit()
+    await session.refresh(attempt)
     return attempt
 
 def get_user_quiz_stats(
@@ -559,6 +1352,17 @@ def create_notifications_for_superusers(db: Session, message: str) -> None:
         )
         create_notification(db, notification)
 
+async def get_notifications_async(db: AsyncSession, user_id: UUID) -> Sequence[Notification]:
+    """Async variant of get_notifications."""
+    stmt = select(Notification).where(Notification.user_id == user_id)
+    return (await db.exec(stmt)).all()
+
+async def create_notifications_for_superusers_async(db: AsyncSession, message: str) -> None:
+    """Async variant of create_notifications_for_superusers, committing once."""
+    superuser_ids = (await db.exec(select(User.id).where(User.is_superuser == True))).all()
+    db.add_all([Notification(user_id=user_id, message=message) for user_id in superuser_ids])
+    await db.commit()
+
 def get_all_quiz_attempts(session: Session, skip: int = 0, limit: int = 100) -> List[QuizAttempt]:
     stmt = (
         select(
@@ -1,18 +1,41 @@
-from app.utils import log_request
-from fastapi import FastAPI, Request
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.metrics import http_metrics
+from app.core.previews import preview_queue
+from app.core.security import password_hasher
+from app.core.timing import instrument_serialization
+from app.middleware import AccessLogMiddleware, CompressionMiddleware, setup_access_log
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
+access_log_listener = setup_access_log()
+if settings.REQUEST_TIMING:
+    instrument_serialization()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    access_log_listener.start()
+    yield
+    password_hasher.shutdown()
+    preview_queue.shutdown()
+    # aiosqlite connects on a thread of its own that keeps the process alive
+    await async_engine.dispose()
+    access_log_listener.stop()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 if settings.all_cors_origins:
@@ -22,10 +45,19 @@ if settings.all_cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # the next page's cursor of the bare-list endpoints
+        expose_headers=["X-Next-Cursor"],
     )
 print(app.openapi_url)
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
-@app.middleware("http")
-async def log_middleware(request: Request, call_next):
-    return await log_request(request, call_next)
\ No newline at end of file
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+
+# Outermost: logs the bytes actually sent
+app.add_middleware(
+    AccessLogMiddleware,
+    sample_rate=settings.ACCESS_LOG_SAMPLE_RATE,
+    timing=settings.REQUEST_TIMING,
+    metrics=http_metrics if settings.METRICS_ENABLED else None,
+)
@@ -0,0 +1,262 @@
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import zlib
+from collections.abc import Callable
+from logging.handlers import QueueHandler, QueueListener
+
+import brotli
+import zstandard
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import HttpMetrics
+from app.core.timing import RequestTiming, current_timing
+
+access_logger = logging.getLogger("app.access")
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_access_log() -> QueueListener:
+    """Route app.access records through a bounded queue to a writer thread.
+
+    The caller owns the returned listener: start() it on startup, stop() it on
+    shutdown to flush what is left in the queue.
+    """
+    records: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=settings.ACCESS_LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    access_logger.handlers[:] = [_DroppingQueueHandler(records)]
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    return QueueListener(records, stream)
+
+
+def route_template(scope: Scope) -> str | None:
+    """Path template of the matched route (e.g. /api/v1/courses/{course_id})."""
+    route = scope.get("route")
+    return getattr(route, "path_format", None)
+
+
+class AccessLogMiddleware:
+    """One compact JSON line per request, without ever reading the request body.
+
+    Successful requests are sampled at `sample_rate`; 5xx responses are always logged.
+    With `timing`, the request's DB time, query count and serialization time are
+    added to the line and sent back in a Server-Timing header. With `metrics`,
+    every request (sampled or not) is counted there under its route template.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = 1.0,
+        timing: bool = False,
+        metrics: HttpMetrics | None = None,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.timing = timing
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+        timing = RequestTiming() if self.timing else None
+        token = current_timing.set(timing)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timing is not None:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", timing.server_timing(time.perf_counter() - started)
+                    )
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timing.reset(token)
+            elapsed = time.perf_counter() - started
+            template = route_template(scope)
+            if metrics is not None:
+                metrics.in_flight -= 1
+                metrics.observe(template, scope["method"], status, elapsed)
+            if status >= 500 or random.random() < self.sample_rate:
+                entry = {
+                    "method": scope["method"],
+                    "route": template,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "bytes": size,
+                }
+                if timing is not None:
+                    entry.update(timing.as_log_fields())
+                access_logger.info(json.dumps(entry, separators=(",", ":")))
+
+
+# Response compression. Encoders by server preference, for equal client q
+# values: zstd and brotli at these levels compress JSON better than gzip for
+# less CPU. Each returns (compress(chunk), finish()).
+Encoder = tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+
+def _zstd() -> Encoder:
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return compressor.compress, compressor.flush
+
+
+def _brotli() -> Encoder:
+    compressor = brotli.Compressor(quality=4)
+    return compressor.process, compressor.finish
+
+
+def _gzip() -> Encoder:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip framing
+    return compressor.compress, compressor.flush
+
+
+ENCODERS: dict[str, Callable[[], Encoder]] = {"zstd": _zstd, "br": _brotli, "gzip": _gzip}
+# Anything else (video, PDF, images, archives) is already compressed or not worth it
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+# Chunks from this size are compressed in the threadpool, not on the event loop
+THREADPOOL_CHUNK_BYTES = 256 * 1024
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """The ENCODERS entry the client prefers (highest q, then server order), if any."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    ranked = [
+        (weights.get(coding, weights.get("*", 0.0)), -order, coding) for order, coding in enumerate(ENCODERS)
+    ]
+    q, _, coding = max(ranked)
+    return coding if q > 0 else None
+
+
+def compressible(status: int, headers: Headers) -> bool:
+    # Partial and rangeable responses (material downloads) keep their bytes:
+    # ranges are offsets into the unencoded file
+    return (
+        200 <= status < 300 and status not in (204, 206)
+        and "content-encoding" not in headers
+        and "accept-ranges" not in headers
+        and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+class CompressionMiddleware:
+    """Compresses responses with zstd, br or gzip, as negotiated from Accept-Encoding.
+
+    Bodies under `minimum_size` bytes go out as they are, as do HEAD requests
+    and responses that are not compressible(). The body is compressed chunk by
+    chunk as the app sends it, never buffered whole: only up to `minimum_size`
+    bytes are held back to decide. A compressed response's ETag is made weak,
+    since its bytes depend on the encoding; If-None-Match still matches it.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        held: list[bytes] = []
+        held_size = 0
+        passthrough = False
+        encoder: Encoder | None = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, held_size, passthrough, encoder
+            if message["type"] == "http.response.start":
+                if compressible(message["status"], Headers(raw=message["headers"])):
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                held.append(body)
+                held_size += len(body)
+                if more_body and held_size < self.minimum_size:
+                    return
+                body = b"".join(held)
+                held.clear()
+                assert start is not None
+                if held_size < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body, "more_body": False})
+                    return
+                encoder = ENCODERS[encoding]()
+                headers = MutableHeaders(scope=start)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+
+            compress, finish = encoder
+            out = await run_in_threadpool(compress, body) if len(body) >= THREADPOOL_CHUNK_BYTES else compress(body)
+            if not more_body:
+                out += finish()
+            if start is not None:
+                if not more_body:  # the whole body in one piece: its length is known
+                    MutableHeaders(scope=start)["Content-Length"] = str(len(out))
+                await send(start)
+                start = None
+            if out or not more_body:
+                await send({"type": "http.response.body", "body": out, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
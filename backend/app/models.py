@@ -3,9 +3,8 @@ from datetime import datetime, date, timezone
 from typing import List, Optional
 from enum import Enum
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlmodel import Field, Relationship, SQLModel, Column, JSON, func
-from sqlalchemy.ext.mutable import MutableList
 
 
 # =========================================================
@@ -18,24 +17,65 @@ class CourseStatusEnum(str, Enum):
     FAILED = "failed"
 
 
+class EnrolmentSource(str, Enum):
+    DIRECT = "direct"
+    ROLE = "role"
+
+
+class CourseView(str, Enum):
+    SUMMARY = "summary"
+    DETAILED = "detailed"
+
+class MaterialView(str, Enum):
+    NAMES = "names"
+    DETAILED = "detailed"
+
+class PreviewStatus(str, Enum):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class EnrolmentOutcome(str, Enum):
+    ASSIGNED = "assigned"
+    ALREADY_ASSIGNED = "already_assigned"
+    REMOVED = "removed"
+    NOT_ASSIGNED = "not_assigned"
+    NOT_FOUND = "not_found"
+
+
 # ================================
 # LINK TABLES
 # ================================
 
 class CourseRoleLink(SQLModel, table=True):
     """Junction table linking Courses and Roles (many-to-many)."""
-    course_id: uuid.UUID = Field(foreign_key="course.id", primary_key=True)
-    role_id: uuid.UUID = Field(foreign_key="role.id", primary_key=True)
+    course_id: uuid.UUID = Field(foreign_key="course.id", primary_key=True, ondelete="CASCADE")
+    role_id: uuid.UUID = Field(foreign_key="role.id", primary_key=True, ondelete="CASCADE")
 
 
 class CourseUserLink(SQLModel, table=True):
     """Junction table linking Courses and Users (many-to-many)."""
-    course_id: uuid.UUID = Field(foreign_key="course.id", primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    course_id: uuid.UUID = Field(foreign_key="course.id", primary_key=True, ondelete="CASCADE")
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True, ondelete="CASCADE")
 
     status: CourseStatusEnum = Field(default=CourseStatusEnum.ASSIGNED)
     quiz_score: Optional[int] = None
     attempt_count: int = Field(default=0)
+    # Bumped with status/quiz_score/attempt_count, part of the course ETags.
+    # Links themselves coming and going touch Course.updated_at instead.
+    version: int = Field(default=0)
+
+
+class UserCourseEffective(SQLModel, table=True):
+    """Materialized "which courses can this user see": one row per user, course
+    and source, derived from CourseUserLink (direct) and CourseRoleLink through
+    the user's role (role). Maintained by crud, rebuilt by rebuild_effective_enrolments."""
+    __tablename__ = "user_course_effective"
+
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True, ondelete="CASCADE")
+    course_id: uuid.UUID = Field(foreign_key="course.id", primary_key=True, index=True, ondelete="CASCADE")
+    source: EnrolmentSource = Field(primary_key=True)
 
 
 # ================================
@@ -62,6 +102,8 @@ class RoleUpdate(SQLModel):
 
 class Role(RoleBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Bumped on every update, for ETags
+    version: int = Field(default=0)
     
     # A single Role can have many Users
     users: List["User"] = Relationship(back_populates="role")
@@ -82,7 +124,7 @@ class UserBase(SQLModel):
     is_active: bool = True
     is_superuser: bool = False
     # NOTE: maybe this should be uniqe?
-    user_id: Optional[str] = Field(default=None, max_length=30, description="Employee id")
+    user_id: Optional[str] = Field(default=None, max_length=30, index=True, description="Employee id")
 
 class UserCreate(UserBase):
     password: str
@@ -95,6 +137,8 @@ class UserPublic(UserBase):
 class UsersPublic(SQLModel):
     data: List[UserPublic]
     count: int
+    # Pass back as `cursor` for the next page; None on the last one
+    next_cursor: Optional[str] = None
 
 class UserUpdate(SQLModel):
     name: Optional[str] = None
@@ -113,8 +157,17 @@ class UpdatePassword(SQLModel):
     new_password: str = Field(min_length=8, max_length=40)
 
 class User(UserBase, table=True):
+    # Keyset pagination seeks on (created_at, id), see crud.paginate
+    __table_args__ = (
+        Index("ix_user_created_at_id", "created_at", "id"),
+        Index("ix_user_role_id_created_at_id", "role_id", "created_at", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    # Bumped when role, superuser/active flags or password change; sent as the
+    # `ver` token claim so stale principals can be told apart
+    version: int = Field(default=0)
     notifications: List["Notification"] = Relationship(back_populates="user")
 
     # Single role per user
@@ -156,15 +209,65 @@ class CoursePublic(CourseBase):
 class CoursesPublic(SQLModel):
     data: List[CoursePublic]
     count: int
+    next_cursor: Optional[str] = None
 
 class CourseUpdate(SQLModel):
     title: Optional[str] = None
     description: Optional[str] = None
-    materials: Optional[List[str]] = None
     is_active: Optional[bool] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
 
+class CourseSummary(SQLModel):
+    """Course card without rosters: built from columns, no relationship is loaded."""
+    id: uuid.UUID
+    title: str
+    is_active: bool
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    quiz_id: Optional[uuid.UUID] = None
+    # The caller's own enrolment; None when not enrolled directly (e.g. only via a role)
+    status: Optional[CourseStatusEnum] = None
+
+class CourseSearchHit(SQLModel):
+    """Search result; matched words are wrapped in <mark></mark>."""
+    id: uuid.UUID
+    title: str
+    is_active: bool
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    title_highlight: str
+    description_snippet: Optional[str] = None
+
+class CourseSummariesPublic(SQLModel):
+    data: List[CourseSummary]
+    count: int
+    next_cursor: Optional[str] = None
+
+class BulkEnrolment(SQLModel):
+    # Capped so each list validates in a single IN query
+    user_ids: List[uuid.UUID] = Field(default_factory=list, max_length=5000)
+    role_ids: List[uuid.UUID] = Field(default_factory=list, max_length=5000)
+
+class EnrolmentResult(SQLModel):
+    id: uuid.UUID
+    outcome: EnrolmentOutcome
+
+class BulkEnrolmentReport(SQLModel):
+    """One result per distinct id sent, in request order."""
+    course_id: uuid.UUID
+    users: List[EnrolmentResult] = []
+    roles: List[EnrolmentResult] = []
+
+class EnrolmentImportReport(SQLModel):
+    course_id: uuid.UUID
+    rows: int = 0
+    assigned: int = 0
+    already_assigned: int = 0
+    rejected: int = 0
+    # Set when rows were rejected: a CSV of them with the reason for each
+    rejects_url: Optional[str] = None
+
 class CourseAttachQuiz(SQLModel):
     quiz_id: uuid.UUID
 
@@ -175,8 +278,15 @@ class CourseDetailed(CoursePublic):
     materials: list[str] = []
 
 class Course(CourseBase, table=True):
+    __table_args__ = (Index("ix_course_created_at_id", "created_at", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    materials: list[str] = Field(default_factory=list, sa_column=Column(MutableList.as_mutable(JSON())))
+    materials: List["CourseMaterial"] = Relationship(
+        sa_relationship_kwargs={
+            "order_by": "[CourseMaterial.position, CourseMaterial.created_at]",
+            "passive_deletes": True,
+        }
+    )
     # Many-to-many with Roles
     roles: List[Role] = Relationship(back_populates="courses", link_model=CourseRoleLink)
     # Many-to-many with Users
@@ -202,6 +312,57 @@ class CourseMaterialUpdate(SQLModel):
 class CourseMaterialPublic(SQLModel):
     course_id: uuid.UUID
     materials: List[str]
+
+class CourseMaterialInfo(SQLModel):
+    id: uuid.UUID
+    stored_name: str
+    original_name: str
+    size: int
+    mime: str
+    sha256: Optional[str] = None
+    position: int
+    created_at: datetime
+
+class MaterialPreview(SQLModel):
+    """What a PDF material is, without downloading it; the fields are set once ready."""
+    status: PreviewStatus
+    pages: Optional[int] = None
+    text_length: Optional[int] = None
+    thumbnail_url: Optional[str] = None
+    thumbnail_width: Optional[int] = None
+    thumbnail_height: Optional[int] = None
+
+class CourseMaterial(SQLModel, table=True):
+    """A file attached to a course. stored_name is the name the API uses,
+    "<sha256>_<original name>" (see app.core.uploads); position orders a
+    course's materials, in upload order."""
+    __tablename__ = "course_material"
+    __table_args__ = (
+        UniqueConstraint("course_id", "stored_name", name="uq_course_material_course_id_stored_name"),
+        Index("ix_course_material_course_id_position", "course_id", "position"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    course_id: uuid.UUID = Field(foreign_key="course.id", ondelete="CASCADE")
+    stored_name: str = Field(max_length=512)
+    original_name: str = Field(max_length=255)
+    size: int
+    mime: str = Field(max_length=255)
+    # None for files stored before the blob store, until dedup-materials
+    sha256: Optional[str] = Field(default=None, max_length=64, index=True)
+    position: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class MaterialBlob(SQLModel, table=True):
+    """A material file stored once per content, see app.core.uploads.
+    refcount is the number of course_material rows naming it."""
+    __tablename__ = "material_blob"
+
+    sha256: str = Field(primary_key=True, max_length=64)
+    size: int
+    mime: str = Field(default="application/octet-stream", max_length=255)  # sniffed at upload
+    refcount: int = Field(default=0)
+
 # ================================
 # QUIZ MODELS
 # ================================
@@ -226,6 +387,7 @@ class QuizPublic(QuizBase):
 class QuizzesPublic(SQLModel):
     data: List[QuizPublic]
     count: int
+    next_cursor: Optional[str] = None
 
 class QuizUpdate(SQLModel):
     max_attempts: Optional[int] = None
@@ -234,6 +396,8 @@ class QuizUpdate(SQLModel):
     course_id: Optional[uuid.UUID] = None
     
 class Quiz(QuizBase, table=True):
+    __table_args__ = (Index("ix_quiz_created_at_id", "created_at", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     
     # Relationship back to the Course model
@@ -245,8 +409,15 @@ class Quiz(QuizBase, table=True):
         )
     )
     course: Course = Relationship(back_populates="quiz")
-    # Relationship to track user attempts
-    attempts: List["QuizAttempt"] = Relationship(back_populates="quiz")
+    # Relationship to track user attempts, removed by the database with the quiz
+    attempts: List["QuizAttempt"] = Relationship(
+        back_populates="quiz",
+        sa_relationship_kwargs={"passive_deletes": True}
+    )
+    # Bumped on every update, for ETags
+    version: int = Field(default=0)
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # ================================
 # QUIZ ATTEMPT MODELS
@@ -280,6 +451,7 @@ class QuizAttemptPublic(QuizAttemptBase):
 class QuizAttemptsPublic(SQLModel):
     data: List[QuizAttemptPublic]
     count: int
+    next_cursor: Optional[str] = None
 
 class QuizAttemptUpdate(SQLModel):
     score: Optional[int] = None
@@ -287,9 +459,19 @@ class QuizAttemptUpdate(SQLModel):
     passed: Optional[bool] = None
 
 class QuizAttempt(QuizAttemptBase, table=True):
+    __table_args__ = (
+        Index("ix_quizattempt_created_at_id", "created_at", "id"),
+        Index("ix_quizattempt_quiz_id_created_at_id", "quiz_id", "created_at", "id"),
+        Index("ix_quizattempt_user_id_created_at_id", "user_id", "created_at", "id"),
+        # a user's attempts at a quiz in order, and the best-and-latest checks of
+        # get_all_quiz_attempts: one seek each for a better and for a later attempt
+        Index("ix_quizattempt_quiz_id_user_id_created_at_id", "quiz_id", "user_id", "created_at", "id"),
+        Index("ix_quizattempt_quiz_id_user_id_score_created_at", "quiz_id", "user_id", "score", "created_at"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
 
-    quiz_id: uuid.UUID = Field(foreign_key="quiz.id")
+    quiz_id: uuid.UUID = Field(foreign_key="quiz.id", ondelete="CASCADE")
     quiz: Quiz = Relationship(back_populates="attempts")
 
     user_id: uuid.UUID = Field(foreign_key="user.id")
@@ -311,10 +493,20 @@ class QuizAttempt(QuizAttemptBase, table=True):
 
 class Token(SQLModel):
     access_token: str
+    refresh_token: str | None = None
     token_type: str = "bearer"
 
+class TokenRefresh(SQLModel):
+    refresh_token: str
+
 class TokenPayload(SQLModel):
     sub: str | None = None
+    type: str | None = None
+    # Authorization claims, only present on access tokens
+    is_superuser: bool = False
+    role_id: uuid.UUID | None = None
+    # User.version when issued, on refresh tokens too
+    ver: int = 0
 
 class NewPassword(SQLModel):
     token: str
@@ -0,0 +1,799 @@
+import asyncio
+import hashlib
+import io
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core import uploads
+from app.core.cache import course_detail_cache
+from app.core.config import settings
+from app.core.previews import preview_queue
+from app.models import (
+    CourseCreate,
+    CourseRoleLink,
+    CourseUpdate,
+    CourseMaterial,
+    CourseUserLink,
+    MaterialBlob,
+    Quiz,
+    QuizAttempt,
+    QuizCreate,
+    RoleCreate,
+    UserCourseEffective,
+)
+from app.tests.utils.course import create_random_course
+from app.tests.utils.user import create_random_learner, user_authentication_headers
+from app.tests.utils.utils import count_queries, random_lower_string
+
+# courses (+ quiz joined), roles, users, materials
+COURSE_DETAIL_QUERIES = 4
+
+
+@pytest.fixture
+def upload_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Materials written by a test go to a directory of its own, never the real UPLOAD_DIR."""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+def test_get_user_courses(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    user, password = create_random_learner(db)
+    r = client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/assign-user/{user.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+    r = client.get(f"{settings.API_V1_STR}/courses/me", headers=headers)
+    assert r.status_code == 200
+    courses = r.json()
+    assert [c["id"] for c in courses] == [str(course.id)]
+    assert [u["id"] for u in courses[0]["users"]] == [str(user.id)]
+
+
+def test_effective_enrolments(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    role = crud.create_role(db, role_in=RoleCreate(name=random_lower_string()))
+    other_role = crud.create_role(db, role_in=RoleCreate(name=random_lower_string()))
+    by_role, direct = create_random_course(db), create_random_course(db)
+    nurse, password = create_random_learner(db, role_id=role.id)
+    headers = user_authentication_headers(client=client, email=nurse.email, password=password)
+    api = f"{settings.API_V1_STR}/courses"
+
+    def my_courses() -> set[str]:
+        r = client.get(f"{api}/me?view=summary", headers=headers)
+        assert r.status_code == 200
+        return {c["id"] for c in r.json()}
+
+    client.post(f"{api}/{by_role.id}/assign-role/{role.id}", headers=superuser_token_headers)
+    client.post(f"{api}/{direct.id}/assign-user/{nurse.id}", headers=superuser_token_headers)
+    # enrolled both ways: listed once
+    client.post(f"{api}/{by_role.id}/assign-user/{nurse.id}", headers=superuser_token_headers)
+    assert my_courses() == {str(by_role.id), str(direct.id)}
+
+    client.delete(f"{api}/{by_role.id}/remove-user/{nurse.id}", headers=superuser_token_headers)
+    client.delete(f"{api}/{direct.id}/remove-user/{nurse.id}", headers=superuser_token_headers)
+    assert my_courses() == {str(by_role.id)}
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{nurse.id}",
+        headers=superuser_token_headers,
+        json={"role_id": str(other_role.id)},
+    )
+    assert r.status_code == 200
+    assert my_courses() == set()
+
+    client.post(f"{api}/{direct.id}/assign-role/{other_role.id}", headers=superuser_token_headers)
+    assert my_courses() == {str(direct.id)}
+    client.delete(f"{api}/{direct.id}/remove-role/{other_role.id}", headers=superuser_token_headers)
+    assert my_courses() == set()
+
+    def effective_rows() -> set[tuple]:
+        db.expire_all()
+        rows = db.exec(select(UserCourseEffective)).all()
+        return {(row.user_id, row.course_id, row.source) for row in rows}
+
+    maintained = effective_rows()
+    crud.rebuild_effective_enrolments(db)
+    assert effective_rows() == maintained
+
+
+def test_delete_role_removes_its_enrolments(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    role = crud.create_role(db, role_in=RoleCreate(name=random_lower_string()))
+    by_role, direct = create_random_course(db), create_random_course(db)
+    nurse, password = create_random_learner(db, role_id=role.id)
+    headers = user_authentication_headers(client=client, email=nurse.email, password=password)
+    api = f"{settings.API_V1_STR}/courses"
+    client.post(f"{api}/{by_role.id}/assign-role/{role.id}", headers=superuser_token_headers)
+    client.post(f"{api}/{direct.id}/assign-user/{nurse.id}", headers=superuser_token_headers)
+
+    r = client.delete(f"{settings.API_V1_STR}/roles/{role.id}", headers=superuser_token_headers)
+    assert r.status_code == 200
+    r = client.get(f"{api}/me?view=summary", headers=headers)
+    assert r.status_code == 200
+    assert {c["id"] for c in r.json()} == {str(direct.id)}
+
+
+def test_get_user_courses_query_budget(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user, password = create_random_learner(db)
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+
+    def assign_courses(n: int) -> None:
+        for _ in range(n):
+            course = create_random_course(db)
+            crud.create_quiz(session=db, quiz_create=QuizCreate(course_id=course.id, questions=[]))
+            r = client.post(
+                f"{settings.API_V1_STR}/courses/{course.id}/assign-user/{user.id}",
+                headers=superuser_token_headers,
+            )
+            assert r.status_code == 200
+
+    assign_courses(1)
+    # warm the principal cache so only the endpoint's own queries are counted
+    client.get(f"{settings.API_V1_STR}/courses/me", headers=headers)
+    with count_queries() as few:
+        r = client.get(f"{settings.API_V1_STR}/courses/me", headers=headers)
+    assert len(r.json()) == 1
+
+    assign_courses(10)
+    with count_queries() as many:
+        r = client.get(f"{settings.API_V1_STR}/courses/me", headers=headers)
+    courses = r.json()
+    assert len(courses) == 11
+    assert all(c["quiz"] and c["users"][0]["id"] == str(user.id) for c in courses)
+    assert len(few) == len(many) == COURSE_DETAIL_QUERIES
+
+
+def test_read_course_query_budget(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    for _ in range(5):
+        user, _ = create_random_learner(db)
+        client.post(
+            f"{settings.API_V1_STR}/courses/{course.id}/assign-user/{user.id}",
+            headers=superuser_token_headers,
+        )
+    client.get(f"{settings.API_V1_STR}/courses/{course.id}", headers=superuser_token_headers)
+    course_detail_cache.invalidate(course.id)
+    with count_queries() as statements:
+        r = client.get(f"{settings.API_V1_STR}/courses/{course.id}", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert len(r.json()["users"]) == 5
+    assert len(statements) == COURSE_DETAIL_QUERIES
+
+
+def test_course_detail_cache(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, upload_dir: Path
+) -> None:
+    course = create_random_course(db)
+    user, _ = create_random_learner(db)
+    url = f"{settings.API_V1_STR}/courses/{course.id}"
+    first = client.get(url, headers=superuser_token_headers)
+    hits = course_detail_cache.hits
+    with count_queries() as statements:
+        cached = client.get(url, headers=superuser_token_headers)
+    assert course_detail_cache.hits == hits + 1
+    assert not statements
+    assert cached.json() == first.json()
+    assert cached.headers["etag"] == first.headers["etag"]
+
+    writes = [
+        ("PATCH", url, {"json": {"description": "changed"}}),
+        ("POST", f"{url}/assign-user/{user.id}", {}),
+        ("POST", f"{settings.API_V1_STR}/quizzes/", {"json": {"course_id": str(course.id), "questions": []}}),
+        ("POST", f"{url}/materials/", {"files": {"files": ("notes.pdf", b"%PDF-1.4", "application/pdf")}}),
+        ("DELETE", f"{url}/remove-user/{user.id}", {}),
+    ]
+    for method, write_url, kwargs in writes:
+        r = client.request(method, write_url, headers=superuser_token_headers, **kwargs)
+        assert r.status_code == 200, (write_url, r.text)
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.headers["etag"] != first.headers["etag"], write_url
+        first = r
+    body = r.json()
+    assert body["description"] == "changed" and body["quiz"] and len(body["materials"]) == 1
+    assert body["users"] == []
+
+    client.delete(url, headers=superuser_token_headers)
+    assert client.get(url, headers=superuser_token_headers).status_code == 404
+
+    r = client.get(f"{settings.API_V1_STR}/utils/cache-stats/", headers=superuser_token_headers)
+    assert r.json()["course_detail"]["hits"] >= 1
+
+
+def test_course_detail_cache_follows_roster_users(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    admin_renamed, _ = create_random_learner(db)
+    self_renamed, password = create_random_learner(db)
+    self_deleted, self_deleted_password = create_random_learner(db)
+    crud.bulk_enrol(db, course.id, [admin_renamed.id, self_renamed.id, self_deleted.id], [])
+    url = f"{settings.API_V1_STR}/courses/{course.id}"
+    users = f"{settings.API_V1_STR}/users"
+    self_headers = user_authentication_headers(client=client, email=self_renamed.email, password=password)
+    deleted_headers = user_authentication_headers(
+        client=client, email=self_deleted.email, password=self_deleted_password
+    )
+
+    writes = [
+        ("PATCH", f"{users}/{admin_renamed.id}", superuser_token_headers, {"json": {"name": "Renamed By Admin"}}),
+        ("PATCH", f"{users}/me", self_headers, {"json": {"name": "Renamed Themselves"}}),
+        ("DELETE", f"{users}/me", deleted_headers, {}),
+        ("DELETE", f"{users}/{admin_renamed.id}", superuser_token_headers, {}),
+    ]
+    for method, write_url, headers, kwargs in writes:
+        etag = client.get(url, headers=superuser_token_headers).headers["etag"]
+        r = client.request(method, write_url, headers=headers, **kwargs)
+        assert r.status_code == 200, (write_url, r.text)
+        r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+        assert r.status_code == 200, (method, write_url)
+    assert [user["name"] for user in r.json()["users"]] == ["Renamed Themselves"]
+
+
+def test_delete_course(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    role = crud.create_role(db, role_in=RoleCreate(name=random_lower_string()))
+    user, _ = create_random_learner(db, role_id=role.id)
+
+    def populated_course() -> uuid.UUID:
+        course = create_random_course(db)
+        quiz = crud.create_quiz(session=db, quiz_create=QuizCreate(course_id=course.id, questions=[]))
+        crud.bulk_enrol(db, course.id, [user.id], [role.id])
+        for number in range(1, 4):
+            db.add(QuizAttempt(quiz_id=quiz.id, user_id=user.id, score=50, attempt_number=number, passed=False))
+        db.commit()
+        return course.id
+
+    def leftovers(course_id: uuid.UUID) -> list[object]:
+        db.expire_all()
+        return [
+            *db.exec(select(Quiz).where(Quiz.course_id == course_id)).all(),
+            *db.exec(select(QuizAttempt).join(Quiz).where(Quiz.course_id == course_id)).all(),
+            *db.exec(select(CourseUserLink).where(CourseUserLink.course_id == course_id)).all(),
+            *db.exec(select(CourseRoleLink).where(CourseRoleLink.course_id == course_id)).all(),
+            *db.exec(select(UserCourseEffective).where(UserCourseEffective.course_id == course_id)).all(),
+        ]
+
+    course_id = populated_course()
+    with count_queries() as statements:
+        r = client.delete(f"{settings.API_V1_STR}/courses/{course_id}", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert len(statements) <= 8
+    assert not leftovers(course_id) and not crud.get_course_by_id(db, course_id)
+    assert not db.exec(select(QuizAttempt).where(QuizAttempt.user_id == user.id)).all()
+
+    # TestClient runs background tasks before returning the response
+    course_id = populated_course()
+    r = client.delete(f"{settings.API_V1_STR}/courses/{course_id}?background=true", headers=superuser_token_headers)
+    assert r.status_code == 202
+    assert not leftovers(course_id) and not crud.get_course_by_id(db, course_id)
+
+    r = client.delete(f"{settings.API_V1_STR}/courses/{course_id}", headers=superuser_token_headers)
+    assert r.status_code == 404
+
+
+def test_upload_materials(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, upload_dir: Path
+) -> None:
+    course = create_random_course(db)
+    url = f"{settings.API_V1_STR}/courses/{course.id}/materials/"
+    video = b"\x00\x01" * 3000
+
+    with patch("app.core.config.settings.UPLOAD_CHUNK_BYTES", 1000):
+        r = client.post(url, headers=superuser_token_headers, files=[
+            ("files", ("../../intro.mp4", video, "video/mp4")),
+            ("files", ("notes.pdf", b"%PDF-1.4", "application/pdf")),
+        ])
+    assert r.status_code == 200
+    names = client.get(url, headers=superuser_token_headers).json()[-2:]
+    assert names[0].endswith("_intro.mp4") and "/" not in names[0]
+    assert uploads.material_path(names[0]).read_bytes() == video
+    assert not list(settings.UPLOAD_DIR.glob(".*.part"))
+
+    # the notes.pdf preview writes its .json in the background
+    for _ in range(300):
+        if not preview_queue.pending:
+            break
+        time.sleep(0.1)
+    before = set(settings.UPLOAD_DIR.rglob("*"))
+    with patch("app.core.config.settings.UPLOAD_MAX_FILE_BYTES", 1000):
+        r = client.post(url, headers=superuser_token_headers, files={"files": ("big.mp4", video, "video/mp4")})
+    assert r.status_code == 413
+    with patch("app.core.config.settings.UPLOAD_MAX_COURSE_BYTES", len(video) + 100):
+        r = client.post(url, headers=superuser_token_headers, files={"files": ("more.mp4", video, "video/mp4")})
+    assert r.status_code == 413
+    assert set(settings.UPLOAD_DIR.rglob("*")) == before
+    assert len(client.get(url, headers=superuser_token_headers).json()) == 2
+
+    with count_queries() as statements:
+        r = client.get(f"{url}?view=detailed", headers=superuser_token_headers)
+    assert len(statements) == 1
+    assert [(m["stored_name"], m["original_name"], m["size"], m["mime"], m["position"]) for m in r.json()] == [
+        (names[0], "intro.mp4", len(video), "application/octet-stream", 0),
+        (names[1], "notes.pdf", 8, "application/pdf", 1),
+    ]
+    assert r.json()[0]["sha256"] == hashlib.sha256(video).hexdigest()
+    crud.delete_course(db, course.id)
+
+
+def test_store_upload_hashes_while_streaming(upload_dir: Path) -> None:
+    data = bytes(range(256)) * 5000
+    stored = asyncio.run(uploads.store_upload(UploadFile(io.BytesIO(data), filename="a.bin"), len(data)))
+    assert (stored.size, stored.sha256) == (len(data), hashlib.sha256(data).hexdigest())
+    uploads.discard([stored])
+
+
+def test_materials_share_blobs(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, upload_dir: Path
+) -> None:
+    courses = [create_random_course(db), create_random_course(db)]
+    data = random_lower_string().encode() * 100
+    for course in courses:
+        r = client.post(
+            f"{settings.API_V1_STR}/courses/{course.id}/materials/",
+            headers=superuser_token_headers,
+            files=[("files", ("slides.pdf", data, "application/pdf")), ("files", ("copy.pdf", data, "application/pdf"))],
+        )
+        assert r.status_code == 200
+    sha = hashlib.sha256(data).hexdigest()
+    path = uploads.blob_path(sha)
+    assert path.read_bytes() == data
+
+    def refcount() -> int | None:
+        db.expire_all()
+        blob = db.get(MaterialBlob, sha)
+        return blob and blob.refcount
+
+    assert refcount() == 4
+    for course, name in [(courses[0], "slides.pdf"), (courses[1], "slides.pdf"), (courses[1], "copy.pdf")]:
+        r = client.delete(
+            f"{settings.API_V1_STR}/courses/{course.id}/materials/{sha}_{name}", headers=superuser_token_headers
+        )
+        assert r.status_code == 200
+    assert refcount() == 1 and path.exists()
+    client.delete(f"{settings.API_V1_STR}/courses/{courses[0].id}", headers=superuser_token_headers)
+    assert refcount() is None and not path.exists()
+    crud.delete_course(db, courses[1].id)
+
+
+def test_download_material_ranges(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, upload_dir: Path
+) -> None:
+    course = create_random_course(db)
+    video = b"\x00\x00\x00\x18ftypmp42" + random_lower_string().encode() * 50
+    r = client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/materials/",
+        headers=superuser_token_headers,
+        files=[("files", ("lesson.bin", video, "application/pdf")), ("files", ("notes", b"%PDF-1.7 x", "text/plain"))],
+    )
+    assert r.status_code == 200
+    sha = hashlib.sha256(video).hexdigest()
+    url = f"{settings.API_V1_STR}/courses/materials/{sha}_lesson.bin"
+
+    r = client.get(url)
+    assert r.status_code == 200 and r.content == video
+    assert r.headers["content-type"] == "video/mp4" and r.headers["accept-ranges"] == "bytes"
+    assert r.headers["etag"] == f'"{sha}"' and "immutable" in r.headers["cache-control"]
+    assert 'filename="lesson.bin"' in r.headers["content-disposition"]
+    assert client.get(url, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    pdf = hashlib.sha256(b"%PDF-1.7 x").hexdigest()
+    assert client.get(f"{settings.API_V1_STR}/courses/materials/{pdf}_notes").headers["content-type"] == "application/pdf"
+
+    r = client.get(url, headers={"Range": "bytes=4-11"})
+    assert r.status_code == 206 and r.content == b"ftypmp42"
+    assert r.headers["content-range"] == f"bytes 4-11/{len(video)}"
+    r = client.get(url, headers={"Range": "bytes=-5, 0-3, 2-5"})
+    assert r.status_code == 206 and r.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    boundary = r.headers["content-type"].split("=")[1].encode()
+    parts = r.content.split(b"--" + boundary)
+    assert parts[1].endswith(b"Content-Range: bytes 0-5/%d\r\n\r\n" % len(video) + video[:6] + b"\r\n")
+    assert parts[2].endswith(video[-5:] + b"\r\n") and parts[3] == b"--\r\n"
+    assert int(r.headers["content-length"]) == len(r.content)
+
+    r = client.get(url, headers={"Range": f"bytes={len(video)}-"})
+    assert r.status_code == 416 and r.headers["content-range"] == f"bytes */{len(video)}"
+    assert client.get(url, headers={"Range": "bytes=0-3", "If-Range": '"stale"'}).status_code == 200
+    assert client.get(url, headers={"Range": "lines=1-2"}).content == video
+    assert client.get(f"{settings.API_V1_STR}/courses/materials/{'0' * 64}_gone.mp4").status_code == 404
+    crud.delete_course(db, course.id)
+
+
+def make_pdf(text: str) -> bytes:
+    """A one-page PDF showing `text`."""
+    stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    return pdf + b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+
+def test_material_preview(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, upload_dir: Path
+) -> None:
+    course = create_random_course(db)
+    text = random_lower_string()
+    files = {"handout.pdf": make_pdf(text), "broken.pdf": b"%PDF-1.4 not really", "notes.txt": b"plain"}
+    r = client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/materials/",
+        headers=superuser_token_headers,
+        files=[("files", (name, data, "application/octet-stream")) for name, data in files.items()],
+    )
+    assert r.status_code == 200
+
+    def preview(name: str) -> Any:
+        url = f"{settings.API_V1_STR}/courses/materials/{hashlib.sha256(files[name]).hexdigest()}_{name}/preview"
+        for _ in range(300):
+            r = client.get(url)
+            if r.status_code != 202:
+                return r
+            assert r.headers["cache-control"] == "no-store"
+            time.sleep(0.1)
+        raise AssertionError(f"no preview of {name}")
+
+    r = preview("handout.pdf")
+    assert r.status_code == 200 and "immutable" in r.headers["cache-control"]
+    body = r.json()
+    assert (body["status"], body["pages"], body["text_length"]) == ("ready", 1, len(text))
+    assert body["thumbnail_width"] == settings.PREVIEW_WIDTH
+    assert client.get(r.request.url, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    thumbnail = client.get(body["thumbnail_url"])
+    assert thumbnail.headers["content-type"] == "image/jpeg" and thumbnail.content.startswith(b"\xff\xd8\xff")
+
+    assert preview("broken.pdf").json()["status"] == "failed"
+    assert preview("notes.txt").status_code == 404
+    # one job per content: the finished preview is not rendered again
+    assert not preview_queue.schedule(hashlib.sha256(files["handout.pdf"]).hexdigest())
+
+    client.delete(f"{settings.API_V1_STR}/courses/{course.id}", headers=superuser_token_headers)
+    assert not list(settings.UPLOAD_DIR.glob(f"blobs/*/{hashlib.sha256(files['handout.pdf']).hexdigest()}*"))
+
+
+def test_dedup_materials(db: Session, upload_dir: Path) -> None:
+    data = random_lower_string().encode()
+    legacy = [f"{uuid.uuid4().hex}_handout.pdf", f"{uuid.uuid4().hex}_handout-copy.pdf"]
+    for name in legacy:
+        (settings.UPLOAD_DIR / name).write_bytes(data)
+    course = create_random_course(db)
+    for position, name in enumerate([*legacy, "gone.pdf"]):
+        db.add(CourseMaterial(
+            course_id=course.id, stored_name=name, original_name=name, size=0, mime="application/pdf", position=position
+        ))
+    db.commit()
+
+    report = crud.dedup_materials(db)
+    sha = hashlib.sha256(data).hexdigest()
+    materials = crud.get_course_materials(db, course.id)
+    assert [m.stored_name for m in materials] == [f"{sha}_handout.pdf", f"{sha}_handout-copy.pdf", "gone.pdf"]
+    assert (materials[0].sha256, materials[0].size) == (sha, len(data))
+    assert report["files_moved"] == 2 and report["bytes_saved"] >= len(data) and report["missing_files"] >= 1
+    assert uploads.blob_path(sha).read_bytes() == data
+    assert not any((settings.UPLOAD_DIR / name).exists() for name in legacy)
+    assert db.get(MaterialBlob, sha).refcount == 2  # type: ignore[union-attr]
+    assert crud.dedup_materials(db)["files_moved"] == 0
+    crud.delete_course(db, course.id)
+
+
+def test_course_summary_view(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    quiz = crud.create_quiz(session=db, quiz_create=QuizCreate(course_id=course.id, questions=[]))
+    user, password = create_random_learner(db)
+    client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/assign-user/{user.id}",
+        headers=superuser_token_headers,
+    )
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+    client.get(f"{settings.API_V1_STR}/courses/me", headers=headers)
+
+    with count_queries() as statements:
+        r = client.get(f"{settings.API_V1_STR}/courses/me?view=summary", headers=headers)
+    assert r.status_code == 200
+    assert len(statements) == 1
+    assert r.json() == [
+        {
+            "id": str(course.id),
+            "title": course.title,
+            "is_active": course.is_active,
+            "start_date": course.start_date and course.start_date.isoformat(),
+            "end_date": course.end_date and course.end_date.isoformat(),
+            "quiz_id": str(quiz.id),
+            "status": "assigned",
+        }
+    ]
+
+    r = client.get(f"{settings.API_V1_STR}/courses/{course.id}?view=summary", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["status"] == "assigned"
+    assert "users" not in r.json()
+
+    # not enrolled directly: no status of their own
+    r = client.get(
+        f"{settings.API_V1_STR}/courses/{course.id}?view=summary", headers=superuser_token_headers
+    )
+    assert r.json()["status"] is None
+
+    r = client.get(
+        f"{settings.API_V1_STR}/courses/?view=summary&limit=1000", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    page = r.json()
+    assert page["count"] >= 1
+    assert str(course.id) in {c["id"] for c in page["data"]}
+
+    r = client.get(f"{settings.API_V1_STR}/courses/me?view=everything", headers=headers)
+    assert r.status_code == 422
+
+
+def test_bulk_enrolment(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    role = crud.create_role(db, role_in=RoleCreate(name=random_lower_string()))
+    nurse, _ = create_random_learner(db, role_id=role.id)
+    already, _ = create_random_learner(db)
+    new, _ = create_random_learner(db)
+    client.post(f"{settings.API_V1_STR}/courses/{course.id}/assign-user/{already.id}", headers=superuser_token_headers)
+    missing = str(uuid.uuid4())
+    url = f"{settings.API_V1_STR}/courses/{course.id}/enrolments:bulk"
+    body = {"user_ids": [str(new.id), str(already.id), missing, str(new.id)], "role_ids": [str(role.id)]}
+
+    with count_queries() as queries:
+        r = client.post(url, headers=superuser_token_headers, json=body)
+    assert r.status_code == 200
+    report = r.json()
+    assert [(u["id"], u["outcome"]) for u in report["users"]] == [
+        (str(new.id), "assigned"), (str(already.id), "already_assigned"), (missing, "not_found")
+    ]
+    assert report["roles"] == [{"id": str(role.id), "outcome": "assigned"}]
+    # user and role lookups, two user inserts, two role inserts, independent of list sizes
+    assert len(queries) <= 8
+    effective = db.exec(select(UserCourseEffective.user_id).where(UserCourseEffective.course_id == course.id)).all()
+    assert set(effective) == {nurse.id, already.id, new.id}
+
+    r = client.request("DELETE", url, headers=superuser_token_headers, json=body)
+    assert r.status_code == 200
+    report = r.json()
+    assert [u["outcome"] for u in report["users"]] == ["removed", "removed", "not_found"]
+    assert report["roles"] == [{"id": str(role.id), "outcome": "removed"}]
+    db.expire_all()
+    assert not db.exec(select(UserCourseEffective).where(UserCourseEffective.course_id == course.id)).all()
+
+    r = client.request("DELETE", url, headers=superuser_token_headers, json={"user_ids": [str(new.id)]})
+    assert r.json()["users"] == [{"id": str(new.id), "outcome": "not_assigned"}]
+
+
+def test_import_enrolments(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    by_id, _ = create_random_learner(db)
+    by_email, _ = create_random_learner(db)
+    csv_text = (
+        "Email,User_ID,name\n"
+        f",{by_id.user_id},by employee id\n"
+        f"{by_email.email},,by email\n"
+        f"{by_email.email},,again\n"
+        "\n"
+        "nobody@example.com,,unknown\n"
+        ",,empty\n"
+    )
+    url = f"{settings.API_V1_STR}/courses/{course.id}/enrolments/import"
+    r = client.post(url, headers=superuser_token_headers, files={"file": ("hr.csv", csv_text, "text/csv")})
+    assert r.status_code == 200
+    report = r.json()
+    assert (report["rows"], report["assigned"], report["already_assigned"], report["rejected"]) == (5, 2, 1, 2)
+    linked = db.exec(select(UserCourseEffective.user_id).where(UserCourseEffective.course_id == course.id)).all()
+    assert set(linked) == {by_id.id, by_email.id}
+
+    r = client.get(report["rejects_url"], headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.text.splitlines() == [
+        "line,user_id,email,reason",
+        "6,,nobody@example.com,no user with this email",
+        "7,,,no employee id or email",
+    ]
+
+    r = client.post(url, headers=superuser_token_headers, files={"file": ("hr.csv", "name\nx\n", "text/csv")})
+    assert r.status_code == 400
+
+
+def test_search_courses(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string(12)
+    in_title = crud.create_course(db, CourseCreate(title=f"Infection control {word}", description="Hand hygiene"))
+    in_description = crud.create_course(db, CourseCreate(title="Ward basics", description=f"Covers {word} too"))
+    inactive = crud.create_course(db, CourseCreate(title=f"Old {word}", is_active=False))
+    url = f"{settings.API_V1_STR}/courses/search"
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": f"infe {word[:6]}"})
+    assert r.status_code == 200
+    [hit] = r.json()
+    assert hit["id"] == str(in_title.id)
+    assert hit["title_highlight"] == f"<mark>Infection</mark> control <mark>{word}</mark>"
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": word})
+    hits = [h["id"] for h in r.json()]
+    assert hits[:2] == [str(in_title.id), str(inactive.id)] or hits[:2] == [str(inactive.id), str(in_title.id)]
+    assert hits[2:] == [str(in_description.id)]  # title matches rank first
+
+    learner, password = create_random_learner(db)
+    headers = user_authentication_headers(client=client, email=learner.email, password=password)
+    r = client.get(url, headers=headers, params={"q": word})
+    assert str(inactive.id) not in [h["id"] for h in r.json()]
+
+    # the index follows updates and deletes
+    crud.update_course(db, db_course=in_description, course_in=CourseUpdate(description="nothing"))
+    client.delete(f"{settings.API_V1_STR}/courses/{inactive.id}", headers=superuser_token_headers)
+    r = client.get(url, headers=superuser_token_headers, params={"q": word})
+    assert [h["id"] for h in r.json()] == [str(in_title.id)]
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": '"*) OR'})
+    assert r.status_code == 200
+
+
+def test_courses_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_course(db)
+    url = f"{settings.API_V1_STR}/courses/"
+    everything = client.get(url, headers=superuser_token_headers, params={"limit": 1000}).json()
+    expected = [c["id"] for c in everything["data"]]
+
+    for view in ("detailed", "summary"):
+        seen, params = [], {"limit": 2, "view": view}
+        while True:
+            page = client.get(url, headers=superuser_token_headers, params=params).json()
+            seen += [c["id"] for c in page["data"]]
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+        assert seen == expected
+
+    r = client.get(url, headers=superuser_token_headers, params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+
+
+def test_conditional_get(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    course = create_random_course(db)
+    quiz = crud.create_quiz(session=db, quiz_create=QuizCreate(course_id=course.id, questions=[]))
+    user, password = create_random_learner(db)
+    learner_headers = user_authentication_headers(client=client, email=user.email, password=password)
+    course_url = f"{settings.API_V1_STR}/courses/{course.id}"
+
+    def revalidate(url: str, headers: dict[str, str]) -> tuple[int, str]:
+        r = client.get(url, headers=headers)
+        assert r.status_code == 200
+        assert r.headers["cache-control"]
+        etag = r.headers["etag"]
+        r = client.get(url, headers={**headers, "If-None-Match": etag})
+        return r.status_code, etag
+
+    for url in (course_url, f"{course_url}?view=summary"):
+        status, etag = revalidate(url, superuser_token_headers)
+        assert status == 304
+        with count_queries() as statements:
+            r = client.get(url, headers={**superuser_token_headers, "If-None-Match": f'W/{etag}, "other"'})
+        assert r.status_code == 304
+        assert r.content == b""
+        assert len(statements) < COURSE_DETAIL_QUERIES
+
+    _, before = revalidate(course_url, superuser_token_headers)
+    client.post(f"{course_url}/assign-user/{user.id}", headers=superuser_token_headers)
+    r = client.get(course_url, headers={**superuser_token_headers, "If-None-Match": before})
+    assert r.status_code == 200
+    assert r.headers["etag"] != before
+    assert r.json()["users"][0]["id"] == str(user.id)
+
+    for view in ("detailed", "summary"):
+        status, _ = revalidate(f"{settings.API_V1_STR}/courses/me?view={view}", learner_headers)
+        assert status == 304
+
+    quiz_url = f"{settings.API_V1_STR}/quizzes/{quiz.id}"
+    status, before = revalidate(quiz_url, superuser_token_headers)
+    assert status == 304
+    client.patch(quiz_url, headers=superuser_token_headers, json={"max_attempts": 5})
+    r = client.get(quiz_url, headers={**superuser_token_headers, "If-None-Match": before})
+    assert r.status_code == 200
+    assert r.json()["max_attempts"] == 5
+
+    status, _ = revalidate(f"{settings.API_V1_STR}/roles/", superuser_token_headers)
+    assert status == 304
+
+
+def test_submit_quiz_attempt(client: TestClient, db: Session) -> None:
+    course = create_random_course(db)
+    quiz = crud.create_quiz(
+        session=db,
+        quiz_create=QuizCreate(
+            course_id=course.id,
+            max_attempts=2,
+            questions=[
+                {"question": "1 + 1", "choices": ["1", "2"], "correct_index": 1},
+                {"question": "2 + 2", "choices": ["4", "5"], "correct_index": 0},
+            ],
+        ),
+    )
+    user, password = create_random_learner(db)
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+
+    r = client.post(f"{settings.API_V1_STR}/quizzes/{quiz.id}/attempt", headers=headers, json=[1, 1])
+    assert r.status_code == 200
+    attempt = r.json()
+    assert attempt["score"] == 50
+    assert attempt["passed"] is False
+    assert attempt["attempt_number"] == 1
+    assert attempt["course_name"] == course.title
+
+    r = client.post(f"{settings.API_V1_STR}/quizzes/{quiz.id}/attempt", headers=headers, json=[1, 0])
+    assert r.status_code == 200
+    assert r.json()["passed"] is True
+
+    r = client.post(f"{settings.API_V1_STR}/quizzes/{quiz.id}/attempt", headers=headers, json=[1, 0])
+    assert r.status_code == 400
+
+    url = f"{settings.API_V1_STR}/quizzes/{quiz.id}/attempts"
+    r = client.get(url, headers=headers, params={"limit": 1})
+    assert [a["attempt_number"] for a in r.json()] == [1]
+    r = client.get(url, headers=headers, params={"limit": 1, "cursor": r.headers["X-Next-Cursor"]})
+    assert [a["attempt_number"] for a in r.json()] == [2]
+
+
+def test_all_quiz_attempts(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    quiz = crud.create_quiz(session=db, quiz_create=QuizCreate(course_id=create_random_course(db).id))
+    improved, regressed = create_random_learner(db)[0], create_random_learner(db)[0]
+    # later than anything else in the table, so these are the first page
+    start = datetime.now(timezone.utc) + timedelta(days=1)
+    for minutes, (user, score) in enumerate([(improved, 50), (regressed, 90), (improved, 90), (regressed, 50)]):
+        db.add(QuizAttempt(
+            quiz_id=quiz.id, user_id=user.id, score=score, attempt_number=minutes // 2 + 1, passed=score >= 70,
+            created_at=start + timedelta(minutes=minutes),
+        ))
+    db.commit()
+
+    # a user's attempt is listed when it is both their best and their latest
+    url = f"{settings.API_V1_STR}/quizzes/attempts/all"
+    r = client.get(url, headers=superuser_token_headers, params={"limit": 1})
+    assert [(a["user_id"], a["score"]) for a in r.json()] == [(str(improved.id), 90)]
+    r = client.get(url, headers=superuser_token_headers, params={"limit": 1, "cursor": r.headers["X-Next-Cursor"]})
+    assert all(a["quiz_id"] != str(quiz.id) for a in r.json())
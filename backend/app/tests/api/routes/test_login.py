@@ -1,11 +1,18 @@
+from typing import Any
 from unittest.mock import patch
 
+import jwt
+
 from fastapi.testclient import TestClient
+from passlib.context import CryptContext
 from sqlmodel import Session, select
 
+from app import crud
+from app.core.cache import principal_cache
 from app.core.config import settings
-from app.core.security import verify_password
-from app.models import User
+from app.core.security import ALGORITHM, password_hasher, verify_password
+from app.models import User, UserUpdate
+from app.tests.utils.user import create_random_learner, user_authentication_headers
 from app.utils import generate_password_reset_token
 
 
@@ -102,3 +109,90 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def test_current_user_is_cached_and_invalidated(client: TestClient, db: Session) -> None:
+    user, password = create_random_learner(db)
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+    assert r.status_code == 200
+    hits = principal_cache.hits
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+    assert r.status_code == 200
+    assert principal_cache.hits == hits + 1
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(name="Renamed"))
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+    assert r.json()["name"] == "Renamed"
+
+
+def test_get_access_token_hasher_saturated(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with (
+        patch.object(password_hasher, "workers", 1),
+        patch.object(password_hasher, "max_pending", 0),
+    ):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+
+
+def test_login_rehashes_outdated_password_hash(client: TestClient, db: Session) -> None:
+    user, password = create_random_learner(db)
+    weak_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    user.hashed_password = weak_context.hash(password)
+    db.add(user)
+    db.commit()
+
+    login_data = {"username": user.email, "password": password}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 200
+
+    db.refresh(user)
+    assert not user.hashed_password.startswith("$2b$04$")
+    assert verify_password(password, user.hashed_password)
+
+
+def test_refresh_token(client: TestClient, db: Session) -> None:
+    user, password = create_random_learner(db)
+    login_data = {"username": user.email, "password": password}
+    tokens = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data).json()
+    claims = jwt.decode(tokens["access_token"], settings.SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["is_superuser"] is False
+    assert claims["ver"] == user.version
+    assert jwt.decode(tokens["refresh_token"], settings.SECRET_KEY, algorithms=[ALGORITHM])["ver"] == user.version
+
+    def refresh(token: str) -> Any:
+        return client.post(f"{settings.API_V1_STR}/login/refresh-token", json={"refresh_token": token})
+
+    assert refresh(tokens["access_token"]).status_code == 403
+    r = refresh(tokens["refresh_token"])
+    assert r.status_code == 200
+    tokens = r.json()
+
+    # a password change or reset revokes the refresh tokens issued before it
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"current_password": password, "new_password": password + "2"},
+    )
+    assert r.status_code == 200
+    assert refresh(tokens["refresh_token"]).status_code == 403
+    login_data["password"] = password + "2"
+    tokens = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data).json()
+
+    # so does an authorization change, the next login carries the new claims
+    db.refresh(user)
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_superuser=True))
+    assert refresh(tokens["refresh_token"]).status_code == 403
+    tokens = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data).json()
+    claims = jwt.decode(tokens["access_token"], settings.SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["is_superuser"] is True
+    assert claims["ver"] == user.version == 2
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_active=False))
+    assert refresh(tokens["refresh_token"]).status_code == 400
@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.metrics import logins_failed
+
+
+def scrape(client: TestClient) -> dict[str, float]:
+    r = client.get(f"{settings.API_V1_STR}/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in r.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    route = f'method="GET",route="{settings.API_V1_STR}/users/"'
+    before = scrape(client)
+    failed_logins = logins_failed.value
+    for _ in range(3):
+        client.get(f"{settings.API_V1_STR}/users/", headers=superuser_token_headers)
+    client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": settings.FIRST_SUPERUSER, "password": "wrong"},
+    )
+    after = scrape(client)
+
+    count = f"http_request_duration_seconds_count{{{route}}}"
+    assert after[count] - before.get(count, 0) == 3
+    assert after[f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}'] == after[count]
+    assert logins_failed.value == failed_logins + 1
+    assert after['logins_total{result="failure"}'] == logins_failed.value
+    # the scrape itself is in flight
+    assert after["http_requests_in_flight"] == 1
+    assert after['db_pool_checkouts_total{engine="sync"}'] > before['db_pool_checkouts_total{engine="sync"}']
+    assert 'db_pool_checkout_seconds_count{engine="async"}' in after
+    assert after["threadpool_threads_max"] > 0
@@ -2,12 +2,13 @@ import uuid
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import Session, select, update
 
 from app import crud
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import get_password_hash, verify_password
 from app.models import User, UserCreate
+from app.tests.utils.user import create_random_learner, user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -484,3 +485,26 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_update_password_me_cached_principal(client: TestClient, db: Session) -> None:
+    """The password check and the version bump read the database, not the cached principal."""
+    user, password = create_random_learner(db)
+    headers = user_authentication_headers(client=client, email=user.email, password=password)
+    assert client.get(f"{settings.API_V1_STR}/users/me", headers=headers).status_code == 200  # cached now
+    changed = random_lower_string()
+    # changed behind the cache's back, as by a request that raced the one caching it
+    db.exec(
+        update(User)
+        .where(User.id == user.id)
+        .values(hashed_password=get_password_hash(changed), version=User.version + 1)
+    )
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/users/me/password"
+    r = client.patch(url, headers=headers, json={"current_password": password, "new_password": password})
+    assert r.status_code == 400
+    r = client.patch(url, headers=headers, json={"current_password": changed, "new_password": password})
+    assert r.status_code == 200
+    db.refresh(user)
+    assert user.version == 2 and verify_password(password, user.hashed_password)
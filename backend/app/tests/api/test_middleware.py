@@ -0,0 +1,118 @@
+import json
+from collections.abc import Iterator
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.middleware import AccessLogMiddleware, CompressionMiddleware, access_logger, negotiate_encoding
+
+
+def test_access_log_line(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    with patch.object(access_logger, "info") as log:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/{settings.FIRST_SUPERUSER}",
+            headers=superuser_token_headers,
+        )
+    line = log.call_args.args[0]
+    assert "\n" not in line
+    entry = json.loads(line)
+    assert entry["method"] == "GET"
+    assert entry["route"] == f"{settings.API_V1_STR}/users/{{user_id}}"
+    assert entry["status"] == r.status_code
+    assert entry["bytes"] == len(r.content)
+    assert "Bearer" not in line
+
+
+def test_access_log_sampling(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    sampled_out = TestClient(AccessLogMiddleware(client.app, sample_rate=0.0))
+    with patch.object(access_logger, "info") as log:
+        r = sampled_out.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    assert r.status_code == 200
+    # only the app's own middleware (sample_rate=1.0) logged the request
+    assert log.call_count == 1
+
+
+def test_server_timing(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    with patch.object(access_logger, "info") as log:
+        # sync route (threadpool) and async route (aiosqlite greenlets)
+        for path in ("/users/", "/courses/me"):
+            r = client.get(f"{settings.API_V1_STR}{path}", headers=superuser_token_headers)
+            assert r.status_code == 200
+            metrics = {
+                part.split(";")[0]: part for part in r.headers["server-timing"].split(", ")
+            }
+            assert set(metrics) == {"db", "serialize", "total"}
+            entry = json.loads(log.call_args.args[0])
+            assert entry["db_queries"] >= 1
+            assert f'desc="{entry["db_queries"]} queries"' in metrics["db"]
+            assert entry["db_ms"] <= entry["duration_ms"]
+            assert entry["serialize_ms"] > 0
+
+
+def test_cors_exposes_next_cursor(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/quizzes/attempts/all?limit=1",
+        headers={**superuser_token_headers, "Origin": settings.FRONTEND_HOST},
+    )
+    assert r.status_code == 200
+    assert "x-next-cursor" in r.headers["access-control-expose-headers"].lower()
+
+
+def test_negotiate_encoding() -> None:
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("gzip;q=1, br;q=0.5") == "gzip"
+    assert negotiate_encoding("br;q=0.8, *;q=0.9") == "zstd"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("zstd;q=0, br;q=0, gzip;q=0") is None
+    assert negotiate_encoding("") is None
+
+
+@pytest.fixture
+def compressed() -> TestClient:
+    app = FastAPI()
+    rows = [{"id": i, "title": "Infection control", "is_active": True} for i in range(200)]
+
+    @app.get("/large")
+    def large() -> Response:
+        return Response(json.dumps(rows), media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    def small() -> dict[str, int]:
+        return {"id": 1}
+
+    @app.get("/stream")
+    def stream() -> StreamingResponse:
+        def lines() -> Iterator[bytes]:
+            for row in rows:
+                yield json.dumps(row).encode() + b"\n"
+        return StreamingResponse(lines(), media_type="text/plain")
+
+    @app.get("/video")
+    def video() -> Response:
+        return Response(b"\x00" * 5000, media_type="text/plain", headers={"Accept-Ranges": "bytes"})
+
+    return TestClient(CompressionMiddleware(app, minimum_size=1024))
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+def test_compression(compressed: TestClient, encoding: str) -> None:
+    headers = {"Accept-Encoding": encoding}
+    plain = compressed.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.headers["etag"] == '"v1"'
+
+    r = compressed.get("/large", headers=headers)
+    assert r.headers["content-encoding"] == encoding and r.content == plain.content
+    assert int(r.headers["content-length"]) < len(plain.content) / 5
+    assert r.headers["vary"] == "Accept-Encoding" and r.headers["etag"] == 'W/"v1"'
+
+    r = compressed.get("/stream", headers=headers)
+    assert r.headers["content-encoding"] == encoding and "content-length" not in r.headers
+    assert r.text.count("\n") == 200
+
+    for path in ("/small", "/video"):
+        assert "content-encoding" not in compressed.get(path, headers=headers).headers
+    assert compressed.head("/large", headers=headers).headers.get("content-encoding") is None
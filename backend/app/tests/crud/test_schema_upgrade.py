@@ -0,0 +1,29 @@
+import shutil
+from pathlib import Path
+
+from sqlalchemy import inspect
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.core.db import upgrade_schema
+from app.models import Quiz, User
+
+SHIPPED_DB = Path(__file__).parents[3] / "data" / "app.db"
+
+
+def test_upgrade_shipped_database(tmp_path: Path) -> None:
+    """The demo database predates the version columns and keyset indexes."""
+    path = tmp_path / "app.db"
+    shutil.copy(SHIPPED_DB, path)
+    engine = create_engine(f"sqlite:///{path}")
+    for _ in range(2):  # idempotent
+        SQLModel.metadata.create_all(engine)
+        upgrade_schema(engine)
+
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        assert {c.name for c in table.columns} <= {c["name"] for c in inspector.get_columns(table.name)}
+        assert {i.name for i in table.indexes} <= {i["name"] for i in inspector.get_indexes(table.name)}
+    with Session(engine) as session:
+        assert {user.version for user in session.exec(select(User))} == {0}
+        assert all(quiz.created_at.year > 1970 for quiz in session.exec(select(Quiz)))
+    engine.dispose()
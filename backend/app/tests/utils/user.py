@@ -1,3 +1,4 @@
+import uuid
 from enum import Enum
 from fastapi.testclient import TestClient
 from sqlmodel import Session
@@ -48,6 +49,18 @@ def create_random_user(db: Session) -> User:
     user = crud.create_user(session=db, user_in=user_in)
     return user
 
+def create_random_learner(db: Session, role_id: uuid.UUID | None = None) -> tuple[User, str]:
+    """Create a normal user without relying on seeded roles, returning it with its password."""
+    password = random_lower_string(12)
+    user_in = UserCreate(
+        email=random_email(),
+        user_id=random_employee_id(),
+        name=random_name(),
+        role_id=role_id,
+        password=password,
+    )
+    return crud.create_user(session=db, user_in=user_in), password
+
 def get_random_employee(db: Session) -> UserCreate:
     return UserCreate(
         email=random_email(),
@@ -1,12 +1,17 @@
 import random
 import string
 import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
 
 from fastapi.testclient import TestClient
 from faker import Faker
 
 from app.core.config import settings
+from app.core.db import async_engine, engine
 from app import crud
+from sqlalchemy import event
 from sqlmodel import Session
 
 fake = Faker()
@@ -27,3 +32,21 @@ def random_name() -> str: return fake.name()
 def random_employee_id() -> str: return f"EMP{random.randint(100000, 999999)}"
 def random_lower_string(length: int = 10) -> str: return ''.join(random.choices(string.ascii_lowercase, k=length))
 def random_role(db: Session) -> uuid.UUID: return random.choice([role.id for role in crud.get_roles(db)])
+
+
+@contextmanager
+def count_queries() -> Iterator[list[str]]:
+    """Collect the SQL statements run on either engine inside the block."""
+    statements: list[str] = []
+
+    def record(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", record)
@@ -1,12 +1,10 @@
-import json
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any
 
 import emails  # type: ignore
-from fastapi import Request
 import jwt
 from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
@@ -123,26 +121,3 @@ def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
-
-async def log_request(request: Request, call_next: Callable) -> None:
-    """Logs details of an incoming FastAPI request (headers, body, method, URL)."""
-    try:
-        body = await request.json()
-    except Exception:
-        body = await request.body()
-        try:
-            body = body.decode("utf-8")
-        except UnicodeDecodeError:
-            body = "<Binary Data>"
-
-    log_data = {
-        "method": request.method,
-        "url": str(request.url),
-        "headers": dict(request.headers),
-        "body": body,
-    }
-
-    print("Incoming Request:\n" + json.dumps(log_data, indent=4))
-    response = await call_next(request)
-    print(json.dumps({"response_status": response.status_code}, indent=4))
-    return response
\ No newline at end of file
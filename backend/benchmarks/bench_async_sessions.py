@@ -0,0 +1,127 @@
+"""Sync (threadpool) vs async (event loop) session paths under concurrent load.
+
+The async routes are the real ones from app.api; the sync baselines below are
+the previous implementations, mounted under /sync for comparison.
+
+    python -m benchmarks.bench_async_sessions --concurrency 200 --seed-courses 20
+"""
+import asyncio
+from typing import Any, List
+
+from fastapi import APIRouter, FastAPI
+from sqlmodel import Session, or_, select
+
+from app import crud
+from app.api.deps import CurrentUser, SessionDep
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import (
+    Course,
+    CourseCreate,
+    CourseDetailed,
+    CourseRoleLink,
+    CourseUserLink,
+    NotificationPublic,
+    QuizPublic,
+    RolePublic,
+    UserPublic,
+)
+from benchmarks.common import asgi_client, base_parser, login, print_results, run_load
+
+sync_router = APIRouter(prefix="/sync")
+
+
+@sync_router.get("/courses/me", response_model=List[CourseDetailed])
+def sync_user_courses(session: SessionDep, current_user: CurrentUser) -> Any:
+    stmt = (
+        select(Course)
+        .join(CourseUserLink, Course.id == CourseUserLink.course_id, isouter=True)  # type: ignore
+        .join(CourseRoleLink, Course.id == CourseRoleLink.course_id, isouter=True)  # type: ignore
+        .where(
+            or_(
+                CourseUserLink.user_id == current_user.id,  # type: ignore
+                CourseRoleLink.role_id == current_user.role_id,  # type: ignore
+            )
+        )
+        .distinct()
+    )
+    return [
+        CourseDetailed(
+            id=course.id,
+            title=course.title,
+            description=course.description,
+            materials=[material.stored_name for material in course.materials],
+            is_active=course.is_active,
+            start_date=course.start_date,
+            end_date=course.end_date,
+            roles=[RolePublic.model_validate(role) for role in course.roles],
+            users=[UserPublic.model_validate(user) for user in course.users],
+            quiz=QuizPublic.model_validate(course.quiz) if course.quiz else None,
+        )
+        for course in session.exec(stmt).all()
+    ]
+
+
+@sync_router.get("/notifications", response_model=List[NotificationPublic])
+def sync_notifications(session: SessionDep, current_user: CurrentUser) -> Any:
+    return crud.get_notifications(session, current_user.id)
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    app.include_router(sync_router, prefix=settings.API_V1_STR)
+    return app
+
+
+def seed_courses(count: int) -> None:
+    """Assign `count` fresh courses to the first superuser so /courses/me has work to do."""
+    with Session(engine) as session:
+        admin = crud.get_user_by_email(session, settings.FIRST_SUPERUSER)
+        assert admin, "run init_db first"
+        for i in range(count):
+            course = crud.create_course(
+                session, CourseCreate(title=f"bench course {i}", description="benchmark")
+            )
+            session.add(CourseUserLink(course_id=course.id, user_id=admin.id))
+        session.commit()
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.add_argument("--seed-courses", type=int, default=0)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    if args.seed_courses:
+        seed_courses(args.seed_courses)
+
+    async with asgi_client(build_app()) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        scenarios = [
+            ("sync  GET /courses/me", "/sync/courses/me"),
+            ("async GET /courses/me", "/courses/me"),
+            ("sync  GET /notifications", "/sync/notifications"),
+            ("async GET /notifications", "/"),
+        ]
+        results = []
+        for name, path in scenarios:
+            results.append(
+                await run_load(
+                    client,
+                    name,
+                    "GET",
+                    f"{settings.API_V1_STR}{path}",
+                    concurrency=args.concurrency,
+                    total=args.requests,
+                    timeout=args.timeout,
+                    headers=headers,
+                )
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""Bytes saved and CPU spent by response compression, per endpoint and encoding.
+
+Seeds --courses courses assigned to the first superuser, each with --users
+learners, and a quiz with --attempts attempts, then fetches the large JSON
+endpoints through the full app with each Accept-Encoding:
+
+    python -m benchmarks.bench_compression --courses 50 --users 40 --attempts 500
+
+Bytes are the response body as sent. CPU is process time per request, client
+included (it only counts the raw bytes, it doesn't decode them). Next to the
+whole request that difference is within noise, so `encode ms` times the
+middleware's encoder alone on the identity body.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.security import get_password_hash
+from app.main import app
+from app.middleware import ENCODERS
+from app.models import CourseCreate, QuizAttempt, QuizCreate, User
+from benchmarks.common import asgi_client, base_parser, login
+
+ENCODINGS = ("identity", "gzip", "br", "zstd")
+ENCODE_ROUNDS = 50
+
+
+def seed(courses: int, users: int, attempts: int) -> None:
+    with Session(engine) as session:
+        admin = crud.get_user_by_email(session, settings.FIRST_SUPERUSER)
+        assert admin, "run init_db first"
+        # one hash for everybody, hashing thousands of passwords would dominate the setup
+        hashed = get_password_hash(uuid.uuid4().hex)
+        tag = uuid.uuid4().hex[:8]
+        learners = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": f"BENCH-{tag}-{i}",
+                "name": f"Learner {i}",
+                "email": f"learner{i}.{tag}@bench.example.com",
+                "hashed_password": hashed,
+                "is_active": True,
+                "is_superuser": False,
+            }
+            for i in range(users)
+        ]
+        session.execute(insert(User), learners)
+        session.commit()
+        quiz_id = None
+        for i in range(courses):
+            course = crud.create_course(
+                session, CourseCreate(title=f"Mandatory training {i}", description="Infection control and hand hygiene")
+            )
+            crud.bulk_enrol(session, course.id, [admin.id, *(row["id"] for row in learners)], [])
+            if quiz_id is None:
+                quiz_id = crud.create_quiz(session, QuizCreate(course_id=course.id)).id
+        now = datetime.now(timezone.utc)
+        session.execute(insert(QuizAttempt), [
+            {
+                "id": uuid.uuid4(),
+                "quiz_id": quiz_id,
+                "user_id": learners[i % len(learners)]["id"] if learners else admin.id,
+                # rising, so each learner's latest attempt is also their best and is listed
+                "score": min(i * 100 // max(attempts, 1), 100),
+                "attempt_number": i + 1,
+                "passed": i * 100 // max(attempts, 1) >= 70,
+                "created_at": now + timedelta(milliseconds=i),
+                "updated_at": now,
+            }
+            for i in range(attempts)
+        ])
+        session.commit()
+
+
+async def fetch(client: httpx.AsyncClient, url: str, headers: dict[str, str], requests: int) -> tuple[int, float]:
+    """Body bytes of one response and process seconds per request."""
+    size = 0
+    started = time.process_time()
+    for _ in range(requests):
+        size = 0
+        async with client.stream("GET", url, headers=headers) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_raw():
+                size += len(chunk)
+    return size, (time.process_time() - started) / requests
+
+
+def encode_seconds(encoding: str, body: bytes) -> float:
+    started = time.process_time()
+    for _ in range(ENCODE_ROUNDS):
+        compress, flush = ENCODERS[encoding]()
+        compress(body)
+        flush()
+    return (time.process_time() - started) / ENCODE_ROUNDS
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.set_defaults(requests=20)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--attempts", type=int, default=500)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    seed(args.courses, args.users, args.attempts)
+
+    api = settings.API_V1_STR
+    endpoints = {
+        "/courses/me": f"{api}/courses/me",
+        "read_courses": f"{api}/courses/?limit=100",
+        "users.get_users": f"{api}/users/?limit=100",
+        "quizzes/attempts/all": f"{api}/quizzes/attempts/all?limit=100",
+    }
+    async with asgi_client(app) as client:
+        auth = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        print(f"{'endpoint':<24}{'encoding':>10}{'bytes':>10}{'saved':>8}{'CPU ms':>9}{'encode ms':>11}")
+        for name, url in endpoints.items():
+            body = (await client.get(url, headers={**auth, "Accept-Encoding": "identity"})).content  # also warms up
+            for encoding in ENCODINGS:
+                size, cpu = await fetch(client, url, {**auth, "Accept-Encoding": encoding}, args.requests)
+                encode = encode_seconds(encoding, body) if encoding in ENCODERS else 0.0
+                print(
+                    f"{name:<24}{encoding:>10}{size:>10}{1 - size / len(body):>8.1%}"
+                    f"{cpu * 1000:>9.2f}{encode * 1000:>11.2f}"
+                )
+
+if __name__ == "__main__":
+    asyncio.run(main())
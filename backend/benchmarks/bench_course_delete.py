@@ -0,0 +1,85 @@
+"""Time to delete a course with a long quiz attempt history.
+
+Seeds courses with a quiz and growing numbers of attempts, up to --attempts,
+then deletes each through DELETE /courses/{id}:
+
+    python -m benchmarks.bench_course_delete --attempts 100000
+
+The time should grow with the attempt count but stay a handful of statements;
+?background=true moves it after a 202 response.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlmodel import Session, func, select
+
+from app import crud
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import CourseCreate, QuizAttempt, QuizCreate
+from benchmarks.common import asgi_client, base_parser, login
+
+BATCH = 50_000
+
+
+def seed_course(attempts: int) -> uuid.UUID:
+    with Session(engine) as session:
+        admin = crud.get_user_by_email(session, settings.FIRST_SUPERUSER)
+        assert admin, "run init_db first"
+        course = crud.create_course(session, CourseCreate(title="deletion benchmark"))
+        quiz = crud.create_quiz(session, QuizCreate(course_id=course.id))
+        started = datetime.now(timezone.utc)
+        for offset in range(0, attempts, BATCH):
+            session.execute(insert(QuizAttempt), [
+                {
+                    "id": uuid.uuid4(),
+                    "quiz_id": quiz.id,
+                    "user_id": admin.id,
+                    "score": i % 101,
+                    "attempt_number": i + 1,
+                    "passed": i % 101 >= 70,
+                    "created_at": started + timedelta(milliseconds=i),
+                    "updated_at": started,
+                }
+                for i in range(offset, min(offset + BATCH, attempts))
+            ])
+            session.commit()
+        return course.id
+
+
+def attempt_count() -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(QuizAttempt)).one()
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.add_argument("--attempts", type=int, default=100_000)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    sizes = sorted({max(1, args.attempts // 10), args.attempts // 2, args.attempts})
+    courses = {size: seed_course(size) for size in sizes}
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        print(f"{'attempts':>10}{'seconds':>10}{'attempts/s':>12}{'removed':>10}")
+        for size, course_id in courses.items():
+            before = attempt_count()
+            started = time.perf_counter()
+            r = await client.delete(f"{settings.API_V1_STR}/courses/{course_id}", headers=headers)
+            elapsed = time.perf_counter() - started
+            r.raise_for_status()
+            print(f"{size:>10}{elapsed:>10.3f}{size / elapsed:>12.0f}{before - attempt_count():>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
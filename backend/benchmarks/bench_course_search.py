@@ -0,0 +1,96 @@
+"""Latency of /courses/search on a large catalog.
+
+Seeds --courses courses with titles and descriptions drawn from a small
+vocabulary, so each of its words matches about half the catalog: the worst
+case for ranking. One course in a hundred also gets a rare word. Then searches
+for rare, common and prefix terms:
+
+    python -m benchmarks.bench_course_search --courses 20000
+"""
+import asyncio
+import random
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import Course
+from benchmarks.common import asgi_client, base_parser, login, print_results, run_load
+
+VOCABULARY = (
+    "infection control hygiene safety fire evacuation patient handling first aid resuscitation "
+    "medication administration documentation privacy data protection nutrition allergy wound care "
+    "sterilisation laboratory radiology emergency triage pain management palliative ethics "
+    "communication teamwork leadership quality audit risk incident reporting manual lifting "
+    "diabetes cardiology oncology paediatrics geriatrics mental health dementia stroke"
+).split()
+QUERIES = {
+    "rare word": "phlebotomy",
+    "common word": "care",
+    "two words": "wound care",
+    "prefix": "steril",
+    "no match": "astronomy",
+}
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def seed_courses(count: int) -> None:
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "title": sentence(rng, 4).capitalize() + (" phlebotomy" if i % 100 == 0 else ""),
+            "description": sentence(rng, 30),
+            "materials": [],
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+    with Session(engine) as session:
+        session.execute(insert(Course), rows)
+        session.commit()
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.set_defaults(concurrency=1, requests=400)
+    parser.add_argument("--courses", type=int, default=20_000)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    seed_courses(args.courses)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        results = []
+        for name, q in QUERIES.items():
+            url = f"{settings.API_V1_STR}/courses/search?q={q}"
+            (await client.get(url, headers=headers)).raise_for_status()
+            results.append(
+                await run_load(
+                    client, f"{name} ({q})", "GET", url,
+                    concurrency=args.concurrency,
+                    total=args.requests,
+                    timeout=args.timeout,
+                    headers=headers,
+                )
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Payload size and latency of view=summary vs view=detailed on a large course.
+
+Seeds one course with --users enrolled learners (the superuser included, so it
+shows up in their /courses/me) and compares both views of /courses/me and
+/courses/{id}:
+
+    python -m benchmarks.bench_course_views --users 5000
+"""
+import asyncio
+import uuid
+
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app import crud
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.security import get_password_hash
+from app.models import CourseCreate, CourseUserLink, User
+from benchmarks.common import asgi_client, base_parser, login, print_results, run_load
+
+
+def seed_course(users: int) -> uuid.UUID:
+    with Session(engine) as session:
+        admin = crud.get_user_by_email(session, settings.FIRST_SUPERUSER)
+        assert admin, "run init_db first"
+        course = crud.create_course(
+            session, CourseCreate(title=f"mandatory training ({users} users)", description="benchmark")
+        )
+        # one hash for everybody, hashing 5000 passwords would dominate the setup
+        hashed = get_password_hash(uuid.uuid4().hex)
+        tag = uuid.uuid4().hex[:8]
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": f"BENCH-{tag}-{i}",
+                "name": f"Learner {i}",
+                "email": f"learner{i}.{tag}@bench.example.com",
+                "hashed_password": hashed,
+                "is_active": True,
+                "is_superuser": False,
+            }
+            for i in range(users)
+        ]
+        session.execute(insert(User), rows)
+        links = [{"course_id": course.id, "user_id": row["id"]} for row in rows]
+        links.append({"course_id": course.id, "user_id": admin.id})
+        session.execute(insert(CourseUserLink), links)
+        session.commit()
+        return course.id
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.set_defaults(concurrency=4, requests=20)
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    course_id = seed_course(args.users)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        results, sizes = [], []
+        for path in ("/courses/me", f"/courses/{course_id}"):
+            for view in ("detailed", "summary"):
+                url = f"{settings.API_V1_STR}{path}?view={view}"
+                r = await client.get(url, headers=headers)
+                r.raise_for_status()
+                name = f"{view:<9}{'/courses/me' if path.endswith('me') else '/courses/{id}'}"
+                sizes.append((name, len(r.content)))
+                results.append(
+                    await run_load(
+                        client, name, "GET", url,
+                        concurrency=args.concurrency,
+                        total=args.requests,
+                        timeout=args.timeout,
+                        headers=headers,
+                    )
+                )
+    print_results(results)
+    print()
+    print(f"{'scenario':<36}{'bytes':>12}")
+    for name, size in sizes:
+        print(f"{name:<36}{size:>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
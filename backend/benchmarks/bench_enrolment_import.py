@@ -0,0 +1,105 @@
+"""Time and peak Python memory of a CSV enrolment import, at growing file sizes.
+
+Seeds --rows users with employee ids, then imports CSVs keyed by employee id
+(every tenth row by email, every hundredth unknown) into a fresh course:
+
+    python -m benchmarks.bench_enrolment_import --rows 50000
+
+Peak memory is what tracemalloc saw during the request; it should not grow
+with the file size.
+"""
+import asyncio
+import csv
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app import crud
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.security import get_password_hash
+from app.models import CourseCreate, User
+from benchmarks.common import asgi_client, base_parser, login
+
+
+def seed_users(count: int) -> list[tuple[str, str]]:
+    """(employee id, email) of `count` new users."""
+    tag = uuid.uuid4().hex[:8]
+    hashed = get_password_hash(uuid.uuid4().hex)
+    people = [(f"E{tag}{i}", f"employee{i}.{tag}@bench.example.com") for i in range(count)]
+    with Session(engine) as session:
+        session.execute(insert(User), [
+            {
+                "id": uuid.uuid4(),
+                "user_id": employee_id,
+                "name": f"Employee {i}",
+                "email": email,
+                "hashed_password": hashed,
+                "is_active": True,
+                "is_superuser": False,
+            }
+            for i, (employee_id, email) in enumerate(people)
+        ])
+        session.commit()
+    return people
+
+
+def write_csv(path: str, people: list[tuple[str, str]]) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "email", "name"])
+        for i, (employee_id, email) in enumerate(people):
+            if i % 100 == 99:
+                writer.writerow(["UNKNOWN", "", "nobody"])
+            elif i % 10 == 9:
+                writer.writerow(["", email, f"Employee {i}"])
+            else:
+                writer.writerow([employee_id, "", f"Employee {i}"])
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    people = seed_users(args.rows)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        print(f"{'rows':>8}{'seconds':>10}{'rows/s':>10}{'peak MiB':>10}{'assigned':>10}{'rejected':>10}")
+        for size in sorted({max(1, args.rows // 10), args.rows // 2, args.rows}):
+            with Session(engine) as session:
+                course = crud.create_course(session, CourseCreate(title=f"import benchmark ({size} rows)"))
+            with tempfile.NamedTemporaryFile(suffix=".csv") as upload:
+                write_csv(upload.name, people[:size])
+                tracemalloc.start()
+                started = time.perf_counter()
+                with open(upload.name, "rb") as f:
+                    r = await client.post(
+                        f"{settings.API_V1_STR}/courses/{course.id}/enrolments/import",
+                        headers=headers,
+                        files={"file": ("hr.csv", f, "text/csv")},
+                    )
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            r.raise_for_status()
+            report = r.json()
+            print(
+                f"{size:>8}{elapsed:>10.2f}{size / elapsed:>10.0f}{peak / 2**20:>10.1f}"
+                f"{report['assigned']:>10}{report['rejected']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+"""Offset vs cursor pagination deep into a large quiz_attempt table.
+
+Seeds --attempts quiz attempts by the superuser on one quiz, and --attempts on
+another, ATTEMPTS_PER_LEARNER per learner with rising scores. Then fetches page
+1 and page --page of /quizzes/{id}/attempts (the superuser's) and of
+/quizzes/attempts/all (each user's best and latest attempt) with skip/limit and
+with a cursor:
+
+    python -m benchmarks.bench_keyset_pagination --attempts 1000000 --page 1000
+
+Offset latency grows with the page number, the cursor stays flat.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI
+from sqlalchemy import insert
+from sqlmodel import Session, func, select
+
+from app import crud
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.security import get_password_hash
+from app.models import CourseCreate, QuizAttempt, QuizCreate, User
+from benchmarks.common import asgi_client, base_parser, login, print_results, run_load
+
+BATCH = 50_000
+ATTEMPTS_PER_LEARNER = 3
+
+
+def seed_attempts(attempts: int) -> uuid.UUID:
+    with Session(engine) as session:
+        admin = crud.get_user_by_email(session, settings.FIRST_SUPERUSER)
+        assert admin, "run init_db first"
+        course = crud.create_course(session, CourseCreate(title="pagination benchmark"))
+        quiz = crud.create_quiz(session, QuizCreate(course_id=course.id))
+        started = datetime.now(timezone.utc)
+        for offset in range(0, attempts, BATCH):
+            rows = [
+                {
+                    "id": uuid.uuid4(),
+                    "quiz_id": quiz.id,
+                    "user_id": admin.id,
+                    "score": i % 101,
+                    "attempt_number": i + 1,
+                    "passed": i % 101 >= 70,
+                    "created_at": started + timedelta(milliseconds=i),
+                    "updated_at": started,
+                }
+                for i in range(offset, min(offset + BATCH, attempts))
+            ]
+            session.execute(insert(QuizAttempt), rows)
+            session.commit()
+        return quiz.id
+
+
+def seed_learner_attempts(attempts: int) -> None:
+    with Session(engine) as session:
+        course = crud.create_course(session, CourseCreate(title="pagination benchmark, learners"))
+        quiz = crud.create_quiz(session, QuizCreate(course_id=course.id))
+        # one hash for everybody, hashing thousands of passwords would dominate the setup
+        hashed = get_password_hash(uuid.uuid4().hex)
+        tag = uuid.uuid4().hex[:8]
+        learners = [uuid.uuid4() for _ in range(-(-attempts // ATTEMPTS_PER_LEARNER))]
+        for offset in range(0, len(learners), BATCH):
+            session.execute(insert(User), [
+                {
+                    "id": learner,
+                    "user_id": f"PAGE-{tag}-{offset + i}",
+                    "name": f"Learner {offset + i}",
+                    "email": f"learner{offset + i}.{tag}@bench.example.com",
+                    "hashed_password": hashed,
+                    "is_active": True,
+                    "is_superuser": False,
+                }
+                for i, learner in enumerate(learners[offset : offset + BATCH])
+            ])
+        # after the superuser's, which run ahead of the clock, so these come first newest-first
+        started = session.exec(select(func.max(QuizAttempt.created_at))).one() + timedelta(milliseconds=1)
+        for offset in range(0, attempts, BATCH):
+            rows = [
+                {
+                    "id": uuid.uuid4(),
+                    "quiz_id": quiz.id,
+                    "user_id": learners[i // ATTEMPTS_PER_LEARNER],
+                    # rising, so each learner's last attempt is their best and /attempts/all lists it
+                    "score": 40 + 20 * (i % ATTEMPTS_PER_LEARNER),
+                    "attempt_number": i % ATTEMPTS_PER_LEARNER + 1,
+                    "passed": 40 + 20 * (i % ATTEMPTS_PER_LEARNER) >= 70,
+                    "created_at": started + timedelta(milliseconds=i),
+                    "updated_at": started,
+                }
+                for i in range(offset, min(offset + BATCH, attempts))
+            ]
+            session.execute(insert(QuizAttempt), rows)
+            session.commit()
+
+
+def cursor_at(quiz_id: uuid.UUID, position: int) -> str:
+    """Cursor of the row right before `position`, as if the pages were walked."""
+    with Session(engine) as session:
+        stmt = crud.paginate(
+            select(QuizAttempt).where(QuizAttempt.quiz_id == quiz_id), QuizAttempt, position - 1, 1, None
+        )
+        row = session.exec(stmt).one()
+        return crud.encode_cursor(row.created_at, row.id)
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.set_defaults(concurrency=1, requests=20)
+    parser.add_argument("--attempts", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    quiz_id = seed_attempts(args.attempts)
+    seed_learner_attempts(args.attempts)
+    skip = (args.page - 1) * args.limit
+    deep_cursor = cursor_at(quiz_id, skip)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    base = f"{settings.API_V1_STR}/quizzes/{quiz_id}/attempts?limit={args.limit}"
+    every = f"{settings.API_V1_STR}/quizzes/attempts/all?limit={args.limit}"
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        # the cursor a client walking /attempts/all holds before page --page
+        r = await client.get(f"{every}&skip={skip - args.limit}", headers=headers)
+        r.raise_for_status()
+        every_cursor = r.headers["X-Next-Cursor"]
+        scenarios = [
+            ("offset  page 1", base),
+            (f"offset  page {args.page}", f"{base}&skip={skip}"),
+            ("cursor  page 1", base),
+            (f"cursor  page {args.page}", f"{base}&cursor={deep_cursor}"),
+            ("all offset  page 1", every),
+            (f"all offset  page {args.page}", f"{every}&skip={skip}"),
+            ("all cursor  page 1", every),
+            (f"all cursor  page {args.page}", f"{every}&cursor={every_cursor}"),
+        ]
+        results = []
+        for name, url in scenarios:
+            r = await client.get(url, headers=headers)
+            r.raise_for_status()
+            assert len(r.json()) == args.limit, name
+            results.append(
+                await run_load(
+                    client, name, "GET", url,
+                    concurrency=args.concurrency,
+                    total=args.requests,
+                    timeout=args.timeout,
+                    headers=headers,
+                )
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""Shift-change login storm: many concurrent password logins.
+
+Password verification runs in the hasher process pool (PASSWORD_HASH_WORKERS),
+so throughput should scale with the worker count until the CPU runs out.
+Logins rejected with 503 (PASSWORD_HASH_MAX_PENDING exceeded) count as errors.
+
+    PASSWORD_HASH_WORKERS=4 python -m benchmarks.bench_login_storm --concurrency 300 --requests 600
+"""
+import asyncio
+import os
+
+from fastapi import FastAPI
+
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.security import password_hasher
+from benchmarks.common import asgi_client, base_parser, print_results, run_load
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+
+    async with asgi_client(app) as client:
+        result = await run_load(
+            client,
+            f"login x{args.concurrency}",
+            "POST",
+            f"{settings.API_V1_STR}/login/access-token",
+            concurrency=args.concurrency,
+            total=args.requests,
+            timeout=args.timeout,
+            data={
+                "username": settings.FIRST_SUPERUSER,
+                "password": settings.FIRST_SUPERUSER_PASSWORD,
+            },
+        )
+    password_hasher.shutdown()
+
+    print_results([result])
+    cores = max(1, min(password_hasher.workers, os.cpu_count() or 1))
+    print(f"hasher workers: {password_hasher.workers}, cores used: {cores}")
+    print(f"logins/sec/core: {len(result.latencies) / result.seconds / cores:.1f}")
+    print(f"rejected with 503: {password_hasher.rejected}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
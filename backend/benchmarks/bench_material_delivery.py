@@ -0,0 +1,106 @@
+"""Video seek latency and CPU per GB served by GET /courses/materials/{filename}.
+
+Uploads one --size MiB video, then compares the download route with a plain
+Starlette FileResponse of the same file (what the route returned before it
+supported Range):
+
+    python -m benchmarks.bench_material_delivery --size 64 --seeks 200
+
+A seek is a Range request for --window KiB at a random offset, as a video
+element makes; without Range support a player has to fetch the whole body
+instead. CPU is process time per GB of full downloads, the in-process client
+included; it also holds each response in memory, so keep --size modest.
+"""
+import asyncio
+import os
+import random
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlmodel import Session
+from starlette.responses import FileResponse
+
+from app import crud
+from app.api.main import api_router
+from app.core import uploads
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import CourseCreate
+from benchmarks.common import LoadResult, asgi_client, base_parser, login
+
+
+async def seek(client: httpx.AsyncClient, url: str, offset: int, window: int, ranged: bool) -> float:
+    """Seconds until `window` bytes from `offset` have arrived."""
+    # bounded, since the in-process transport buffers the whole response
+    headers = {"Range": f"bytes={offset}-{offset + window - 1}"} if ranged else {}
+    started = time.perf_counter()
+    r = await client.get(url, headers=headers)
+    assert r.status_code == (206 if ranged else 200), r.status_code
+    return time.perf_counter() - started
+
+
+async def cpu_per_gb(client: httpx.AsyncClient, url: str, downloads: int, size: int) -> float:
+    started = time.process_time()
+    for _ in range(downloads):
+        (await client.get(url)).raise_for_status()
+    return (time.process_time() - started) / (downloads * size / 1e9)
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.add_argument("--size", type=int, default=64, help="MiB of the uploaded video")
+    parser.add_argument("--seeks", type=int, default=200)
+    parser.add_argument("--window", type=int, default=512, help="KiB read after each seek")
+    parser.add_argument("--downloads", type=int, default=8, help="full downloads for the CPU figure")
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    size = args.size * 2**20
+    video = b"\x00\x00\x00\x18ftypmp42" + os.urandom(size - 12)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+
+    @app.get("/baseline/{filename}")
+    def baseline(filename: str) -> FileResponse:
+        return FileResponse(uploads.material_path(filename), media_type="application/pdf", filename=filename)
+
+    with Session(engine) as session:
+        course = crud.create_course(session, CourseCreate(title="delivery benchmark"))
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        r = await client.post(
+            f"{settings.API_V1_STR}/courses/{course.id}/materials/",
+            headers=headers,
+            files={"files": ("lesson.mp4", video, "video/mp4")},
+        )
+        r.raise_for_status()
+        name = (await client.get(f"{settings.API_V1_STR}/courses/{course.id}/materials/", headers=headers)).json()[0]
+        routes = {
+            "FileResponse": (f"/baseline/{name}", False),
+            "download_material": (f"{settings.API_V1_STR}/courses/materials/{name}", True),
+        }
+        window = args.window * 1024
+        offsets = [random.randrange(size - window) for _ in range(args.seeks)]
+
+        print(f"{'route':<20}{'seeks':>7}{'p50 ms':>10}{'p95 ms':>10}{'CPU s/GB':>10}{'MB/s':>9}")
+        for label, (url, ranged) in routes.items():
+            # without Range every seek is a full download, so sample fewer
+            result = LoadResult(name=label)
+            for offset in offsets if ranged else offsets[: max(1, args.seeks // 10)]:
+                result.latencies.append(await seek(client, url, offset, window, ranged))
+            started = time.perf_counter()
+            cpu = await cpu_per_gb(client, url, args.downloads, size)
+            rate = args.downloads * size / 1e6 / (time.perf_counter() - started)
+            print(
+                f"{label:<20}{len(result.latencies):>7}{result.percentile(50):>10.1f}{result.percentile(95):>10.1f}"
+                f"{cpu:>10.2f}{rate:>9.0f}"
+            )
+        with Session(engine) as session:
+            crud.delete_course(session, course.id)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
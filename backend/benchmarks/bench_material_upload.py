@@ -0,0 +1,66 @@
+"""Material upload throughput at 1, 4 and 16 concurrent uploads.
+
+Each request uploads one --size MiB file to POST /courses/{id}/materials/:
+
+    python -m benchmarks.bench_material_upload --size 32 --requests 32
+
+MB/s counts the payload bytes of successful uploads. Identical uploads share
+one blob; each level's course is deleted again afterwards.
+"""
+import asyncio
+import os
+
+from fastapi import FastAPI
+from sqlmodel import Session
+
+from app import crud
+from app.api.main import api_router
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import CourseCreate
+from benchmarks.common import asgi_client, base_parser, login, run_load
+
+LEVELS = (1, 4, 16)
+
+
+def remove_materials(course_id: object) -> None:
+    with Session(engine) as session:
+        assert crud.delete_course(session, course_id)
+
+
+async def main() -> None:
+    parser = base_parser(__doc__ or "")
+    parser.set_defaults(requests=32, timeout=600.0)
+    parser.add_argument("--size", type=int, default=32, help="MiB per uploaded file")
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+    payload = os.urandom(args.size * 2**20)
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    async with asgi_client(app) as client:
+        headers = await login(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+        print(f"{'concurrency':>12}{'uploads':>9}{'errors':>8}{'MB/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for concurrency in LEVELS:
+            with Session(engine) as session:
+                course = crud.create_course(session, CourseCreate(title=f"upload benchmark x{concurrency}"))
+            result = await run_load(
+                client, f"x{concurrency}", "POST", f"{settings.API_V1_STR}/courses/{course.id}/materials/",
+                concurrency=concurrency,
+                total=args.requests,
+                timeout=args.timeout,
+                headers=headers,
+                files={"files": ("video.mp4", payload, "video/mp4")},
+            )
+            remove_materials(course.id)
+            uploaded = len(result.latencies) * len(payload)
+            print(
+                f"{concurrency:>12}{result.requests:>9}{result.errors:>8}{uploaded / 1e6 / result.seconds:>10.1f}"
+                f"{result.percentile(50):>10.0f}{result.percentile(95):>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
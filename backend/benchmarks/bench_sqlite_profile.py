@@ -0,0 +1,100 @@
+"""SQLite read/write concurrency: library defaults vs the tuned engine profile.
+
+Each profile runs against its own copy of the database (the populated demo
+database by default), with reader threads running the /courses/me query and
+writer threads inserting notifications, i.e. short write transactions similar
+to a quiz submission.
+
+    python -m benchmarks.bench_sqlite_profile --db data/app.db --readers 16 --writers 4
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.db import apply_sqlite_pragmas, engine_options, sqlite_pragmas
+from benchmarks.common import LoadResult, print_results
+
+READ_SQL = text(
+    """
+    SELECT DISTINCT course.* FROM course
+    LEFT OUTER JOIN courseuserlink ON course.id = courseuserlink.course_id
+    LEFT OUTER JOIN courserolelink ON course.id = courserolelink.course_id
+    WHERE courseuserlink.user_id = :user_id OR courserolelink.role_id = :role_id
+    """
+)
+WRITE_SQL = text(
+    "INSERT INTO notification (id, user_id, message, is_read, created_at) "
+    "VALUES (:id, :user_id, 'benchmark', 0, :created_at)"
+)
+
+# What a plain create_engine() gets: rollback journal, FULL sync (pysqlite already waits 5s on locks)
+DEFAULT_PROFILE: dict[str, Any] = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def run_profile(db_path: Path, pragmas: dict[str, Any], readers: int, writers: int, seconds: float) -> list[LoadResult]:
+    options = engine_options() | {"echo": False}
+    bench_engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False}, **options)
+    apply_sqlite_pragmas(bench_engine, pragmas)
+    with bench_engine.connect() as conn:
+        user_id, role_id = conn.execute(text("SELECT id, role_id FROM user LIMIT 1")).one()
+
+    label = pragmas.get("journal_mode", "?").lower()
+    reads, writes = LoadResult(f"{label}: reads"), LoadResult(f"{label}: writes")
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+
+    def loop(result: LoadResult, write: bool) -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with bench_engine.begin() as conn:
+                    if write:
+                        conn.execute(WRITE_SQL, {"id": uuid.uuid4().hex, "user_id": user_id, "created_at": datetime.now(timezone.utc)})
+                    else:
+                        conn.execute(READ_SQL, {"user_id": user_id, "role_id": role_id}).all()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    result.latencies.append(elapsed)
+            except OperationalError:  # "database is locked"
+                with lock:
+                    result.errors += 1
+
+    threads = [threading.Thread(target=loop, args=(reads, False)) for _ in range(readers)]
+    threads += [threading.Thread(target=loop, args=(writes, True)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    reads.seconds = writes.seconds = seconds
+    bench_engine.dispose()
+    return [reads, writes]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", type=Path, default=Path("data/app.db"))
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    results: list[LoadResult] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, pragmas in (("default", DEFAULT_PROFILE), ("tuned", sqlite_pragmas())):
+            copy = Path(tmp) / f"{name}.db"
+            shutil.copy(args.db, copy)
+            results += run_profile(copy, pragmas, args.readers, args.writers, args.seconds)
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Shared helpers for the benchmarks in this folder.
+
+Every benchmark is a plain script, run from ./backend so the `app` package and
+the .env file resolve, e.g.::
+
+    python -m benchmarks.bench_async_sessions --concurrency 200
+
+Point SQLALCHEMY_DATABASE_URI at a copy of the database you want to measure,
+some benchmarks seed extra rows.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+from fastapi import FastAPI
+
+from app.core.config import settings
+
+# app.utils configures INFO logging globally; one httpx line per request drowns the report
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@dataclass
+class LoadResult:
+    name: str
+    seconds: float = 0.0
+    errors: int = 0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + self.errors
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Latency percentile in milliseconds (nearest-rank)."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[rank] * 1000
+
+
+def asgi_client(app: FastAPI) -> httpx.AsyncClient:
+    """In-process client: no sockets, so the numbers isolate the server side.
+
+    Unhandled server errors (e.g. pool timeouts) are counted as 500s, not raised.
+    """
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+        base_url="http://bench",
+        timeout=None,
+    )
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> dict[str, str]:
+    r = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    name: str,
+    method: str,
+    url: str,
+    *,
+    concurrency: int,
+    total: int,
+    timeout: float = 30.0,
+    **request_kwargs: Any,
+) -> LoadResult:
+    """Fire `total` requests through `concurrency` concurrent clients.
+
+    Requests slower than `timeout` seconds are abandoned and counted as errors,
+    so a starved threadpool shows up in the report instead of hanging the run.
+    """
+    result = LoadResult(name=name)
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                r = await asyncio.wait_for(
+                    client.request(method, url, **request_kwargs), timeout
+                )
+                ok = r.status_code < 400
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def print_results(results: list[LoadResult]) -> None:
+    print(f"{'scenario':<36}{'reqs':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(
+            f"{r.name:<36}{r.requests:>8}{r.errors:>8}{r.rps:>10.1f}"
+            f"{r.percentile(50):>10.1f}{r.percentile(95):>10.1f}{r.percentile(99):>10.1f}"
+        )
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (s)")
+    return parser